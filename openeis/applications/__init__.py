@@ -169,16 +169,21 @@ class DrivenApplicationBaseClass(DriverApplicationBaseClass, metaclass=ABCMeta):
         DatabaseInput.merge call used to preprocess incoming data."""
         return False
 
+    def merge_in_database(self):
+        """Specifies whether driven application data is merged by the
+        database, in a single query, rather than by reading each input
+        separately. Inputs with repeated timestamps are merged
+        separately regardless."""
+        return True
+
 
     def execute(self):
         '''Iterate over input calling run each time'''
-        query_list = []
         topic_map = self.inp.get_topics()
 
-        for input_name in topic_map:
-            query_list.append(self.inp.get_query_sets(input_name, wrap_for_merge=True))
-
-        merged_input_gen = self.inp.merge(*query_list, drop_partial_lines=self.drop_partial_lines())
+        merged_input_gen = self.inp.merge_groups(
+                *topic_map, drop_partial_lines=self.drop_partial_lines(),
+                in_database=self.merge_in_database())
 
         time_stamp = datetime.min
 
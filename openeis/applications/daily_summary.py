@@ -96,10 +96,11 @@ and includes the following modification: Paragraph 3. has been added.
 from openeis.applications import DriverApplicationBaseClass, InputDescriptor, \
     OutputDescriptor, ConfigDescriptor, Descriptor
 from openeis.applications import reports
+import datetime
 import logging
 import numpy
-import math
 from django.db.models import Max, Min, Avg
+from django.utils import timezone
 from dateutil.relativedelta import relativedelta
 from openeis.applications.utils import conversion_utils as cu
 
@@ -221,12 +222,17 @@ class Application(DriverApplicationBaseClass):
         self.out.log("Starting application: daily summary.", logging.INFO)
 
         self.out.log("Querying database.", logging.INFO)
-        peakLoad = self.inp.get_query_sets('load', group_by='all',
-                                           group_by_aggregation=Max)[0]
         load_query = self.inp.get_query_sets('load', exclude={'value':None})[0]
-
-        load_startDay = load_query.earliest()[0].date()
-        load_endDay = load_query.latest()[0].date()
+        load_stats = self.inp.get_statistics('load')[0]
+        if load_stats is not None and load_stats.count:
+            peakLoad = load_stats.max
+            load_startDay = load_stats.first.date()
+            load_endDay = load_stats.last.date()
+        else:
+            peakLoad = self.inp.get_query_sets('load', group_by='all',
+                                               group_by_aggregation=Max)[0]
+            load_startDay = load_query.earliest()[0].date()
+            load_endDay = load_query.latest()[0].date()
         current_Day = load_startDay
         load_day_list_95 = []
         load_day_list_5 = []
@@ -247,13 +253,22 @@ class Application(DriverApplicationBaseClass):
         peakLoadIntensity = peakLoad / floorAreaSqft
 
         self.out.log("Calculating daily top and bottom percentile.", logging.INFO)
+        # Days are bounded by midnight in the current time zone, as for
+        # the time__day lookups of the queries.
+        load_series = self.inp.get_arrays('load', exclude={'value':None})[0]
+        local_tz = timezone.get_current_timezone()
+        def day_index(day):
+            midnight = timezone.make_aware(
+                datetime.datetime.combine(day, datetime.time()), local_tz)
+            midnight = midnight.astimezone(timezone.utc).replace(tzinfo=None)
+            return numpy.searchsorted(load_series.times,
+                                      numpy.datetime64(midnight))
         while current_Day <= load_endDay:
-            load_day_query = load_query.filter(time__year=current_Day.year,
-                                            time__month=current_Day.month,
-                                            time__day=current_Day.day)
-            current_Day += relativedelta(days=1)
+            next_Day = current_Day + relativedelta(days=1)
+            load_day_values = load_series.values[
+                day_index(current_Day):day_index(next_Day)]
+            current_Day = next_Day
 
-            load_day_values = [x[1] for x in load_day_query]
             if (len(load_day_values) < 5):
                 continue
 
@@ -273,20 +288,22 @@ class Application(DriverApplicationBaseClass):
         # every day and less than two days of data.
         hourly_variability = []
 
+        # Hours are in the current time zone, as for time__hour lookups,
+        # found once for each distinct UTC hour of the load series.
+        utc_hours, hour_index = numpy.unique(
+            load_series.times.astype('datetime64[h]'), return_inverse=True)
+        local_hours = numpy.array(
+            [hour.replace(tzinfo=timezone.utc).astimezone(local_tz).hour
+             for hour in utc_hours.astype(datetime.datetime).tolist()],
+            int)[hour_index]
+
         for h in range(24):
-            hourly_mean = self.inp.get_query_sets('load', group_by='all',
-                                                  group_by_aggregation=Avg,
-                                                  filter_={'time__hour':h})[0]
-            hour_load_query = self.inp.get_query_sets('load',
-                                                     filter_={'time__hour':h},
-                                                     exclude={'value':None})[0]
-            counts = hour_load_query.count()
+            hour_load_values = load_series.values[local_hours == h]
+            counts = len(hour_load_values)
             if (counts < 2):
                 raise Exception("Must have more than 1 day of data!")
-            rootmeansq = math.sqrt(
-                sum((x[1] - hourly_mean) ** 2 for x in hour_load_query)
-                / (counts - 1)
-                )
+            hourly_mean = numpy.mean(hour_load_values)
+            rootmeansq = numpy.std(hour_load_values, ddof=1)
             hourly_variability.append(rootmeansq / hourly_mean)
 
         load_variability = numpy.mean(hourly_variability)
@@ -4,6 +4,7 @@ import os.path
 import pytest
 
 from openeis.projects import (models, views)
+from openeis.projects.storage.bulkload import BulkLoader
 
 @pytest.fixture
 def admin_user():
@@ -76,21 +77,11 @@ def create_dataset(name, project, datamap, files):
     for name, file in files.items():
         models.SensorIngestFile.objects.create(
                 ingest=dataset, name=name, file=file)
-    keyfunc = lambda obj: obj.__class__.__name__
-    it = views.iter_ingest(dataset)
-    while True:
-        batch = []
-        for objects, *args in it:
-            batch.extend(objects)
-            if len(batch) >= 1000:
-                break
-        if not batch:
-            break
-        batch.sort(key=keyfunc)
-        for class_name, group in itertools.groupby(batch, keyfunc):
-            objects = list(group)
-            cls = objects[0].__class__
-            cls.objects.bulk_create(objects)
+    loader = BulkLoader(dataset)
+    for _ in views.iter_ingest(dataset, loader):
+        if len(loader) >= 1000:
+            loader.flush()
+    loader.flush()
     return dataset
 
 
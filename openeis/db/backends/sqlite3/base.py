@@ -1,6 +1,10 @@
+import re
 
+from django.core.exceptions import ImproperlyConfigured
 from django.db.backends.sqlite3.base import *
 
+_PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
 class DatabaseOperations(DatabaseOperations):
     compiler_module = __package__ + '.compiler'
 
@@ -8,3 +12,39 @@ class DatabaseWrapper(DatabaseWrapper):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.ops = DatabaseOperations(self)
+
+    def get_pragmas(self):
+        '''Return the PRAGMA settings to run on new connections.
+
+        Settings come from OPENEIS_PROJECTS['SQLITE_PRAGMAS'] and are
+        updated from the PRAGMAS entry of the database OPTIONS.
+        '''
+        from openeis.projects.conf import settings as proj_settings
+        pragmas = dict(proj_settings.SQLITE_PRAGMAS)
+        pragmas.update(self.settings_dict['OPTIONS'].get('PRAGMAS', {}))
+        for name, value in pragmas.items():
+            if not name.isidentifier() or not _PRAGMA_VALUE.match(str(value)):
+                raise ImproperlyConfigured(
+                    'invalid SQLite pragma: {}={!r}'.format(name, value))
+        return pragmas
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('PRAGMAS', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.get_pragmas().items():
+            conn.execute('PRAGMA {} = {}'.format(name, value))
+        return conn
+
+    def read_pragmas(self):
+        '''Return the current values of the configured pragmas.'''
+        self.ensure_connection()
+        pragmas = {}
+        for name in self.get_pragmas():
+            # Setting-only pragmas, such as an unknown name, return no row.
+            row = self.connection.execute('PRAGMA {}'.format(name)).fetchone()
+            pragmas[name] = row[0] if row else None
+        return pragmas
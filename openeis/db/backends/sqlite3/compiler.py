@@ -1,6 +1,17 @@
 
+import datetime
+
+from django.conf import settings
 from django.db.models.sql import compiler
-from django.db.models.fields import FieldDoesNotExist
+from django.db.models.fields import DateTimeField, FieldDoesNotExist
+from django.utils.timezone import utc
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def from_epoch(seconds):
+    '''Convert integer seconds since the epoch to a datetime.'''
+    value = EPOCH + datetime.timedelta(seconds=seconds)
+    return value.replace(tzinfo=utc) if settings.USE_TZ else value
 
 class SQLCompiler(compiler.SQLCompiler):
     def resolve_columns(self, row, fields=()):
@@ -11,7 +22,12 @@ class SQLCompiler(compiler.SQLCompiler):
                     field = self.query.model._meta.get_field_by_name(name)[0]
                 except FieldDoesNotExist:
                     continue
-                row[i] = field.to_python(row[i])
+                value = row[i]
+                # Truncated times are selected as seconds since the epoch.
+                if isinstance(value, int) and isinstance(field, DateTimeField):
+                    row[i] = from_epoch(value)
+                else:
+                    row[i] = field.to_python(value)
         return row
 
 class SQLInsertCompiler(compiler.SQLInsertCompiler, SQLCompiler):
@@ -55,6 +55,8 @@
 
 import datetime
 from openeis.projects import models
+from openeis.projects.conf import settings as proj_settings
+from openeis.projects.storage.bulkload import BulkLoader
 from openeis.filters import column_modifiers
 from pytz import timezone
 
@@ -67,7 +69,9 @@ def apply_filter_config(dataset_id,config):
 
     sensors = list(datamap.sensors.all())
     sensor_names = [s.name for s in sensors]
-    sensordata = [sensor.data.filter(ingest=sensoringest) for sensor in sensors]
+    sensordata = [sensor.data.filter(ingest=sensoringest).order_by('time')
+                  .timeseries(batch_size=proj_settings.TIMESERIES_BATCH_SIZE)
+                  for sensor in sensors]
     generators = {}
     for name, qs in zip(sensor_names, sensordata):
         #TODO: Add data type from schema
@@ -91,22 +95,18 @@ def apply_filter_config(dataset_id,config):
 
 
 
+    loader = BulkLoader(sensoringest)
     for sensor in sensors:
         sensor.id= None
         sensor.map = datamap
         sensor.save()
-        data_class = sensor.data_class
         generator = generators[sensor.name]['gen']
-        sensor_data_list = []
         for time,value in generator:
-            sensor_data = data_class(sensor=sensor, ingest=sensoringest,
-                                     time=time, value=value)
-            sensor_data_list.append(sensor_data)
-            if len(sensor_data_list) >= 1000:
-                data_class.objects.bulk_create(sensor_data_list)
-                sensor_data_list = []
-        if sensor_data_list:
-            data_class.objects.bulk_create(sensor_data_list)
+            loader.append(sensor, time, value)
+            if len(loader) >= 1000:
+                loader.flush()
+    loader.flush()
+    sensoringest.update_statistics()
 
     return datamap.id
 
@@ -116,9 +116,9 @@ def _iter_data(sensordata, tz_str):
     else:
         tz = timezone(tz_str)
 
-    for data in sensordata:
-        if data.value is not None:
-            yield data.time.astimezone(tz), data.value
+    for time, value in sensordata:
+        if value is not None:
+            yield time.astimezone(tz), value
 
 def _create_and_update_filters(generators, configs):
     errors = []
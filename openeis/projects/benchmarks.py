@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Benchmarks for the data ingestion and retrieval paths.
+
+Benchmarks are registered using the register() decorator and run using
+the benchmark management command. Each benchmark is a function taking
+the rows and columns options and returning a Result which reports the
+throughput in items per second along with the target throughput, if
+any, for that code path.
+'''
+
+from collections import namedtuple, OrderedDict
+import contextlib
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+
+class Result(namedtuple('Result', 'name count seconds unit target')):
+    @property
+    def rate(self):
+        return self.count / self.seconds if self.seconds else float('inf')
+
+    @property
+    def passed(self):
+        return self.target is None or self.rate >= self.target
+
+    def __str__(self):
+        text = '{0.name}: {0.count} {0.unit} in {0.seconds:.3f}s ' \
+               '({0.rate:.0f} {0.unit}/s)'.format(self)
+        if self.target is not None:
+            text += ' target {:.0f} {}/s: {}'.format(
+                self.target, self.unit, 'PASS' if self.passed else 'FAIL')
+        return text
+
+
+_benchmarks = OrderedDict()
+
+
+def register(name):
+    '''Decorator to register a benchmark function under name.'''
+    def decorator(func):
+        _benchmarks[name] = func
+        return func
+    return decorator
+
+
+def get_benchmarks():
+    return _benchmarks.copy()
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def rollback():
+    '''Run the body in a transaction which is always rolled back.'''
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback()
+    except _Rollback:
+        pass
+
+
+@contextlib.contextmanager
+def synthetic_csv(rows, columns, interval=60, fmt='%Y-%m-%d %H:%M:%S'):
+    '''Write a temporary CSV file of random float data.
+
+    The file has a timestamp column followed by columns named Point1,
+    Point2, etc. The path of the file is returned by the context manager
+    and the file is removed on exit.
+    '''
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    rand = random.Random(0)
+    start = datetime.datetime(2014, 1, 1)
+    step = datetime.timedelta(seconds=interval)
+    try:
+        with open(fd, 'w') as file:
+            file.write(','.join(['Timestamp'] + ['Point{}'.format(i + 1)
+                       for i in range(columns)]) + '\n')
+            for i in range(rows):
+                values = ['{:.2f}'.format(rand.uniform(0, 100))
+                          for _ in range(columns)]
+                file.write(','.join([(start + step * i).strftime(fmt)] +
+                                    values) + '\n')
+        yield path
+    finally:
+        os.unlink(path)
+
+
+def synthetic_datamap(columns, fmt='%Y-%m-%d %H:%M:%S'):
+    '''Return a data map matching a file from synthetic_csv().'''
+    headers = ['Timestamp'] + ['Point{}'.format(i + 1)
+                               for i in range(columns)]
+    return {
+        'version': 1,
+        'files': {
+            '0': {
+                'signature': {'headers': headers},
+                'timestamp': {'columns': [0], 'format': fmt},
+            },
+        },
+        'sensors': dict(('Benchmark/Point{}'.format(i + 1), {
+                'type': 'OutdoorAirTemperature', 'unit': 'fahrenheit',
+                'file': '0', 'column': i + 1}) for i in range(columns)),
+    }
+
+
+@register('ingest')
+def ingest(rows=10000, columns=20):
+    '''Parse a synthetic file and bulk load it into the database.'''
+    from . import models, views
+    from .storage.bulkload import BulkLoader
+
+    with synthetic_csv(rows, columns) as path, rollback():
+        user = User.objects.create(username='__benchmark__')
+        project = models.Project.objects.create(name='Benchmark', owner=user)
+        datamap = models.DataMap.objects.create(
+                project=project, name='Benchmark', map=synthetic_datamap(columns))
+        ingest = models.SensorIngest.objects.create(
+                project=project, name='Benchmark', map=datamap)
+        with open(path, 'rb') as file:
+            files = {'0': {'file': file, 'time_zone': 'UTC', 'time_offset': 0}}
+            loader = BulkLoader(ingest)
+            start = time.time()
+            for _ in views.iter_ingest(ingest, loader, files):
+                if len(loader) >= 50000:
+                    loader.flush()
+            loader.flush()
+            seconds = time.time() - start
+    return Result('ingest', rows * columns, seconds, 'values', 100000)
+
+
+@register('timestamps')
+def timestamps(rows=10000, columns=20):
+    '''Parse timestamps in several formats with DateTimeColumn.'''
+    import pytz
+    from .storage.ingest import DateTimeColumn
+
+    start = datetime.datetime(2014, 1, 1)
+    step = datetime.timedelta(minutes=1)
+    tzinfo = pytz.timezone('America/Los_Angeles')
+    formats = [
+        ('iso', '%Y-%m-%dT%H:%M:%S', ()),
+        ('us', '%m/%d/%Y %H:%M', ()),
+        ('format', '%Y%m%d %H%M%S', ('%Y%m%d %H%M%S',)),
+    ]
+    results = []
+    for name, fmt, given in formats:
+        values = [[(start + step * i).strftime(fmt)] for i in range(rows)]
+        column = DateTimeColumn(0, formats=given, tzinfo=tzinfo)
+        begin = time.time()
+        column.prepare(values[:100])
+        for row in values:
+            column(row)
+        results.append(Result('timestamps[{}]'.format(name), rows,
+                              time.time() - begin, 'rows', 50000))
+    values = [str(int((start + step * i).timestamp())) for i in range(rows)]
+    column = DateTimeColumn(0)
+    begin = time.time()
+    column.prepare([[v] for v in values[:100]])
+    for value in values:
+        column([value])
+    results.append(Result('timestamps[epoch]', rows, time.time() - begin,
+                          'rows', 50000))
+    return results
+
+
+@register('csvreader')
+def csvreader(rows=10000, columns=20):
+    '''Read a synthetic file line by line and in chunks with CSVFile.'''
+    from .storage.csvfile import CSVFile
+
+    results = []
+    with synthetic_csv(rows, columns) as path:
+        size = os.path.getsize(path)
+        for name, chunk_size in [('readline', 0), ('chunked', 1 << 20)]:
+            with open(path, 'rb') as file:
+                begin = time.time()
+                csv_file = CSVFile(file, chunk_size=chunk_size)
+                count = sum(1 for row in csv_file)
+                seconds = time.time() - begin
+            results.append(Result('csvreader[{}]'.format(name), count,
+                                  seconds, 'rows', None))
+            results.append(Result('csvreader[{}]'.format(name), size,
+                                  seconds, 'bytes', None))
+    return results
+
+
+@register('grouping')
+def grouping(rows=10000, columns=20):
+    '''Average synthetic sensor data by hour using timeseries().'''
+    from django.db import connection
+    from django.db.models import Avg
+    from django.utils.timezone import utc
+    from . import models
+    from .storage.bulkload import BulkLoader
+
+    def run(name, queryset):
+        begin = time.time()
+        for sensor in sensors:
+            list(queryset(sensor))
+        return Result('grouping[{}]'.format(name), rows * columns,
+                      time.time() - begin, 'values', None)
+
+    start = datetime.datetime(2014, 1, 1, tzinfo=utc)
+    times = [start + datetime.timedelta(minutes=i) for i in range(rows)]
+    rand = random.Random(0)
+    results = []
+    with rollback():
+        user = User.objects.create(username='__benchmark__')
+        project = models.Project.objects.create(name='Benchmark', owner=user)
+        datamap = models.DataMap.objects.create(
+                project=project, name='Benchmark', map=synthetic_datamap(columns))
+        ingest = models.SensorIngest.objects.create(
+                project=project, name='Benchmark', map=datamap)
+        sensors = [models.Sensor.objects.create(
+                       map=datamap, name=name, data_type=models.Sensor.FLOAT)
+                   for name in datamap.map['sensors']]
+        loader = BulkLoader(ingest)
+        for sensor in sensors:
+            loader.extend(sensor, times,
+                          [rand.uniform(0, 100) for _ in range(rows)])
+            loader.flush()
+        data = lambda sensor: sensor.data.filter(ingest=ingest)
+        results.append(run('rollup', lambda sensor: data(sensor).timeseries(
+                trunc_kind='hour', aggregate=Avg)))
+        models.SensorRollup.objects.filter(ingest=ingest).delete()
+        results.append(run('sql', lambda sensor: data(sensor).timeseries(
+                trunc_kind='hour', aggregate=Avg)))
+        if connection.vendor == 'sqlite':
+            # Truncation by formatting times as strings, as done before
+            # the times were bucketed as integers.
+            select = {'time': "strftime('%%Y-%%m-%%d %%H:00:00Z', time)"}
+            results.append(run('strftime', lambda sensor: data(sensor).extra(
+                    select=select).values('time').annotate(
+                    value=Avg('value')).values_list('time', 'value')))
+    return results
+
+
+@register('merge')
+def merge(rows=10000, columns=20):
+    '''Merge 10, 100 and 500 synthetic series as applications do.'''
+    from .storage.merge import merge, NONE
+
+    start = datetime.datetime(2014, 1, 1)
+    times = [start + datetime.timedelta(minutes=i) for i in range(rows)]
+    rand = random.Random(0)
+    results = []
+    for streams in (10, 100, 500):
+        # Each series misses about one value in ten.
+        args = [{'Point{}'.format(i): [[(time, rand.random())
+                                        for time in times
+                                        if rand.random() >= 0.1]]}
+                for i in range(streams)]
+        for name, as_tuples in [('dict', False), ('tuple', True)]:
+            begin = time.time()
+            count = sum(1 for _ in merge(args, NONE, as_tuples))
+            results.append(Result('merge[{}x{}]'.format(streams, name),
+                                  count * streams, time.time() - begin,
+                                  'values', None))
+    return results
+
+
+@register('arrays')
+def arrays(rows=10000, columns=20):
+    '''Read synthetic sensor data into NumPy arrays.'''
+    import numpy
+    from django.utils.timezone import utc
+    from . import models
+    from .storage.bulkload import BulkLoader
+    from .storage.db_input import DatabaseInput
+
+    start = datetime.datetime(2014, 1, 1, tzinfo=utc)
+    times = [start + datetime.timedelta(minutes=i) for i in range(rows)]
+    rand = random.Random(0)
+    results = []
+    with rollback():
+        user = User.objects.create(username='__benchmark__')
+        project = models.Project.objects.create(name='Benchmark', owner=user)
+        datamap = models.DataMap.objects.create(
+                project=project, name='Benchmark', map=synthetic_datamap(columns))
+        ingest = models.SensorIngest.objects.create(
+                project=project, name='Benchmark', map=datamap)
+        sensors = [models.Sensor.objects.create(
+                       map=datamap, name=name, data_type=models.Sensor.FLOAT)
+                   for name in datamap.map['sensors']]
+        loader = BulkLoader(ingest)
+        for sensor in sensors:
+            loader.extend(sensor, times,
+                          [rand.uniform(0, 100) for _ in range(rows)])
+            loader.flush()
+        inp = DatabaseInput(datamap.pk, {'points': sorted(datamap.map['sensors'])},
+                            dataset_id=ingest.pk)
+        # Lists converted to arrays, as done by the applications
+        begin = time.time()
+        for qs in inp.get_query_sets('points'):
+            pairs = list(qs)
+            numpy.array([t.replace(tzinfo=None) for t, _ in pairs],
+                        'datetime64[ns]')
+            numpy.array([v for _, v in pairs], float)
+        results.append(Result('arrays[lists]', rows * columns,
+                              time.time() - begin, 'values', None))
+        begin = time.time()
+        inp.get_arrays('points')
+        results.append(Result('arrays[cursor]', rows * columns,
+                              time.time() - begin, 'values', None))
+    return results
@@ -62,6 +62,54 @@ __all__ = ('settings',)
 _DEFAULTS = {
     'FILE_HEAD_ROWS_DEFAULT': 15,
     'FILE_HEAD_ROWS_MAX': 30,
+    # Number of processes used to parse files, and ranges of large files,
+    # concurrently during ingestion. None uses one process per CPU; 1
+    # disables it.
+    'INGEST_PROCESSES': 1,
+    # Number of rows parsed at a time, a column at a time, using NumPy
+    # during ingestion. 0 parses one row at a time.
+    'INGEST_BLOCK_SIZE': 10000,
+    # Storage used for the sensor data of new data maps: 'rows' stores
+    # each value as a row of the sensor data tables, 'partitioned' stores
+    # the rows of each dataset in tables of its own, which are dropped
+    # with the dataset, and 'chunks' stores compressed per-day chunks of
+    # each sensor's values.
+    'SENSOR_DATA_STORAGE': 'rows',
+    # Number of threads in the web server process used to run background
+    # jobs. Set to 0 when jobs are run by the jobworker command instead.
+    'JOB_LOCAL_THREADS': 2,
+    # Maximum number of jobs run concurrently for a single user.
+    'JOB_USER_LIMIT': 2,
+    # Seconds between job heartbeats and before a job without one is
+    # considered abandoned by a dead worker and queued again.
+    'JOB_HEARTBEAT_INTERVAL': 30,
+    'JOB_HEARTBEAT_TIMEOUT': 300,
+    # Seconds an idle worker waits before checking for new jobs.
+    'JOB_POLL_INTERVAL': 2,
+    # Number of rows read at a time when sensor data is streamed to
+    # applications, filters and dataset downloads.
+    'TIMESERIES_BATCH_SIZE': 10000,
+    # Bytes of aggregates, grouped series and arrays kept by each
+    # DatabaseInput, the inputs of an analysis run, for reuse by later
+    # reads in the run. The least recently used are dropped first; 0
+    # disables the cache.
+    'DATABASE_INPUT_CACHE_SIZE': 64 * 1024 * 1024,
+    # Number of rows deleted in each transaction when datasets and
+    # projects are deleted in the background.
+    'DELETE_BATCH_SIZE': 50000,
+    # PRAGMA statements run on each new connection by the
+    # openeis.db.backends.sqlite3 database backend. WAL journaling lets
+    # API readers proceed while ingest threads write; busy_timeout is in
+    # milliseconds, a negative cache_size is in KiB and mmap_size is in
+    # bytes. Set to {} to use the SQLite defaults.
+    'SQLITE_PRAGMAS': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
 }
 
 
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Database-backed queue of background jobs.
+
+Long running work, such as ingesting a data set or running an analysis,
+is recorded as a Job and run by a worker rather than in the thread
+handling the request. Workers are either the processes started by the
+jobworker management command or, if JOB_LOCAL_THREADS is non-zero, a
+small pool of threads in the web server process, which is suitable for
+single-user desktop installations. Either way, jobs are claimed from
+the database so that priorities and the per-user limit are honored and
+job progress is visible to every process.
+
+Functions to run each kind of job are registered using the register()
+decorator and are called with the Job instance.
+'''
+
+import collections
+import datetime
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+import traceback
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils.timezone import utc
+
+from . import models
+from .conf import settings as proj_settings
+
+
+__all__ = ['register', 'submit', 'update_progress', 'claim', 'run',
+           'run_pending', 'run_worker', 'requeue_abandoned', 'active_job',
+           'wake']
+
+_log = logging.getLogger(__name__)
+
+Handler = collections.namedtuple('Handler', 'func resumable')
+_handlers = {}
+
+
+def register(kind, *, resumable=False):
+    '''Decorator registering a function to run jobs of the given kind.
+
+    If resumable is True, jobs abandoned by a dead worker are queued to
+    run again. Otherwise they are marked as failed.
+    '''
+    def decorator(func):
+        _handlers[kind] = Handler(func, resumable)
+        return func
+    return decorator
+
+
+def _now():
+    return datetime.datetime.utcnow().replace(tzinfo=utc)
+
+
+def _worker_name(suffix=''):
+    return '{}:{}{}'.format(socket.gethostname(), os.getpid(), suffix)
+
+
+def submit(kind, obj, owner, priority=0):
+    '''Queue a job of kind to operate on obj and return the Job.'''
+    job = models.Job.objects.create(kind=kind, object_id=obj.pk,
+                                    owner=owner, priority=priority)
+    wake()
+    return job
+
+
+def update_progress(job, progress, interval=1.0):
+    '''Set the progress dictionary of a running job.
+
+    The progress is saved to the database at most once every interval
+    seconds to limit the cost of frequent updates.
+    '''
+    job.progress = progress
+    now = time.time()
+    if now - getattr(job, '_progress_saved', 0) >= interval:
+        job._progress_saved = now
+        models.Job.objects.filter(pk=job.pk).update(progress=progress)
+
+
+def _heartbeat_cutoff():
+    return _now() - datetime.timedelta(
+            seconds=proj_settings.JOB_HEARTBEAT_TIMEOUT)
+
+
+def requeue_abandoned():
+    '''Recover running jobs whose worker stopped sending heartbeats.
+
+    Resumable jobs are queued again and the rest are marked as failed.
+    Returns the number of jobs recovered.
+    '''
+    abandoned = models.Job.objects.filter(
+            status=models.Job.RUNNING, heartbeat__lt=_heartbeat_cutoff())
+    resumable = [kind for kind, handler in _handlers.items()
+                 if handler.resumable]
+    count = abandoned.filter(kind__in=resumable).update(
+            status=models.Job.QUEUED, worker='')
+    count += abandoned.exclude(kind__in=resumable).update(
+            status=models.Job.FAILED, ended=_now())
+    return count
+
+
+def active_job(kind, object_id):
+    '''Return the queued or running job of kind for an object or None.
+
+    A running job whose worker stopped sending heartbeats, such as one
+    left by a restart of the server, is first recovered as done by
+    requeue_abandoned(). The in-process workers are woken if the job
+    is queued, so polling a job keeps it moving when only the web
+    server runs jobs.
+    '''
+    job = models.Job.active(kind, object_id).first()
+    if (job is not None and job.status == models.Job.RUNNING and
+            job.heartbeat is not None and job.heartbeat < _heartbeat_cutoff()):
+        requeue_abandoned()
+        job = models.Job.active(kind, object_id).first()
+    if job is not None and job.status == models.Job.QUEUED:
+        wake()
+    return job
+
+
+def _busy_owners(limit):
+    '''Return the IDs of users running limit or more jobs.'''
+    if not limit:
+        return []
+    running = collections.Counter(models.Job.objects.filter(
+            status=models.Job.RUNNING).values_list('owner', flat=True))
+    return [owner for owner, count in running.items() if count >= limit]
+
+
+def claim(worker):
+    '''Claim the next job to run for worker or return None if none.
+
+    Jobs are taken in order of priority and then age, skipping those of
+    users already running JOB_USER_LIMIT jobs. A job is claimed using a
+    conditional update, so concurrent workers never claim the same job,
+    which also counts the owner's running jobs so the limit holds when
+    workers claim jobs of the same user at once. Where rows can be
+    locked, the owner is locked first so the count sees any claim
+    committed while waiting.
+    '''
+    limit = proj_settings.JOB_USER_LIMIT
+    queued = models.Job.objects.filter(
+            status=models.Job.QUEUED, kind__in=list(_handlers)).order_by(
+            '-priority', 'added', 'pk')
+    table = connection.ops.quote_name(models.Job._meta.db_table)
+    while True:
+        job = queued.exclude(owner__in=_busy_owners(limit)).first()
+        if job is None:
+            return None
+        now = _now()
+        update = models.Job.objects.filter(pk=job.pk,
+                                           status=models.Job.QUEUED)
+        if limit:
+            update = update.extra(
+                    where=['(SELECT COUNT(*) FROM {0} AS running '
+                           'WHERE running.owner_id = %s AND '
+                           'running.status = %s) < %s'.format(table)],
+                    params=[job.owner_id, models.Job.RUNNING, limit])
+        with transaction.atomic():
+            list(User.objects.select_for_update().filter(
+                    pk=job.owner_id).values_list('pk', flat=True))
+            claimed = update.update(status=models.Job.RUNNING, started=now,
+                                    heartbeat=now, worker=worker)
+        if claimed:
+            job.status = models.Job.RUNNING
+            job.started = job.heartbeat = now
+            job.worker = worker
+            return job
+
+
+def _heartbeat(job_id, stop):
+    interval = proj_settings.JOB_HEARTBEAT_INTERVAL
+    try:
+        while not stop.wait(interval):
+            models.Job.objects.filter(pk=job_id).update(heartbeat=_now())
+    finally:
+        connection.close()
+
+
+def run(job):
+    '''Run a claimed job, recording whether it completed or failed.'''
+    stop = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(job.pk, stop),
+                            daemon=True)
+    beat.start()
+    status = models.Job.COMPLETE
+    try:
+        _handlers[job.kind].func(job)
+    except Exception:
+        _log.exception('job %s (%s %s) failed', job.pk, job.kind,
+                       job.object_id)
+        status = models.Job.FAILED
+        job.progress = dict(job.progress or {},
+                            error=traceback.format_exc(limit=1))
+    finally:
+        stop.set()
+    models.Job.objects.filter(pk=job.pk).update(
+            status=status, ended=_now(), progress=job.progress)
+    job.status = status
+
+
+def run_pending(worker):
+    '''Run jobs until none remain which may be claimed.'''
+    requeue_abandoned()
+    while True:
+        job = claim(worker)
+        if job is None:
+            return
+        run(job)
+
+
+def run_worker(worker=None, poll_interval=None):
+    '''Run jobs as they are queued until interrupted.'''
+    worker = worker or _worker_name()
+    if poll_interval is None:
+        poll_interval = proj_settings.JOB_POLL_INTERVAL
+    while True:
+        run_pending(worker)
+        time.sleep(poll_interval)
+
+
+class _LocalPool:
+    '''Bounded pool of daemon threads running jobs in this process.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeups = queue.Queue()
+        self._threads = []
+
+    def wake(self):
+        size = proj_settings.JOB_LOCAL_THREADS
+        if not size:
+            return
+        with self._lock:
+            while len(self._threads) < size:
+                name = _worker_name(':local{}'.format(len(self._threads)))
+                thread = threading.Thread(target=self._run, args=(name,),
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        self._wakeups.put(None)
+
+    def _run(self, worker):
+        while True:
+            self._wakeups.get()
+            try:
+                run_pending(worker)
+            except Exception:
+                _log.exception('unhandled error running jobs')
+
+
+_local_pool = _LocalPool()
+
+
+def wake():
+    '''Have the in-process worker threads, if enabled, look for jobs.'''
+    _local_pool.wake()
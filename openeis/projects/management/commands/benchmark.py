@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Run one or more of the benchmarks registered in openeis.projects.benchmarks.
+
+All benchmarks are run if none are named. Data written to the database
+by a benchmark is rolled back when it completes. The command fails if
+any benchmark misses its target.
+'''
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from openeis.projects.benchmarks import get_benchmarks, Result
+
+
+class Command(BaseCommand):
+    help = 'Measure the throughput of ingestion and query code paths.'
+    args = '[BENCHMARK ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('-r', '--rows', type='int', default=10000,
+                    help='Number of rows of synthetic data to use.'),
+        make_option('-c', '--columns', type='int', default=20,
+                    help='Number of sensor columns of synthetic data.'),
+        make_option('-l', '--list', action='store_true', default=False,
+                    help='List the available benchmarks and exit.'),
+    )
+
+    def handle(self, *args, rows=10000, columns=20, list=False, **options):
+        benchmarks = get_benchmarks()
+        if list:
+            for name, func in benchmarks.items():
+                doc = (func.__doc__ or '').strip().split('\n')[0]
+                self.stdout.write('{:20} {}'.format(name, doc))
+            return
+        names = args or benchmarks.keys()
+        for name in names:
+            if name not in benchmarks:
+                raise CommandError('unknown benchmark: {}'.format(name))
+        failed = False
+        for name in names:
+            results = benchmarks[name](rows=rows, columns=columns)
+            if isinstance(results, Result):
+                results = [results]
+            for result in results:
+                self.stdout.write(str(result))
+                failed = failed or not result.passed
+        if failed:
+            raise CommandError('One or more benchmarks missed their target.')
@@ -72,6 +72,7 @@ from django.core.management.base import NoArgsCommand, CommandError
 
 from openeis.projects.models import DataFile, Project
 from openeis.projects.protectedmedia import ProtectedFileSystemStorage
+from openeis.projects.storage.fileindex import INDEX_SUFFIX
 
 
 class Command(NoArgsCommand):
@@ -99,7 +100,10 @@ class Command(NoArgsCommand):
             return
         for name in files:
             name = posixpath.join('projects', 'datafiles', name)
-            if DataFile.objects.filter(file=name).exists():
+            # Keep index sidecar files along with the files they index.
+            source = (name[:-len(INDEX_SUFFIX)]
+                      if name.endswith(INDEX_SUFFIX) else name)
+            if DataFile.objects.filter(file=source).exists():
                 log('Keeping file: {}'.format(name), 2)
             else:
                 log('Removing file: {}'.format(name), 1)
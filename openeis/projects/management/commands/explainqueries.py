@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Show the query plans used to read the sensor data of data sets.
+
+For each sensor of the given data sets, the database is asked to EXPLAIN
+the queries made by DatabaseInput.get_query_sets() and
+SensorIngest.merge(). A summary reports whether each query reads the
+sensor data through an index and whether the rows must be sorted, which
+is slow on large data sets. Run updatedb first if the indexes are
+missing from a database created by an earlier version.
+'''
+
+import re
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from openeis.projects import models
+
+
+# Statement prefix and patterns matching index use and sorts in the
+# plans of each database vendor.
+_EXPLAIN = {
+    'sqlite': ('EXPLAIN QUERY PLAN ',
+               re.compile(r'USING (?:COVERING )?INDEX'),
+               re.compile(r'USE TEMP B-TREE FOR ORDER BY')),
+    'postgresql': ('EXPLAIN ',
+                   re.compile(r'Index (?:Only )?Scan'),
+                   re.compile(r'\bSort\b')),
+    'mysql': ('EXPLAIN ', None, None),
+}
+
+
+def _queries(ingest):
+    '''Yield (description, queryset) pairs of the sensor data queries.'''
+    for sensor in ingest.map.sensors.order_by('name'):
+        if ingest.map.storage == models.DataMap.CHUNKS:
+            yield (sensor.name + ' chunks', sensor.chunks.filter(
+                   ingest=ingest).order_by('start', 'pk'))
+            continue
+        yield (sensor.name + ' get_query_sets', sensor.data.filter(
+               ingest_id=ingest.pk).order_by('time').timeseries())
+        yield (sensor.name + ' merge', sensor.data.filter(ingest=ingest))
+
+
+class Command(BaseCommand):
+    help = 'Explain the queries used to read the sensor data of data sets.'
+    args = 'DATASET_ID [DATASET_ID ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('-p', '--plans', action='store_true', default=False,
+                    help='Print the full query plans.'),
+    )
+
+    def handle(self, *args, verbosity=1, plans=False, **options):
+        verbosity = int(verbosity)
+        if not args:
+            raise CommandError('at least one data set ID is required')
+        try:
+            ids = [int(arg) for arg in args]
+        except ValueError:
+            raise CommandError('data set IDs must be integers')
+        for ingest in models.SensorIngest.objects.filter(
+                pk__in=ids).order_by('pk'):
+            self.stdout.write('Data set {} ({}):'.format(ingest.pk, ingest.name))
+            for description, queryset in _queries(ingest):
+                connection = connections[queryset.db]
+                try:
+                    prefix, uses_index, sorts = _EXPLAIN[connection.vendor]
+                except KeyError:
+                    raise CommandError('EXPLAIN is not supported for the {} '
+                                       'database backend'.format(connection.vendor))
+                sql, params = queryset.query.sql_with_params()
+                cursor = connection.cursor()
+                cursor.execute(prefix + sql, params)
+                plan = '\n'.join(' '.join(str(column) for column in row)
+                                 for row in cursor.fetchall())
+                if uses_index is None:
+                    summary = ''
+                else:
+                    summary = '{}, {}'.format(
+                            'index' if uses_index.search(plan) else 'NO INDEX',
+                            'SORTED' if sorts.search(plan) else 'no sort')
+                self.stdout.write('  {}: {}'.format(description, summary))
+                if plans or verbosity >= 2:
+                    for line in plan.splitlines():
+                        self.stdout.write('    ' + line)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Resume ingestion of data sets which were interrupted.
+
+Each committed batch records how far into each file ingestion
+progressed, allowing this command to continue from that point. Ingest
+jobs abandoned by a dead worker are resumed automatically by the job
+queue, so this is only needed for data sets without a queued or running
+job, such as those interrupted before the job queue was used.
+'''
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from openeis.projects import models
+from openeis.projects.views import perform_ingestion
+
+
+class Command(BaseCommand):
+    help = 'Resume interrupted data set ingestion.'
+    args = '[DATASET_ID ...]'
+    option_list = BaseCommand.option_list + (
+        make_option('-n', '--dry-run', action='store_true', default=False,
+                    help='List the interrupted data sets and exit.'),
+    )
+
+    def handle(self, *args, verbosity=1, dry_run=False, **options):
+        verbosity = int(verbosity)
+        active = models.Job.active(models.Job.INGEST).values_list(
+                'object_id', flat=True)
+        ingests = models.SensorIngest.objects.filter(
+                end__isnull=True).exclude(pk__in=list(active))
+        if args:
+            try:
+                ingests = ingests.filter(pk__in=[int(arg) for arg in args])
+            except ValueError:
+                raise CommandError('data set IDs must be integers')
+        for ingest in ingests.order_by('pk'):
+            if verbosity >= 1:
+                lines = ', '.join('{}:{}'.format(file.name, file.line_num)
+                                  for file in ingest.files.all())
+                self.stdout.write('Data set {} ({}) interrupted at {}'.format(
+                                  ingest.pk, ingest.name, lines))
+            if not dry_run:
+                perform_ingestion(ingest)
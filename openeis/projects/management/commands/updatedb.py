@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Add columns and indexes missing from an existing database.
+
+syncdb only creates missing tables, so columns and indexes added to the
+models of existing tables, such as the (sensor, ingest, time) indexes on
+the sensor data tables, are never added to databases created by an
+earlier version. This command adds them.
+'''
+
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction, DatabaseError, DEFAULT_DB_ALIAS
+from django.db.models import get_app, get_models
+
+
+def _default_sql(field, connection):
+    '''Return the DEFAULT and NULL clauses used to add a field's column.'''
+    if field.null:
+        return 'NULL'
+    if not field.has_default():
+        raise CommandError('cannot add column {}.{} without a default'.format(
+                field.model._meta.db_table, field.column))
+    value = field.get_db_prep_save(field.get_default(), connection)
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, str):
+        value = "'{}'".format(value.replace("'", "''"))
+    elif not isinstance(value, (int, float)):
+        raise CommandError('cannot add column {}.{} with a default of '
+                           '{!r}'.format(field.model._meta.db_table,
+                                         field.column, value))
+    return 'DEFAULT {} NOT NULL'.format(value)
+
+
+class Command(NoArgsCommand):
+    help = 'Add columns and indexes missing from existing tables.'
+    option_list = NoArgsCommand.option_list + (
+        make_option('-n', '--dry-run', action='store_true', default=False,
+                    help='Print the statements without executing them.'),
+        make_option('--database', default=DEFAULT_DB_ALIAS,
+                    help='Database to update. Defaults to "default".'),
+    )
+
+    def handle_noargs(self, *, verbosity=1, dry_run=False,
+                      database=DEFAULT_DB_ALIAS, **options):
+        verbosity = int(verbosity)
+        connection = connections[database]
+        qn = connection.ops.quote_name
+        style = no_style()
+        cursor = connection.cursor()
+        tables = set(connection.introspection.table_names(cursor))
+        for model in get_models(get_app('projects')):
+            table = model._meta.db_table
+            if table not in tables:
+                continue
+            columns = {row[0] for row in
+                       connection.introspection.get_table_description(
+                           cursor, table)}
+            for field in model._meta.local_fields:
+                db_type = field.db_type(connection)
+                if field.column in columns or db_type is None:
+                    continue
+                sql = 'ALTER TABLE {} ADD COLUMN {} {} {}'.format(
+                        qn(table), qn(field.column), db_type,
+                        _default_sql(field, connection))
+                if verbosity >= 1:
+                    self.stdout.write(sql)
+                if not dry_run:
+                    cursor.execute(sql)
+            for sql in connection.creation.sql_indexes_for_model(model, style):
+                sql = sql.rstrip(';')
+                if dry_run:
+                    if verbosity >= 2:
+                        self.stdout.write(sql)
+                    continue
+                # Indexes which already exist fail to be created; only the
+                # failed statement is rolled back.
+                try:
+                    with transaction.atomic(using=database):
+                        cursor.execute(sql)
+                except DatabaseError:
+                    if verbosity >= 2:
+                        self.stdout.write('Index exists: ' + sql)
+                else:
+                    if verbosity >= 1:
+                        self.stdout.write(sql)
@@ -53,8 +53,9 @@
 #
 #}}}
 
-import contextlib
+import copy
 import datetime
+import itertools
 import json
 import jsonschema
 import posixpath
@@ -68,13 +69,19 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import connections, models, transaction
-from django.db.models.query import QuerySet
+from django.db.models import Q
+from django.db.models.query import QuerySet, ValuesListQuerySet
 
 import jsonschema.exceptions
 
+from .conf import settings as proj_settings
 from .protectedmedia import ProtectedFileSystemStorage
 from .storage import dynamictables, sensormap
+from .storage.chunked import ChunkedSeries
 from .storage.csvfile import CSVFile
+from .storage.fileindex import build_index, read_index, write_index
+from .storage.mapped import mapped_file
+from .storage import rollup
 
 
 class JSONString(str):
@@ -144,6 +151,8 @@ class Project(models.Model):
 
     name = models.CharField(max_length=100)
     owner = models.ForeignKey(User, related_name='projects')
+    # Set while the project is being deleted in the background.
+    removed = models.BooleanField(default=False)
 
     def __str__(self):
         return self.name
@@ -201,13 +210,31 @@ class DataFile(models.Model):
     def __str__(self):
         return self.file.name
 
+    def mapped(self):
+        '''Return a shared, memory-mapped view of the stored file.'''
+        return mapped_file(self.file.path)
+
+    def index(self):
+        '''Return the saved index of the file or None if not indexed.'''
+        return read_index(self.file.path)
+
+    def build_index(self, **kwargs):
+        '''Index the file and save it for use by index().'''
+        index = build_index(self.file.path, **kwargs)
+        write_index(self.file.path, index)
+        return index
+
     def csv_head(self, count=15):
-        file = self.file
-        if file.closed:
-            file.open()
+        index = self.index()
+        if index:
+            has_header, head = index['has_header'], index['head']
+            # Use the index if it holds enough rows or the whole file.
+            if (count + has_header <= len(head) or
+                    index['head_end'] == index['size']):
+                return has_header, head[:count + has_header]
         rows = []
-        with contextlib.closing(file):
-            csv_file = CSVFile(file)
+        with self.mapped().open() as file:
+            csv_file = CSVFile(file, chunk_size=0)
             if (csv_file.has_header):
                 count += 1;
             for row in csv_file:
@@ -245,11 +272,26 @@ class AccountVerification(models.Model):
     data = JSONField(blank=True)
 
 
+def _default_storage():
+    return proj_settings.SENSOR_DATA_STORAGE
+
+
 class DataMap(models.Model):
+    ROWS = 'rows'
+    CHUNKS = 'chunks'
+    PARTITIONED = 'partitioned'
+
+    STORAGE_CHOICES = ((ROWS, 'One row per value'),
+                       (CHUNKS, 'Compressed daily chunks'),
+                       (PARTITIONED, 'One row per value in dataset tables'))
+
     project = models.ForeignKey(Project, related_name='datamaps')
     name = models.CharField(max_length=100)
     map = JSONField()
     removed = models.BooleanField(default=False)
+    # How the sensor data of datasets using this map is stored
+    storage = models.CharField(max_length=12, choices=STORAGE_CHOICES,
+                               default=_default_storage)
 
     class Meta:
         unique_together = ('project', 'name')
@@ -291,6 +333,8 @@ class SensorIngest(models.Model):
     # time of ingest
     start = models.DateTimeField(auto_now_add=True)
     end = models.DateTimeField(null=True, default=None)
+    # Set while the dataset is being deleted in the background.
+    removed = models.BooleanField(default=False)
 
     def merge(self, start=None, end=None, include_header=True, as_local_time = False):
         '''Return an iterator over the merged dataset.
@@ -312,8 +356,8 @@ class SensorIngest(models.Model):
             '''
             for i in data:
                 while True:
-                    time = (yield i.time)
-                    if i.time == time:
+                    time = (yield i[0])
+                    if i[0] == time:
                         yield i
                         break
                     yield None
@@ -331,7 +375,9 @@ class SensorIngest(models.Model):
         if isinstance(end, datetime.datetime):
             data = [d.filter(time__lt=end) for d in data]
         def _merge():
-            iterators = [_iter_data(d) for d in data]
+            iterators = [_iter_data(d.order_by('time').timeseries(
+                             batch_size=proj_settings.TIMESERIES_BATCH_SIZE))
+                         for d in data]
             while True:
                 try:
                     time = min(t for t in (next(i) for i in iterators) if t)
@@ -339,7 +385,7 @@ class SensorIngest(models.Model):
                     break
                 data_time = time if tz is None else time.astimezone(timezone(tz)) 
 
-                yield [data_time] + [d and d.value for d in [i.send(time) for i in iterators]]
+                yield [data_time] + [d and d[1] for d in [i.send(time) for i in iterators]]
         generator = _merge()
         # Filter by start row and end count
         if isinstance(start, int):
@@ -355,6 +401,61 @@ class SensorIngest(models.Model):
                 break
             yield row
 
+    def update_statistics(self):
+        '''Compute the statistics of the values of each sensor.
+
+        Replaces the SensorStatistics rows of the dataset. Called once
+        the values of a dataset have been written. Counts and numeric
+        statistics are totalled from the daily rollups kept while the
+        values were loaded, or computed from the values of sensors
+        without rollups.
+        '''
+        totals = {row['sensor']: row for row in
+                  self.rollups.filter(period='day').values('sensor').annotate(
+                      total_rows=models.Sum('rows'),
+                      total_count=models.Sum('count'),
+                      total_sum=models.Sum('sum'),
+                      total_min=models.Min('min'),
+                      total_max=models.Max('max'))}
+        statistics = []
+        for sensor in self.map.sensors.all():
+            data = sensor.data.filter(ingest=self)
+            total = totals.get(sensor.pk)
+            rows = total['total_rows'] if total else data.count()
+            stats = SensorStatistics(ingest=self, sensor=sensor, count=0,
+                                     null_count=rows)
+            if rows:
+                stats.count = (total['total_count'] if total else
+                               data.exclude(value=None).count())
+                stats.null_count = rows - stats.count
+                stats.interval = _typical_interval(data)
+            if stats.count:
+                values = data.exclude(value=None)
+                stats.first = values.earliest().time
+                stats.last = values.latest().time
+            if total and stats.count:
+                stats.min, stats.max = total['total_min'], total['total_max']
+                stats.mean = total['total_sum'] / stats.count
+            elif stats.count and sensor.data_type in (Sensor.FLOAT,
+                                                      Sensor.INTEGER):
+                result = data.aggregate(min=models.Min('value'),
+                                        max=models.Max('value'),
+                                        mean=models.Avg('value'))
+                stats.min, stats.max, stats.mean = (
+                        result['min'], result['max'], result['mean'])
+            statistics.append(stats)
+        with transaction.atomic():
+            self.statistics.all().delete()
+            SensorStatistics.objects.bulk_create(statistics)
+
+
+@dispatch.receiver(models.signals.pre_delete, sender=SensorIngest)
+def drop_dataset_partitions(sender, instance, using, **kwargs):
+    '''Drop the sensor data tables of datasets of partitioned data maps.'''
+    if instance.map.storage == DataMap.PARTITIONED:
+        for data_class in _sensor_data_classes():
+            data_class.drop_partition(instance.pk, using=using)
+
 
 @dispatch.receiver(models.signals.post_delete, sender=SensorIngest)
 def handle_dataset_delete(sender, instance, using, **kwargs):
@@ -369,6 +470,10 @@ class SensorIngestFile(models.Model):
     name = models.CharField(max_length=255)
     file = models.ForeignKey(DataFile, related_name='ingests',
                              null=True, on_delete=models.SET_NULL)
+    # Checkpoint of the last committed batch: the byte offset following
+    # the last row saved and its line number. Used to resume ingestion.
+    position = models.BigIntegerField(default=0)
+    line_num = models.IntegerField(default=0)
 
     class Meta:
         unique_together = ('ingest', 'name')
@@ -411,6 +516,10 @@ class Sensor(models.Model):
 
     @property
     def data(self):
+        if self.map.storage == DataMap.CHUNKS:
+            return ChunkedSeries(self)
+        if self.map.storage == DataMap.PARTITIONED:
+            return PartitionedSensorData(self)
         return getattr(self, self.get_data_type_display() + 'sensordata_set')
 
     @property
@@ -418,8 +527,29 @@ class Sensor(models.Model):
         return globals()[self.get_data_type_display().capitalize() + 'SensorData']
 
 
+# Seconds since the epoch of the start of a period in SQLite
+_SQLITE_EPOCH = ("CAST((julianday({{field}}, {0}) - 2440587.5) * 86400 "
+                 "AS INTEGER)")
+
+# Milliseconds since the epoch of a time in SQLite, which keeps times as
+# whole milliseconds, so rounding the Julian day recovers them exactly.
+_SQLITE_MILLISECONDS = ("CAST(ROUND((julianday({field}) - 2440587.5) * "
+                        "86400000) AS INTEGER)")
+
+
 class SensorDataQuerySet(QuerySet):
-    '''Override QuerySet to provide trunc_date() and timeseries() methods.'''
+    '''Override QuerySet to provide trunc_date() and timeseries() methods.
+
+    The keyword lookups passed to filter() are tracked, so timeseries()
+    can tell when an aggregated series may be read from the rollups.
+    '''
+
+    # Lookups passed to filter() or None after any other restriction.
+    _rollup_lookups = {}
+    # Whether null values were excluded.
+    _rollup_nonnull = False
+    # Rows read at a time when iterated or None to read them all at once.
+    _stream_size = None
 
     class pg_trunc(dict):
         def __missing__(self, key):
@@ -444,13 +574,20 @@ class SensorDataQuerySet(QuerySet):
             "minute": "trunc({field}, 'MI')",
         },
         "postgresql": pg_trunc(),
+        # Truncated times are computed as integer seconds since the
+        # epoch, which group faster than strings and are converted to
+        # datetimes without parsing by the openeis sqlite3 backend.
+        # Days and shorter periods divide the milliseconds of the time;
+        # Julian days of the start of months and years convert to
+        # seconds exactly. The '%s' format of strftime would be taken
+        # for a query parameter.
         "sqlite": {
-            "year": "strftime('%%Y-01-01 00:00:00{tz}', {field})",
-            "month": "strftime('%%Y-%%m-01 00:00:00{tz}', {field})",
-            "day": "strftime('%%Y-%%m-%%d 00:00:00{tz}', {field})",
-            "hour": "strftime('%%Y-%%m-%%d %%H:00:00{tz}', {field})",
-            "minute": "strftime('%%Y-%%m-%%d %%H:%%M:00{tz}', {field})",
-            "second": "strftime('%%Y-%%m-%%d %%H:%%M:%S{tz}', {field})",
+            "year": _SQLITE_EPOCH.format("'start of year'"),
+            "month": _SQLITE_EPOCH.format("'start of month'"),
+            "day": _SQLITE_MILLISECONDS + " / 86400000 * 86400",
+            "hour": _SQLITE_MILLISECONDS + " / 3600000 * 3600",
+            "minute": _SQLITE_MILLISECONDS + " / 60000 * 60",
+            "second": _SQLITE_MILLISECONDS + " / 1000",
         },
     }
 
@@ -489,20 +626,223 @@ class SensorDataQuerySet(QuerySet):
             select[dest] = func.format(field=source, tz=tz)
         return self.extra(select=select) if select else self
 
-    def timeseries(self, *, trunc_kind=None, aggregate=None):
+    def _clone(self, *args, **kwargs):
+        clone = super()._clone(*args, **kwargs)
+        clone._rollup_lookups = self._rollup_lookups
+        clone._rollup_nonnull = self._rollup_nonnull
+        clone._stream_size = self._stream_size
+        return clone
+
+    def stream(self, batch_size=None):
+        '''Return a clone which is read in batches when iterated.
+
+        Iterating a queryset normally reads and caches all of its rows.
+        Querysets ordered by time are instead read batch_size rows at a
+        time (TIMESERIES_BATCH_SIZE by default), each batch selecting
+        the rows following the time and primary key of the last row of
+        the previous one. Memory is bounded by the batch and no cursor
+        is held open between batches, so several series may be consumed
+        together and written to while they are read. Other querysets are
+        read all at once as usual.
+        '''
+        clone = self._clone()
+        clone._stream_size = batch_size or proj_settings.TIMESERIES_BATCH_SIZE
+        return clone
+
+    def __len__(self):
+        # list() asks for the length first, which would read all rows.
+        if self._stream_size is None or self._result_cache is not None:
+            return super().__len__()
+        return self.count()
+
+    def get(self, *args, **kwargs):
+        # get() reads the row from the cache filled by len().
+        clone = self._clone()
+        clone._stream_size = None
+        return super(SensorDataQuerySet, clone).get(*args, **kwargs)
+
+    def __iter__(self):
+        descending = _stream_order(self)
+        if (self._stream_size is None or self._result_cache is not None or
+                descending is None):
+            return super().__iter__()
+        base = self._clone()
+        base._stream_size = None
+        base = base.order_by(*(['-time', '-pk'] if descending
+                               else ['time', 'pk']))
+        return _iter_keyset(base, self._stream_size, descending,
+                            lambda obj: (obj.time, obj.pk))
+
+    def filter(self, *args, **kwargs):
+        clone = super().filter(*args, **kwargs)
+        lookups = clone._rollup_lookups
+        if args or lookups is None or not lookups.keys().isdisjoint(kwargs):
+            clone._rollup_lookups = None
+        else:
+            clone._rollup_lookups = dict(lookups, **kwargs)
+        return clone
+
+    def exclude(self, *args, **kwargs):
+        clone = super().exclude(*args, **kwargs)
+        if args or kwargs not in ({'value': None}, {'value__isnull': True}):
+            clone._rollup_lookups = None
+        else:
+            clone._rollup_nonnull = True
+        return clone
+
+    def _rollup_series(self, trunc_kind, aggregate):
+        '''Return an aggregated series computed from the rollups.
+
+        Returns None if the query is not limited to a single sensor and
+        ingest with rollups, or has other restrictions which the rollups
+        cannot reproduce. Time ranges must start and end on the boundary
+        of the period summarized.
+        '''
+        lookups = self._rollup_lookups
+        aggregate = aggregate('value')
+        if (lookups is None or aggregate.name not in rollup.AGGREGATES or
+                self.query.extra or not self.query.can_filter() or
+                self.query.order_by not in ([], ['time'], ['-time'])):
+            return None
+        period = next((period for period, kinds in rollup.PERIODS.items()
+                       if trunc_kind in kinds), None)
+        if period is None:
+            return None
+        filters = {'period': period}
+        for key, value in lookups.items():
+            field, _, lookup = key.partition('__')
+            if field in ('sensor', 'ingest', 'sensor_id', 'ingest_id'):
+                if lookup not in ('', 'id', 'id__exact', 'exact'):
+                    return None
+                filters[field.replace('_id', '')] = getattr(value, 'pk', value)
+            elif (key in ('time__gte', 'time__lt') and
+                    isinstance(value, datetime.datetime) and
+                    value.tzinfo is not None and
+                    rollup.truncate(value, period) == value):
+                filters[key] = value
+            else:
+                return None
+        if 'sensor' not in filters or 'ingest' not in filters:
+            return None
+        rollups = SensorRollup.objects.using(self.db).filter(**filters)
+        if not rollups.exists():
+            return None
+        summaries = rollups.order_by('time').values_list(
+                'time', 'rows', 'count', 'sum', 'sumsq', 'min', 'max')
+        sample = aggregate.extra.get('sample', False)
+        series = []
+        for time, group in itertools.groupby(
+                summaries, lambda row: rollup.truncate(row[0], trunc_kind)):
+            summary = rollup.Summary()
+            for row in group:
+                summary.merge(rollup.Summary(*row[1:]))
+            if summary.count or not self._rollup_nonnull:
+                series.append((time, rollup.aggregate_value(
+                        aggregate.name, summary, sample)))
+        if self.query.order_by == ['-time']:
+            series.reverse()
+        return series
+
+    def timeseries(self, *, trunc_kind=None, aggregate=None, batch_size=None):
         '''Return timeseries pairs from the table.
 
         Returns 2-tuples of time-value pairs. If trunc_kind is given,
         the time is truncated to the given precision. If aggregate is
         given, the series values are aggregated according to the given
-        aggregation method and grouped by the time.
+        aggregation method and grouped by the time. Series aggregated
+        by hour or longer periods are computed from the rollups, when
+        possible, rather than the values. If batch_size is given, the
+        pairs of series ordered by time are read batch_size rows at a
+        time when iterated (see stream()).
         '''
+        if trunc_kind and aggregate:
+            series = self._rollup_series(trunc_kind, aggregate)
+            if series is not None:
+                return series
         queryset = self
         if trunc_kind:
             queryset = queryset.trunc_date(trunc_kind, 'time')
         if aggregate:
             queryset = queryset.values('time').annotate(value=aggregate('value'))
-        return queryset.values_list('time', 'value')
+        queryset = queryset.values_list('time', 'value')
+        if batch_size:
+            queryset = queryset._clone(klass=StreamedValuesListQuerySet,
+                                       _stream_size=batch_size)
+        return queryset
+
+
+class StreamedValuesListQuerySet(ValuesListQuerySet):
+    '''A values_list() queryset read in batches when iterated.
+
+    Returned by SensorDataQuerySet.timeseries() given a batch_size.
+    Rows of querysets ordered by time are read as by stream(), with
+    the primary key selected as well to continue each batch from the
+    last row of the previous one.
+    '''
+
+    _stream_size = None
+
+    def _clone(self, *args, **kwargs):
+        kwargs.setdefault('_stream_size', self._stream_size)
+        return super()._clone(*args, **kwargs)
+
+    def __len__(self):
+        # list() asks for the length first, which would read all rows.
+        if self._stream_size is None or self._result_cache is not None:
+            return super().__len__()
+        return self.count()
+
+    def get(self, *args, **kwargs):
+        # get() reads the row from the cache filled by len().
+        clone = self._clone(_stream_size=None)
+        return super(StreamedValuesListQuerySet, clone).get(*args, **kwargs)
+
+    def __iter__(self):
+        fields = list(self._fields)
+        descending = _stream_order(self)
+        if (self._stream_size is None or self._result_cache is not None or
+                descending is None or self.flat or 'time' not in fields):
+            return super().__iter__()
+        base = self.order_by(*(['-time', '-pk'] if descending
+                               else ['time', 'pk']))
+        base = base._clone(klass=ValuesListQuerySet, setup=True,
+                           _fields=fields + ['pk'])
+        index = fields.index('time')
+        return (row[:-1] for row in _iter_keyset(
+                base, self._stream_size, descending,
+                lambda row: (row[index], row[-1])))
+
+
+def _stream_order(queryset):
+    '''Return whether a queryset read in batches is ordered by descending
+    time, or None if batches cannot be continued from its ordering.
+    '''
+    query = queryset.query
+    order = list(query.order_by or (queryset.model._meta.ordering
+                                    if query.default_ordering else []))
+    if (order not in (['time'], ['-time']) or query.low_mark or
+            query.high_mark is not None or query.extra_select or
+            query.aggregate_select):
+        return None
+    return order[0].startswith('-')
+
+
+def _iter_keyset(base, size, descending, key):
+    '''Yield the rows of base, ordered by time and primary key, reading
+    size rows at a time; key returns the (time, pk) of a row.
+    '''
+    batch = base
+    while True:
+        rows = list(batch[:size])
+        yield from rows
+        if len(rows) < size:
+            break
+        time, pk = key(rows[-1])
+        if descending:
+            after = Q(time__lt=time) | Q(time=time, pk__lt=pk)
+        else:
+            after = Q(time__gt=time) | Q(time=time, pk__gt=pk)
+        batch = base.filter(after)
 
 
 class SensorDataManager(models.Manager):
@@ -525,6 +865,93 @@ class BaseSensorData(models.Model):
         abstract = True
         ordering = ['time']
         get_latest_by = 'time'
+        # Sensor data is read for a sensor and ingest ordered by time.
+        index_together = [('sensor', 'ingest', 'time')]
+
+    _partitions = {}
+    _partition_lock = threading.Lock()
+
+    @classmethod
+    def partition(cls, ingest_id, using=None):
+        '''Return a model for the data of an ingest in its own table.
+
+        Datasets of partitioned data maps store the values of each data
+        type in a table of their own, named for the table of this model
+        and the ingest ID, which is created if it does not exist. The
+        model has the same fields, without reverse relations or foreign
+        key constraints, so the table may be dropped with the dataset.
+        '''
+        db = using or 'default'
+        key = cls, ingest_id, db
+        try:
+            return cls._partitions[key]
+        except KeyError:
+            pass
+        with cls._partition_lock:
+            if key not in cls._partitions:
+                model = cls._partition_model(ingest_id)
+                if not dynamictables.table_exists(model, db):
+                    dynamictables.create_table(model, db)
+                cls._partitions[key] = model
+            return cls._partitions[key]
+
+    @classmethod
+    def _partition_model(cls, ingest_id):
+        table = '{}_{}'.format(cls._meta.db_table, ingest_id)
+        attrs = {
+            'sensor': models.ForeignKey(Sensor, related_name='+',
+                                        db_constraint=False),
+            'ingest': models.ForeignKey(SensorIngest, related_name='+',
+                                        db_constraint=False),
+            'time': models.DateTimeField(),
+            'value': copy.deepcopy(cls._meta.get_field('value')),
+            'objects': SensorDataManager(),
+            'Meta': type('Meta', (BaseSensorData.Meta,), {'db_table': table}),
+            '__module__': __name__,
+        }
+        return type('{}_{}'.format(cls.__name__, ingest_id),
+                    (models.Model,), attrs)
+
+    @classmethod
+    def drop_partition(cls, ingest_id, using=None):
+        '''Drop the table holding the data of an ingest, if it exists.'''
+        db = using or 'default'
+        table = '{}_{}'.format(cls._meta.db_table, ingest_id)
+        with cls._partition_lock:
+            cls._partitions.pop((cls, ingest_id, db), None)
+            if table in connections[db].introspection.table_names():
+                dynamictables.drop_table(table, db)
+
+
+class PartitionedSensorData:
+    '''Manager-like access to the data of a sensor in a partitioned map.
+
+    filter() prunes the query to the table of the ingest it is given,
+    as is done by all readers of sensor data. Other queryset methods
+    may only be used directly when the data map has a single dataset.
+    '''
+
+    def __init__(self, sensor):
+        self.sensor = sensor
+
+    def get_queryset(self, ingest_id=None):
+        if ingest_id is None:
+            ids = list(self.sensor.map.datasets.values_list('pk', flat=True)[:2])
+            if len(ids) != 1:
+                raise ValueError('sensor data of a partitioned data map must '
+                                 'be filtered by ingest')
+            ingest_id, = ids
+        model = self.sensor.data_class.partition(
+                ingest_id, using=self.sensor._state.db)
+        return model.objects.filter(sensor=self.sensor)
+
+    def filter(self, *args, **kwargs):
+        ingest = kwargs.get('ingest', kwargs.get('ingest_id'))
+        return self.get_queryset(getattr(ingest, 'pk', ingest)).filter(
+                *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.get_queryset(), name)
 
 
 class BooleanSensorData(BaseSensorData):
@@ -544,6 +971,91 @@ class StringSensorData(BaseSensorData):
     objects = SensorDataManager()
 
 
+class SensorRollup(models.Model):
+    '''Summary of the values of a sensor and ingest in a UTC hour or day.
+
+    Maintained as values are loaded; see storage/rollup.py.
+    '''
+    PERIOD_CHOICES = (('hour', 'Hour'), ('day', 'Day'))
+
+    sensor = models.ForeignKey(Sensor, related_name='rollups')
+    ingest = models.ForeignKey(SensorIngest, related_name='rollups')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    # Start of the period
+    time = models.DateTimeField()
+    # Number of values, including and excluding nulls
+    rows = models.IntegerField()
+    count = models.IntegerField()
+    sum = models.FloatField()
+    sumsq = models.FloatField()
+    min = models.FloatField(null=True)
+    max = models.FloatField(null=True)
+
+    class Meta:
+        unique_together = ('sensor', 'ingest', 'period', 'time')
+
+
+class SensorStatistics(models.Model):
+    '''Summary of the values of a sensor in a dataset.
+
+    Computed after the dataset is loaded so that metadata, such as the
+    time range of a sensor or its maximum, is a single row read.
+    '''
+    ingest = models.ForeignKey(SensorIngest, related_name='statistics')
+    sensor = models.ForeignKey(Sensor, related_name='statistics')
+    # Number of non-null and null values
+    count = models.IntegerField()
+    null_count = models.IntegerField()
+    # Minimum, maximum and mean of numeric values
+    min = models.FloatField(null=True)
+    max = models.FloatField(null=True)
+    mean = models.FloatField(null=True)
+    # Times of the first and last non-null values
+    first = models.DateTimeField(null=True)
+    last = models.DateTimeField(null=True)
+    # Median seconds between the first values
+    interval = models.FloatField(null=True)
+
+    class Meta:
+        unique_together = ('ingest', 'sensor')
+
+
+def _typical_interval(data, samples=1000):
+    '''Return the median seconds between the first values of a series.'''
+    series = data.order_by('time').timeseries()
+    try:
+        series = series[:samples + 1]
+    except TypeError:
+        series = itertools.islice(series, samples + 1)
+    times = [time for time, _ in series]
+    deltas = sorted((b - a).total_seconds() for a, b in zip(times, times[1:]))
+    return deltas[len(deltas) // 2] if deltas else None
+
+
+def _sensor_data_classes():
+    return [BooleanSensorData, FloatSensorData,
+            IntegerSensorData, StringSensorData]
+
+
+class SensorDataChunk(models.Model):
+    '''Compressed values of a sensor from a single UTC day.
+
+    Used in place of the sensor data tables by data maps with chunk
+    storage. See storage/chunked.py for the encoding.
+    '''
+    sensor = models.ForeignKey(Sensor, related_name='chunks')
+    ingest = models.ForeignKey(SensorIngest, related_name='chunks')
+    # Times of the first and last values in the chunk
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    count = models.IntegerField()
+    time_data = models.BinaryField()
+    value_data = models.BinaryField()
+
+    class Meta:
+        index_together = [('sensor', 'ingest', 'start')]
+
+
 class Analysis(models.Model):
     '''A run of a single application against a single dataset.'''
 
@@ -581,6 +1093,59 @@ class SharedAnalysis(models.Model):
     key = models.CharField(max_length=16, default=_share_key)
 
 
+class Job(models.Model):
+    '''Background work, such as ingestion or an analysis run.
+
+    Jobs are queued in the database and run by worker processes (see
+    openeis.projects.jobs). object_id refers to the SensorIngest,
+    Analysis, DataFile or Project the job operates on, depending on kind.
+    '''
+
+    INGEST = 'ingest'
+    ANALYSIS = 'analysis'
+    INDEX = 'index'
+    DELETE_DATASET = 'delete_dataset'
+    DELETE_PROJECT = 'delete_project'
+    KIND_CHOICES = ((INGEST, 'Ingest'), (ANALYSIS, 'Analysis'),
+                    (INDEX, 'Index'), (DELETE_DATASET, 'Delete dataset'),
+                    (DELETE_PROJECT, 'Delete project'))
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((QUEUED, 'Queued'), (RUNNING, 'Running'),
+                      (COMPLETE, 'Complete'), (FAILED, 'Failed'))
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    owner = models.ForeignKey(User, related_name='jobs')
+    # Jobs with higher priority are run first.
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=QUEUED)
+    progress = JSONField(blank=True, default=dict)
+    added = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, default=None)
+    ended = models.DateTimeField(null=True, default=None)
+    # Updated periodically while running to detect dead workers.
+    heartbeat = models.DateTimeField(null=True, default=None)
+    worker = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        index_together = [('status', 'priority', 'added'),
+                          ('kind', 'object_id')]
+
+    @classmethod
+    def active(cls, kind, object_id=None):
+        '''Return queued and running jobs of kind.'''
+        jobs = cls.objects.filter(kind=kind, status__in=[cls.QUEUED,
+                                                         cls.RUNNING])
+        if object_id is not None:
+            jobs = jobs.filter(object_id=object_id)
+        return jobs
+
+
 class AppOutput(models.Model):
     analysis = models.ForeignKey(Analysis, related_name='app_output')
     name = models.CharField(max_length=255)
@@ -53,12 +53,12 @@
 #
 #}}}
 
+import codecs
 import csv
-import io
 import posixpath
 import re
 
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers
 from rest_framework.reverse import reverse
 
@@ -111,21 +111,19 @@ class CreateFileSerializer(serializers.ModelSerializer):
         #if re.search(r'<\?xml-stylesheet\s+.*href="GreenButtonDataStyleSheet.xslt".*\?>', head):
         if re.match(r'\ufeff?\s*<\?xml(?:\s+\w+="[^"]*")*\s*\?>', head):
             attrs['format'] = 'greenbutton'
-            dst = io.StringIO()
-            converter.Convert(file, dst)
-            dst = io.BytesIO(dst.getvalue().encode('utf-8'))
             name = file.name
             if name[-4:].lower() == '.xml':
                 name = name[:-3] + 'csv'
-                
-            if (hasattr(file, 'field_name')):
-                fieldname = file.field_name
-            else:
-                #Some files are coming in with no field name
-                fieldname = 'file'
-            file = InMemoryUploadedFile(dst, field_name=fieldname,
-                name=name, content_type='text/csv', size=len(dst.getvalue()),
-                charset=None)
+            # Stream the converted rows to a file on disk rather than
+            # holding the whole CSV in memory.
+            dst = TemporaryUploadedFile(name=name, content_type='text/csv',
+                                        size=0, charset='utf-8')
+            converter.Convert(file, codecs.getwriter('utf-8')(dst))
+            dst.size = dst.tell()
+            dst.seek(0)
+            # Some files are coming in with no field name
+            dst.field_name = getattr(file, 'field_name', 'file')
+            file = dst
             attrs[source] = file
             attrs['name'] = name
 
@@ -265,7 +263,7 @@ class DataMapSerializer(serializers.ModelSerializer):
     map = JSONField()
     class Meta:
         model = models.DataMap
-        read_only_fields = ('project',)
+        read_only_fields = ('project', 'storage')
 
 class ReadOnlyDataMapSerializer(DataMapSerializer):
     map = JSONField(read_only=True)
@@ -301,6 +299,14 @@ class SensorIngestLogSerializer(serializers.ModelSerializer):
         fields = ('file', 'message', 'level', 'column', 'row' )
 
 
+class SensorStatisticsSerializer(serializers.ModelSerializer):
+    sensor = serializers.CharField(source='sensor.name', read_only=True)
+
+    class Meta:
+        model = models.SensorStatistics
+        exclude = ('id', 'ingest')
+
+
 class SensorIngestCreateSerializer(serializers.ModelSerializer):
 
     files = SensorIngestFileSerializer(many=True, required=True)
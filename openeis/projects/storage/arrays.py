@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''NumPy arrays of sensor time series.
+
+Numerical applications read their inputs into NumPy arrays, which built
+from querysets first creates a model instance or tuple and a datetime
+for every value. Series are instead read here as blocks of rows of the
+time in microseconds since the epoch, a null flag and the value as a
+float, converted by NumPy into growing arrays one block at a time.
+
+Each series is returned as SeriesArrays of contiguous datetime64[ns]
+UTC times, float64 values, NaN where null, and a boolean mask of the
+null values. Several series may be aligned on their times into a
+FrameArrays of 2-D values and nulls with a column per series.
+'''
+
+import collections
+from datetime import datetime, timedelta
+import functools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from django.utils.timezone import utc
+
+
+__all__ = ['SeriesArrays', 'FrameArrays', 'ArrayBuilder', 'align']
+
+
+SeriesArrays = collections.namedtuple('SeriesArrays', 'times values nulls')
+
+FrameArrays = collections.namedtuple('FrameArrays',
+                                     'times values nulls columns')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=utc)
+
+_MICROSECOND = timedelta(microseconds=1)
+
+# Initial number of rows allocated when no size is given
+_MIN_SIZE = 1024
+
+
+def _row_dtype():
+    return numpy.dtype([('time', 'i8'), ('null', '?'), ('value', 'f8')])
+
+
+def _microseconds(time):
+    '''Return the microseconds from the epoch to a time, naive in UTC.'''
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=utc)
+    return (time - EPOCH) // _MICROSECOND
+
+
+class ArrayBuilder:
+    '''Accumulate the rows of a series into arrays.
+
+    Rows are added in blocks by extend(), as (microseconds, null, value)
+    tuples read from the database, or by extend_pairs() as the (time,
+    value) pairs of a timeseries. Storage is allocated for size rows
+    and doubled as needed.
+    '''
+
+    def __init__(self, size=0):
+        if numpy is None:
+            raise ImportError('numpy is required to read arrays')
+        self._rows = numpy.empty(max(size, _MIN_SIZE), _row_dtype())
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, count):
+        end = self._size + count
+        if end > len(self._rows):
+            rows = numpy.empty(max(end, 2 * len(self._rows)),
+                               self._rows.dtype)
+            rows[:self._size] = self._rows[:self._size]
+            self._rows = rows
+        return self._rows[self._size:end]
+
+    def extend(self, rows):
+        '''Add a list of (microseconds, null, value) tuples.'''
+        self._fill(rows, len(rows))
+
+    def extend_pairs(self, pairs):
+        '''Add a list of (time, value) pairs.'''
+        self._fill(((_microseconds(time), value is None,
+                     0.0 if value is None else value)
+                    for time, value in pairs), len(pairs))
+
+    def _fill(self, rows, count):
+        if not count:
+            return
+        self._reserve(count)[:] = numpy.fromiter(rows, self._rows.dtype,
+                                                 count)
+        self._size += count
+
+    def finish(self):
+        '''Return the SeriesArrays of the rows added.'''
+        rows = self._rows[:self._size]
+        times = (rows['time'] * 1000).view('datetime64[ns]')
+        nulls = numpy.array(rows['null'])
+        values = numpy.array(rows['value'])
+        values[nulls] = numpy.nan
+        return SeriesArrays(times, values, nulls)
+
+
+def align(series, columns=None, drop_partial_lines=True):
+    '''Align several SeriesArrays on their times.
+
+    Returns a FrameArrays with the times of every series, or only those
+    common to all of the series if drop_partial_lines is True, and 2-D
+    values and nulls with a column for each series. Times missing from
+    a series are null. Series are expected to have unique times.
+    '''
+    if numpy is None:
+        raise ImportError('numpy is required to read arrays')
+    series = list(series)
+    if not series:
+        times = numpy.empty(0, 'datetime64[ns]')
+    elif drop_partial_lines:
+        times = functools.reduce(numpy.intersect1d,
+                                 [item.times for item in series])
+    else:
+        times = numpy.unique(numpy.concatenate(
+                [item.times for item in series]))
+    shape = len(times), len(series)
+    values = numpy.empty(shape)
+    values.fill(numpy.nan)
+    nulls = numpy.ones(shape, bool)
+    for column, item in enumerate(series):
+        index = numpy.searchsorted(times, item.times)
+        found = index < len(times)
+        found[found] = times[index[found]] == item.times[found]
+        values[index[found], column] = item.values[found]
+        nulls[index[found], column] = item.nulls[found]
+    return FrameArrays(times, values, nulls, list(columns or []))
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Load parsed sensor values directly into the sensor data tables.
+
+Creating a Django model instance for every value read from a data file
+and pushing them through bulk_create() is far too slow for large data
+sets. The BulkLoader collects values into per-table column buffers and
+writes them using a single executemany() per table on each flush. For
+data maps using chunk storage, the buffered values are instead written
+as compressed per-day chunks of each sensor's values. Hourly and daily
+rollups of numeric values are updated on each flush as well.
+
+On PostgreSQL, rows are streamed to the tables with COPY ... FROM STDIN
+in CSV format, which is several times faster than executemany().
+'''
+
+import datetime
+
+from django.db import connections, router, transaction
+from django.utils.timezone import utc
+
+from .. import models
+from .chunked import chunk_day, merge_chunk, split_days
+from .rollup import Summary, summarize, truncate
+
+
+__all__ = ['ColumnBuffer', 'CopyReader', 'BulkLoader']
+
+
+# Data types for which rollups are kept.
+ROLLUP_TYPES = (models.Sensor.FLOAT, models.Sensor.INTEGER)
+
+
+class ColumnBuffer:
+    '''Column-oriented buffer of values destined for a single table.
+
+    Values are stored in three parallel lists, one each for the sensor
+    IDs, times, and values, to avoid creating an object per value.
+    '''
+
+    __slots__ = ('model', 'data_type', 'sensors', 'times', 'values')
+
+    def __init__(self, model, data_type=None):
+        self.model = model
+        self.data_type = data_type
+        self.sensors = []
+        self.times = []
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, sensor_id, time, value):
+        self.sensors.append(sensor_id)
+        self.times.append(time)
+        self.values.append(value)
+
+    def extend(self, sensor_id, times, values):
+        '''Append a column of times and values for a single sensor.'''
+        count = len(self.values)
+        self.times.extend(times)
+        self.values.extend(values)
+        self.sensors.extend([sensor_id] * (len(self.values) - count))
+
+    def clear(self):
+        del self.sensors[:], self.times[:], self.values[:]
+
+
+def _csv_value(value):
+    '''Format a value for COPY in CSV format.
+
+    Unquoted empty values are read as NULL, so strings are always
+    quoted to keep empty strings distinct from NULL.
+    '''
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    return str(value)
+
+
+class CopyReader:
+    '''File-like object reading rows as CSV lines for COPY FROM STDIN.
+
+    Lines are generated as they are read, so rows are streamed to the
+    database without formatting the whole batch first.
+    '''
+
+    def __init__(self, rows):
+        self._lines = (','.join([_csv_value(value) for value in row]) + '\n'
+                       for row in rows)
+        self._pending = ''
+
+    def read(self, size=-1):
+        parts = [self._pending]
+        length = len(self._pending)
+        for line in self._lines:
+            parts.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        data = ''.join(parts)
+        if size < 0:
+            self._pending = ''
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+
+
+class BulkLoader:
+    '''Write sensor data for an ingest using raw executemany() calls.
+
+    Values are added to the buffer for the data class of the sensor
+    using append() or extend(). Other model instances, such as ingest
+    log entries, may be queued using add_object() and are saved using
+    bulk_create(). Nothing is written to the database until flush() is
+    called. len() returns the number of values and objects waiting to be
+    written.
+    '''
+
+    def __init__(self, ingest, *, using=None):
+        self.ingest_id = ingest.pk
+        self.using = using or router.db_for_write(
+                ingest.__class__, instance=ingest)
+        storage = ingest.map.storage
+        self.chunked = storage == models.DataMap.CHUNKS
+        self.partitioned = storage == models.DataMap.PARTITIONED
+        self.buffers = {}
+        self.objects = []
+        self._statements = {}
+
+    def __len__(self):
+        return (sum(len(buf) for buf in self.buffers.values()) +
+                len(self.objects))
+
+    def buffer(self, sensor):
+        '''Return the column buffer used for the sensor's data class.'''
+        model = sensor.data_class
+        if self.partitioned:
+            model = model.partition(self.ingest_id, using=self.using)
+        try:
+            return self.buffers[model]
+        except KeyError:
+            buf = self.buffers[model] = ColumnBuffer(model, sensor.data_type)
+            return buf
+
+    def append(self, sensor, time, value):
+        self.buffer(sensor).append(sensor.pk, time, value)
+
+    def extend(self, sensor, times, values):
+        self.buffer(sensor).extend(sensor.pk, times, values)
+
+    def add_object(self, obj):
+        self.objects.append(obj)
+
+    def _insert_sql(self, model, copy=False):
+        '''Return the INSERT, or the COPY if copy is true, for a table.'''
+        try:
+            return self._statements[model, copy]
+        except KeyError:
+            pass
+        qn = connections[self.using].ops.quote_name
+        opts = model._meta
+        columns = ', '.join(qn(opts.get_field(name).column)
+                            for name in ['sensor', 'ingest', 'time', 'value'])
+        if copy:
+            sql = 'COPY {} ({}) FROM STDIN WITH CSV'.format(
+                    qn(opts.db_table), columns)
+        else:
+            sql = 'INSERT INTO {} ({}) VALUES (%s, %s, %s, %s)'.format(
+                    qn(opts.db_table), columns)
+        self._statements[model, copy] = sql
+        return sql
+
+    def _write_chunks(self, buf):
+        '''Merge the buffered values into the chunks of each sensor-day.
+
+        Each flush updates the chunk already stored for a sensor, ingest
+        and day, if any, so a day is kept in a single chunk however the
+        values are split between flushes.
+        '''
+        series = {}
+        for sensor_id, time, value in zip(buf.sensors, buf.times, buf.values):
+            try:
+                times, values = series[sensor_id]
+            except KeyError:
+                times, values = series[sensor_id] = [], []
+            times.append(time)
+            values.append(value)
+        manager = models.SensorDataChunk.objects.using(self.using)
+        # Chunks starting on the days of the first and last values,
+        # including those starting after the last value on its day.
+        first, last = [time.astimezone(utc).replace(
+                           hour=0, minute=0, second=0, microsecond=0)
+                       for time in (min(buf.times), max(buf.times))]
+        stored = {(chunk.sensor_id, chunk_day(chunk.start)): chunk
+                  for chunk in manager.filter(
+                      ingest_id=self.ingest_id, sensor_id__in=list(series),
+                      start__gte=first,
+                      start__lt=last + datetime.timedelta(days=1))}
+        created, updated = [], []
+        for sensor_id, (times, values) in series.items():
+            for day, micros, day_values in split_days(times, values):
+                chunk = stored.get((sensor_id, day))
+                if chunk is None:
+                    chunk = models.SensorDataChunk(
+                            sensor_id=sensor_id, ingest_id=self.ingest_id)
+                    fields = merge_chunk(buf.data_type, micros, day_values)
+                    created.append(chunk)
+                else:
+                    fields = merge_chunk(buf.data_type, micros, day_values,
+                                         chunk.time_data, chunk.value_data)
+                    updated.append(chunk)
+                (chunk.start, chunk.end, chunk.count,
+                 chunk.time_data, chunk.value_data) = fields
+        manager.bulk_create(created)
+        for chunk in updated:
+            chunk.save(using=self.using, update_fields=[
+                    'start', 'end', 'count', 'time_data', 'value_data'])
+
+    def _write_rollups(self, buf):
+        '''Merge the summaries of the buffered values into the rollups.'''
+        summaries = summarize(buf.sensors, buf.times, buf.values)
+        manager = models.SensorRollup.objects.using(self.using)
+        stored = manager.filter(
+                ingest_id=self.ingest_id, sensor_id__in=set(buf.sensors),
+                time__gte=truncate(min(buf.times), 'day'),
+                time__lte=max(buf.times))
+        updated = []
+        for obj in stored:
+            summary = summaries.pop((obj.sensor_id, obj.period, obj.time), None)
+            if summary is None:
+                continue
+            total = Summary(obj.rows, obj.count, obj.sum, obj.sumsq,
+                            obj.min, obj.max)
+            total.merge(summary)
+            (obj.rows, obj.count, obj.sum, obj.sumsq,
+             obj.min, obj.max) = (total.rows, total.count, total.sum,
+                                  total.sumsq, total.min, total.max)
+            updated.append(obj)
+        manager.bulk_create([
+            models.SensorRollup(
+                sensor_id=sensor_id, ingest_id=self.ingest_id, period=period,
+                time=time, rows=summary.rows, count=summary.count,
+                sum=summary.sum, sumsq=summary.sumsq,
+                min=summary.min, max=summary.max)
+            for (sensor_id, period, time), summary in summaries.items()])
+        for obj in updated:
+            obj.save(using=self.using, update_fields=[
+                    'rows', 'count', 'sum', 'sumsq', 'min', 'max'])
+
+    def flush(self):
+        '''Write all buffered values and objects to the database.
+
+        Everything is written in a single transaction, or a savepoint if
+        a transaction is already open. Returns the number of values and
+        objects written.
+        '''
+        with transaction.atomic(using=self.using):
+            return self._flush()
+
+    def _flush(self):
+        connection = connections[self.using]
+        to_db = connection.ops.value_to_db_datetime
+        ingest_id = self.ingest_id
+        copy = connection.vendor == 'postgresql'
+        count = 0
+        cursor = connection.cursor()
+        for model, buf in self.buffers.items():
+            if not buf:
+                continue
+            if buf.data_type in ROLLUP_TYPES:
+                self._write_rollups(buf)
+            if self.chunked:
+                self._write_chunks(buf)
+                count += len(buf)
+                buf.clear()
+                continue
+            if copy:
+                rows = ((sensor_id, ingest_id, time.isoformat(), value)
+                        for sensor_id, time, value in
+                        zip(buf.sensors, buf.times, buf.values))
+                cursor.copy_expert(self._insert_sql(model, copy=True),
+                                   CopyReader(rows))
+            else:
+                # Values of a row share its time, so each time is
+                # converted once.
+                converted = {}
+                params = []
+                for sensor_id, time, value in zip(buf.sensors, buf.times,
+                                                  buf.values):
+                    try:
+                        db_time = converted[time]
+                    except KeyError:
+                        db_time = converted[time] = to_db(time)
+                    params.append((sensor_id, ingest_id, db_time, value))
+                cursor.executemany(self._insert_sql(model), params)
+            count += len(buf)
+            buf.clear()
+        objects, self.objects = self.objects, []
+        by_model = {}
+        for obj in objects:
+            by_model.setdefault(obj.__class__, []).append(obj)
+        for model, group in by_model.items():
+            model.objects.using(self.using).bulk_create(group)
+        return count + len(objects)
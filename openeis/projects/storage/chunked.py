@@ -0,0 +1,605 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Compressed, per-day chunk storage for sensor data.
+
+Storing a row for every value in the sensor data tables makes a year of
+one minute data from a few hundred points a hundred million rows, each
+read back individually. Data maps using chunk storage instead keep the
+values of each sensor in SensorDataChunk rows covering at most one UTC
+day: an array of time deltas in microseconds and an array of values,
+each compressed with zlib. Reading a sensor is then a handful of chunk
+fetches per month.
+
+Boolean and integer status points change state only a few times a day,
+so their values are run-length encoded when that is shorter, and may be
+read as intervals of unchanged value.
+
+Sensor.data returns a ChunkedSeries for these data maps, which provides
+the subset of the QuerySet API used on sensor data by ingestion, the
+filters and the applications.
+'''
+
+import array
+import bisect
+import collections
+import datetime
+import itertools
+import json
+import operator
+import sys
+import zlib
+
+from django.db.models import Sum
+from django.utils import timezone
+
+
+__all__ = ['SensorValue', 'chunk_day', 'split_days', 'merge_chunk',
+           'decode_chunk', 'ChunkedSeries']
+
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+_DAY = 86400 * 1000000
+
+# Array type codes used to store the values of each sensor data type.
+# Strings, and values which do not fit, are stored as a JSON list.
+_TYPECODES = {'b': 'b', 'f': 'd', 'i': 'q'}
+
+# Data types whose values are run-length encoded when there are at most
+# half as many runs of equal values as values.
+_RUN_LENGTH_TYPES = {'b', 'i'}
+
+
+def _to_micros(time):
+    if timezone.is_naive(time):
+        time = timezone.make_aware(time, timezone.utc)
+    return (time - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros):
+    return _EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def _pack(typecode, items):
+    data = array.array(typecode, items)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+def _unpack(typecode, data):
+    items = array.array(typecode)
+    items.frombytes(data)
+    if sys.byteorder != 'little':
+        items.byteswap()
+    return items.tolist()
+
+
+def _encode_times(micros):
+    deltas = [micros[0]]
+    deltas.extend(map(operator.sub, micros[1:], micros[:-1]))
+    return zlib.compress(_pack('q', deltas))
+
+
+def _encode_runs(typecode, values):
+    '''Return run-length encoded values or None if not worthwhile.
+
+    The data is the number of runs, then a null flag, length and value
+    for each run.
+    '''
+    runs = [(value, sum(1 for _ in group))
+            for value, group in itertools.groupby(values)]
+    if len(runs) * 2 > len(values):
+        return None
+    run_values, lengths = zip(*runs)
+    try:
+        return (b'r' + _pack('q', [len(runs)]) +
+                bytes(value is None for value in run_values) +
+                _pack('q', lengths) +
+                _pack(typecode, [0 if value is None else value
+                                 for value in run_values]))
+    except (OverflowError, TypeError):
+        return None
+
+
+def _decode_runs(data_type, data):
+    count = _unpack('q', data[1:9])[0]
+    nulls = data[9:9 + count]
+    lengths = _unpack('q', data[9 + count:9 + 9 * count])
+    run_values = _unpack(_TYPECODES[data_type], data[9 + 9 * count:])
+    if data_type == 'b':
+        run_values = [bool(value) for value in run_values]
+    values = []
+    for value, length, null in zip(run_values, lengths, nulls):
+        values.extend(itertools.repeat(None if null else value, length))
+    return values
+
+
+def _encode_values(data_type, values):
+    typecode = _TYPECODES.get(data_type)
+    if data_type in _RUN_LENGTH_TYPES:
+        data = _encode_runs(typecode, values)
+        if data is not None:
+            return zlib.compress(data)
+    if typecode is not None:
+        nulls = bytes(value is None for value in values)
+        try:
+            data = b'a' + nulls + _pack(
+                    typecode, [0 if value is None else value
+                               for value in values])
+        except (OverflowError, TypeError):
+            typecode = None
+    if typecode is None:
+        data = b'j' + json.dumps(list(values)).encode('utf-8')
+    return zlib.compress(data)
+
+
+def chunk_day(time):
+    '''Return the number of the UTC day, since the epoch, of a time.'''
+    return _to_micros(time) // _DAY
+
+
+def split_days(times, values):
+    '''Split a series at UTC day boundaries.
+
+    Yields (day, micros, values) tuples, where day is as returned from
+    chunk_day() and micros is the sorted list of times in microseconds
+    since the epoch.
+    '''
+    pairs = sorted(zip([_to_micros(time) for time in times], values),
+                   key=operator.itemgetter(0))
+    for day, group in itertools.groupby(pairs, lambda pair: pair[0] // _DAY):
+        micros, values = zip(*group)
+        yield day, list(micros), list(values)
+
+
+def merge_chunk(data_type, micros, values, time_data=None, value_data=None):
+    '''Encode the values of a day, merged with those of a stored chunk.
+
+    Returns the (start, end, count, time_data, value_data) fields of
+    the chunk, where start and end are the first and last times.
+    '''
+    if time_data is not None:
+        pairs = sorted(itertools.chain(
+                zip(*decode_chunk(data_type, time_data, value_data)),
+                zip(micros, values)), key=operator.itemgetter(0))
+        micros, values = zip(*pairs)
+    return (_from_micros(micros[0]), _from_micros(micros[-1]), len(micros),
+            _encode_times(micros), _encode_values(data_type, values))
+
+
+def decode_chunk(data_type, time_data, value_data):
+    '''Return lists of times, in microseconds since the epoch, and values.
+    '''
+    micros = list(itertools.accumulate(_unpack('q', zlib.decompress(time_data))))
+    data = zlib.decompress(value_data)
+    if data[:1] == b'j':
+        return micros, json.loads(data[1:].decode('utf-8'))
+    if data[:1] == b'r':
+        return micros, _decode_runs(data_type, data)
+    count = len(micros)
+    nulls = data[1:count + 1]
+    values = _unpack(_TYPECODES[data_type], data[count + 1:])
+    if data_type == 'b':
+        values = [bool(value) for value in values]
+    if any(nulls):
+        values = [None if null else value
+                  for value, null in zip(values, nulls)]
+    return micros, values
+
+
+class SensorValue(collections.namedtuple('SensorValue', 'time value')):
+    '''A single sensor value.
+
+    Provides the time and value attributes of the sensor data models and
+    may be indexed like the pairs returned from timeseries().
+    '''
+    __slots__ = ()
+
+
+_COMPARE = {
+    'exact': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+# Time lookups narrowing the range of microseconds read: functions
+# returning the inclusive start and exclusive end of the range.
+_RANGES = {
+    'exact': lambda micros: (micros, micros + 1),
+    'gt': lambda micros: (micros + 1, None),
+    'gte': lambda micros: (micros, None),
+    'lt': lambda micros: (None, micros),
+    'lte': lambda micros: (None, micros + 1),
+}
+
+_TIME_PARTS = {
+    'year': operator.attrgetter('year'),
+    'month': operator.attrgetter('month'),
+    'day': operator.attrgetter('day'),
+    'hour': operator.attrgetter('hour'),
+    'minute': operator.attrgetter('minute'),
+    'second': operator.attrgetter('second'),
+    'week_day': lambda time: time.isoweekday() % 7 + 1,
+}
+
+_TRUNCATE = {
+    'year': dict(month=1, day=1, hour=0, minute=0, second=0, microsecond=0),
+    'month': dict(day=1, hour=0, minute=0, second=0, microsecond=0),
+    'day': dict(hour=0, minute=0, second=0, microsecond=0),
+    'hour': dict(minute=0, second=0, microsecond=0),
+    'minute': dict(second=0, microsecond=0),
+    'second': dict(microsecond=0),
+}
+
+
+def _lookup_predicate(key, value):
+    '''Return a function of (time, value) implementing a field lookup.'''
+    field, _, lookup = key.partition('__')
+    if field == 'time':
+        part, _, lookup = lookup.partition('__')
+        if part in _TIME_PARTS:
+            get_part = _TIME_PARTS[part]
+            compare = _COMPARE[lookup or 'exact']
+            return lambda t, v: compare(get_part(timezone.localtime(t)), value)
+        lookup = part or 'exact'
+        if lookup == 'in':
+            values = set(value)
+            return lambda t, v: t in values
+        compare = _COMPARE[lookup]
+        return lambda t, v: compare(t, value)
+    if field == 'value':
+        lookup = lookup or 'exact'
+        if lookup == 'isnull' or (lookup == 'exact' and value is None):
+            isnull = value is None or value
+            return lambda t, v: (v is None) == isnull
+        if lookup == 'in':
+            values = set(value)
+            return lambda t, v: v in values
+        compare = _COMPARE[lookup]
+        return lambda t, v: v is not None and compare(v, value)
+    raise KeyError(key)
+
+
+class _Aggregate:
+    '''Accumulate values for one of the supported aggregation functions.
+
+    Null values are ignored, as they are by the database.
+    '''
+
+    names = {'Avg', 'Count', 'Max', 'Min', 'Sum'}
+
+    def __init__(self, aggregate):
+        if aggregate.name not in self.names:
+            raise NotImplementedError(
+                    '{} is not supported on chunked sensor data'.format(
+                    aggregate.name))
+        self.name = aggregate.name
+        self.count = 0
+        self.total = 0
+        self.min = self.max = None
+
+    def add(self, value):
+        if value is None:
+            return
+        self.count += 1
+        if self.name in ('Avg', 'Sum'):
+            self.total += value
+        elif self.name == 'Min':
+            if self.min is None or value < self.min:
+                self.min = value
+        elif self.name == 'Max':
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def result(self):
+        if self.name == 'Count':
+            return self.count
+        if not self.count:
+            return None
+        if self.name == 'Avg':
+            return self.total / self.count
+        return {'Sum': self.total, 'Min': self.min, 'Max': self.max}[self.name]
+
+
+class ChunkedSeries:
+    '''Lazy, queryset-like view of the chunk stored values of a sensor.
+
+    Supports the subset of the QuerySet API used on sensor data:
+    filter() and exclude() on ingest, time and value (including the
+    year, month, day, week_day, hour, minute and second parts of the
+    time); order_by() time or value; iteration, which yields SensorValue
+    pairs; count(), exists(), earliest(), latest(), aggregate() and
+    timeseries(). intervals() reads runs of unchanged values. Ingest and time range lookups passed to filter() limit
+    the chunks read from the database; the others are applied to each
+    value as it is read.
+    '''
+
+    def __init__(self, sensor):
+        self.sensor = sensor
+        # Kept apart from the sensor, which may be saved as a copy with
+        # a new ID while the series is still being read.
+        self.sensor_id = sensor.pk
+        self._chunk_manager = sensor.chunks.model._default_manager.db_manager(
+                sensor._state.db)
+        self._chunk_filter = {}
+        self._start = self._end = None
+        self._predicates = []
+        self._order = 'time'
+        self._trunc_kind = None
+        self._aggregate = None
+        self._result_cache = None
+
+    def _clone(self):
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone._result_cache = None
+        clone._chunk_filter = self._chunk_filter.copy()
+        clone._predicates = self._predicates[:]
+        return clone
+
+    def all(self):
+        return self._clone()
+
+    def filter(self, **kwargs):
+        clone = self._clone()
+        for key, value in kwargs.items():
+            field, _, lookup = key.partition('__')
+            if field in ('ingest', 'ingest_id'):
+                if lookup == 'in':
+                    clone._chunk_filter['ingest_id__in'] = [
+                            getattr(i, 'pk', i) for i in value]
+                elif not lookup:
+                    clone._chunk_filter['ingest_id'] = getattr(value, 'pk', value)
+                else:
+                    raise NotImplementedError(
+                            'unsupported lookup on chunked sensor data: '
+                            '{}'.format(key))
+            elif field == 'time' and lookup in _RANGES:
+                start, end = _RANGES[lookup](_to_micros(value))
+                if start is not None and (clone._start is None or
+                                          start > clone._start):
+                    clone._start = start
+                if end is not None and (clone._end is None or
+                                        end < clone._end):
+                    clone._end = end
+            else:
+                clone._predicates.append(clone._predicate(key, value))
+        return clone
+
+    def exclude(self, **kwargs):
+        clone = self._clone()
+        predicates = [clone._predicate(key, value)
+                      for key, value in kwargs.items()]
+        clone._predicates.append(
+                lambda t, v: not all(pred(t, v) for pred in predicates))
+        return clone
+
+    def _predicate(self, key, value):
+        try:
+            return _lookup_predicate(key, value)
+        except KeyError:
+            raise NotImplementedError(
+                    'unsupported lookup on chunked sensor data: {}'.format(key))
+
+    def order_by(self, *fields):
+        if len(fields) > 1 or (fields and fields[0].lstrip('-') not in
+                               ('time', 'value')):
+            raise NotImplementedError('chunked sensor data may only be '
+                                      'ordered by time or value')
+        clone = self._clone()
+        clone._order = fields[0] if fields else 'time'
+        return clone
+
+    def reverse(self):
+        clone = self._clone()
+        clone._order = (clone._order[1:] if clone._order.startswith('-')
+                        else '-' + clone._order)
+        return clone
+
+    def timeseries(self, *, trunc_kind=None, aggregate=None, batch_size=None):
+        '''Return timeseries pairs from the chunks.
+
+        Behaves like SensorDataQuerySet.timeseries(), with times
+        truncated in UTC. Aggregation is computed while reading and
+        groups consecutive values with the same (truncated) time.
+        batch_size is ignored, as chunks are always read a day at a
+        time.
+        '''
+        if trunc_kind is not None and trunc_kind not in _TRUNCATE:
+            raise ValueError('invalid truncation kind: {}'.format(trunc_kind))
+        if aggregate is not None:
+            _Aggregate(aggregate)
+        clone = self._clone()
+        clone._trunc_kind = trunc_kind
+        clone._aggregate = aggregate
+        return clone
+
+    def intervals(self):
+        '''Yield (start, end, value) for each run of unchanged values.
+
+        start is the time of the first value of the run and end the time
+        of the first value of the next, or of the last value for the
+        final run. Runs are in time order whatever the ordering.
+        '''
+        run = None
+        for time, value in self._iter_values():
+            if run is None:
+                run = [time, time, value]
+            elif value != run[2] or (value is None) != (run[2] is None):
+                run[1] = time
+                yield tuple(run)
+                run = [time, time, value]
+            else:
+                run[1] = time
+        if run is not None:
+            yield tuple(run)
+
+    def _chunks(self):
+        chunks = self._chunk_manager.filter(sensor_id=self.sensor_id,
+                                            **self._chunk_filter)
+        if self._start is not None:
+            chunks = chunks.filter(end__gte=_from_micros(self._start))
+        if self._end is not None:
+            chunks = chunks.filter(start__lt=_from_micros(self._end))
+        return chunks
+
+    def _iter_days(self, reverse=False):
+        '''Yield lists of times, in microseconds, and values by day.'''
+        order = ('-start', '-pk') if reverse else ('start', 'pk')
+        chunks = self._chunks().order_by(*order).values_list(
+                'start', 'time_data', 'value_data')
+        data_type = self.sensor.data_type
+        days = itertools.groupby(
+                chunks.iterator(), lambda chunk: _to_micros(chunk[0]) // _DAY)
+        for _, group in days:
+            decoded = [decode_chunk(data_type, times, values)
+                       for _, times, values in group]
+            if len(decoded) == 1:
+                micros, values = decoded[0]
+            else:
+                pairs = sorted(
+                        itertools.chain.from_iterable(
+                            zip(*chunk) for chunk in decoded),
+                        key=operator.itemgetter(0))
+                micros, values = (list(items) for items in zip(*pairs))
+            start = (0 if self._start is None else
+                     bisect.bisect_left(micros, self._start))
+            end = (len(micros) if self._end is None else
+                   bisect.bisect_left(micros, self._end))
+            if start >= end:
+                continue
+            micros, values = micros[start:end], values[start:end]
+            if reverse:
+                micros.reverse()
+                values.reverse()
+            yield micros, values
+
+    def _iter_values(self, reverse=False):
+        predicates = self._predicates
+        for micros, values in self._iter_days(reverse):
+            for time, value in zip(map(_from_micros, micros), values):
+                if all(pred(time, value) for pred in predicates):
+                    yield SensorValue(time, value)
+
+    def __iter__(self):
+        if self._result_cache is not None:
+            return iter(self._result_cache)
+        order = self._order
+        if order.lstrip('-') == 'value':
+            items = sorted(self._iter_values(),
+                           key=lambda item: (item.value is not None, item.value),
+                           reverse=order.startswith('-'))
+        else:
+            items = self._iter_values(order.startswith('-'))
+        trunc = _TRUNCATE.get(self._trunc_kind)
+        if trunc is not None:
+            items = (SensorValue(time.replace(**trunc), value)
+                     for time, value in items)
+        if self._aggregate is None:
+            return iter(items)
+        return self._iter_aggregate(items)
+
+    def _iter_aggregate(self, items):
+        for time, group in itertools.groupby(items, operator.itemgetter(0)):
+            accumulator = _Aggregate(self._aggregate)
+            for _, value in group:
+                accumulator.add(value)
+            yield SensorValue(time, accumulator.result())
+
+    def _counted(self):
+        return (self._start is None and self._end is None and
+                not self._predicates and self._aggregate is None)
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        if self._counted():
+            return self._chunks().aggregate(total=Sum('count'))['total'] or 0
+        return sum(1 for _ in self)
+
+    def __len__(self):
+        # Like a QuerySet, keep the results read to find the length so
+        # they are not read again by list() and subsequent iteration.
+        if self._result_cache is None and not self._counted():
+            self._result_cache = list(iter(self))
+        return self.count()
+
+    def exists(self):
+        return next(iter(self), None) is not None
+
+    def earliest(self):
+        item = next(iter(self.order_by('time')), None)
+        if item is None:
+            raise self.sensor.data_class.DoesNotExist
+        return item
+
+    def latest(self):
+        item = next(iter(self.order_by('-time')), None)
+        if item is None:
+            raise self.sensor.data_class.DoesNotExist
+        return item
+
+    def aggregate(self, **kwargs):
+        accumulators = {name: _Aggregate(aggregate)
+                        for name, aggregate in kwargs.items()}
+        for _, value in self._iter_values():
+            for accumulator in accumulators.values():
+                accumulator.add(value)
+        return {name: accumulator.result()
+                for name, accumulator in accumulators.items()}
@@ -57,6 +57,7 @@ import json
 import copy
 
 from .. import models
+from .bulkload import BulkLoader
 
 
 class CloneProject():
@@ -98,6 +99,8 @@ class CloneProject():
     
             self.clone_sensor_ingest(list(sensor_ingests),data_map, project)
             self.clone_sensors(list(sensors), data_map)
+            for sensor_ingest in self.sensor_ingest_dict.values():
+                sensor_ingest.update_statistics()
             
     def clone_sensor_ingest(self, sensor_ingests_list, data_map_definition, project):
         self.sensor_ingest_dict = {}
@@ -122,15 +125,13 @@ class CloneProject():
             sensor.map = data_map
             sensor.save()
             
-            cloned_sensor_data = []
             for sensor_ingest in self.sensor_ingest_dict.keys():
-                sensor_data_list = orig_sensor.data_class.objects.filter(ingest=sensor_ingest)
-                for sensor_data in sensor_data_list:
-                    sensor_data.sensor = sensor
-                    sensor_data.ingest = self.sensor_ingest_dict[sensor_ingest]
-                    sensor_data.id = None
-                    cloned_sensor_data.append(sensor_data)
-                orig_sensor.data_class.objects.bulk_create(cloned_sensor_data)
+                loader = BulkLoader(self.sensor_ingest_dict[sensor_ingest])
+                for sensor_data in orig_sensor.data.filter(ingest=sensor_ingest):
+                    loader.append(sensor, sensor_data.time, sensor_data.value)
+                    if len(loader) >= 10000:
+                        loader.flush()
+                loader.flush()
             
     
     def clone_analysis(self, analyses_list, sensor_ingest, project):
@@ -53,6 +53,7 @@
 #
 #}}}
 
+import codecs
 import csv
 
 
@@ -61,18 +62,34 @@ class CSVFile:
 
     First, the given file (which must be seekable) is read up to
     sample_size. Then, the dialect is sniffed and used to create a CSV
-    reader object. An internal readline method is used to overcome a bug
-    in Django's File iterator and to limit the line lengths via the
-    max_line_size argument. If the encoding argument is not given, UTF-8
-    is used to decode the file. Raises csv.Error for any CSV problems.
+    reader object. The file is read in blocks of chunk_size bytes, which
+    are decoded incrementally and split into lines in bulk; if chunk_size
+    is 0, the file is instead read a line at a time using an internal
+    readline method. Line lengths are limited via the max_line_size
+    argument. If the encoding argument is not given, UTF-8 is used to
+    decode the file. Raises csv.Error for any CSV problems.
+
+    If dialect is given, along with has_header, sniffing is skipped.
+
+    The position attribute holds the offset in the file, in bytes for
+    binary files, following the last line read by the CSV reader and is
+    suitable for passing to seek() to continue reading from the next row.
     '''
     def __init__(self, file, *, max_line_size=10000,
-                 encoding='utf-8', sample_size=10000):
+                 encoding='utf-8', sample_size=10000, chunk_size=1 << 20,
+                 dialect=None, has_header=False):
         self.file = file
         self.max_line_size = max_line_size
         self.encoding = 'utf-8'
-        self.dialect, self.has_header = self._sniff(sample_size)
-        self.reader = csv.reader(self._iterlines(), self.dialect)
+        self.chunk_size = chunk_size
+        self.position = 0
+        if dialect is None:
+            dialect, has_header = self._sniff(sample_size)
+        else:
+            self.file.seek(0)
+        self.dialect, self.has_header = dialect, has_header
+        lines = self._iterchunks() if chunk_size else self._iterlines()
+        self.reader = csv.reader(lines, self.dialect)
 
     def _sniff(self, size=10000, delimiters=', \t|'):
         '''Detect a header and the dialect within the first size bytes.'''
@@ -91,20 +108,75 @@ class CSVFile:
     def _iterlines(self):
         '''Iterate over the lines of the file.'''
         readline = self._readline
+        tell = self.file.tell
+        self.position = tell()
         while True:
             line = readline()
             if not line:
                 return
+            self.position = tell()
             yield line
 
+    def _iterchunks(self):
+        '''Iterate over the lines of the file, reading it in chunks.
+
+        The byte length of each line is needed to track the position. If
+        a chunk decodes to as many characters as it has bytes, it is all
+        ASCII and character counts are used. Otherwise, the lines are
+        encoded again to count their bytes.
+        '''
+        read, size = self.file.read, self.chunk_size
+        max_line_size = self.max_line_size
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        self.position = self.file.tell()
+        tail, tail_ascii = '', True
+        while True:
+            chunk = read(size)
+            if isinstance(chunk, bytes):
+                try:
+                    text = decoder.decode(chunk, not chunk)
+                except UnicodeDecodeError:
+                    raise csv.Error('Encountered invalid Unicode character')
+                ascii = tail_ascii and len(text) == len(chunk)
+            else:
+                text, ascii = chunk, True
+            if not chunk:
+                if tail:
+                    if len(tail) >= max_line_size:
+                        self._line_too_long()
+                    self.position += (len(tail) if tail_ascii else
+                                      len(tail.encode(self.encoding)))
+                    yield tail
+                return
+            lines = (tail + text).split('\n')
+            tail, tail_ascii = lines.pop(), ascii
+            if len(tail) >= max_line_size:
+                self._line_too_long()
+            if ascii:
+                for line in lines:
+                    if len(line) >= max_line_size:
+                        self._line_too_long()
+                    self.position += len(line) + 1
+                    yield line + '\n'
+            else:
+                encoding = self.encoding
+                for line in lines:
+                    if len(line) >= max_line_size:
+                        self._line_too_long()
+                    self.position += len(line.encode(encoding)) + 1
+                    yield line + '\n'
+
+    def _line_too_long(self):
+        raise csv.Error('Line exceeds maximum size of {}'.format(
+                        self.max_line_size))
+
     def _readline(self):
         '''Read a single decoded line from the file.'''
         line = self.file.readline(self.max_line_size)
         if not line:
             return ''
         if not line[-1] == '\n' and len(line) >= self.max_line_size:
-            raise csv.Error('Line exceeds maximum size of {}'.format(
-                             self.max_line_size))
+            self._line_too_long()
         try:
             return line.decode(self.encoding)
         except UnicodeDecodeError:
@@ -68,39 +68,53 @@ input_map =
 }
 '''
 
-from collections import defaultdict
+import collections
 from datetime import datetime, timedelta
+import itertools
 import logging
+import sys
 
+from django.conf import settings
+from django.db import connections, models as dj_models, router
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 import pytz
 
 from .. import models
+from ..conf import settings as proj_settings
+from . import arrays
+from .merge import merge as merge_series, format_rows, DROP, NONE, FILL
 
 _logger = logging.getLogger(__name__)
 
+_cursor_ids = itertools.count()
+
 MAX_DATE =  pytz.utc.localize(datetime.max - timedelta(days=5))
 
 
-def get_sensors(datamap_id, topics):
+def get_sensors(datamap_id, topics, mapdef=None):
     '''Get querysets for to given topics.
 
     get_sensors() returns a list of two-tuples. The first element is a
     meta object that will hold the mapping definition and the sensor
     definition. The second element is a function which takes no
     arguments and will return a new queryset. The queryset has two
-    columns of data: the time and the data point value.
+    columns of data: the time and the data point value. The DataMap
+    is loaded unless given as mapdef.
     '''
     if isinstance(topics, str):
         topics = [topics]
     result = []
-    mapdef = models.DataMap.objects.get(pk=datamap_id)
+    if mapdef is None:
+        mapdef = models.DataMap.objects.get(pk=datamap_id)
     datamap = mapdef.map
+    sensors = {sensor.name: sensor
+               for sensor in mapdef.sensors.filter(name__in=topics)}
     for topic in topics:
         meta = datamap['sensors'][topic]
         # XXX: Augment metadata by adding general definition properties
         if 'type' in meta:
-            sensor = mapdef.sensors.get(name=topic)
-            def get_queryset():
+            def get_queryset(sensor=sensors[topic]):
                 return sensor.data
         else:
             get_queryset = None
@@ -108,6 +122,69 @@ def get_sensors(datamap_id, topics):
     return result
 
 
+def _estimate_size(value):
+    '''Return the approximate number of bytes held by a cached value.'''
+    nbytes = getattr(value, 'nbytes', None)
+    if nbytes is not None:
+        return nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(item)
+                                          for item in value)
+    return sys.getsizeof(value)
+
+
+def _freeze(value):
+    '''Return a hashable key for filter arguments or raise TypeError.'''
+    if isinstance(value, dict):
+        value = tuple(sorted((key, _freeze(item))
+                             for key, item in value.items()))
+    elif isinstance(value, (list, tuple, set)):
+        value = tuple(_freeze(item) for item in value)
+    hash(value)
+    return value
+
+
+class SeriesCache:
+    '''Least recently used cache of the series read by a DatabaseInput.
+
+    Values are kept until their estimated size exceeds size bytes, when
+    the least recently used are dropped. Values larger than the cache
+    are not kept.
+    '''
+
+    def __init__(self, size):
+        self.size = size
+        self.used = 0
+        self.hits = self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, load):
+        '''Return the value cached for key, calling load() if missing.'''
+        try:
+            value, nbytes = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            value = load()
+            nbytes = _estimate_size(value)
+            if nbytes > self.size:
+                return value
+            self.used += nbytes
+        else:
+            self.hits += 1
+        self._entries[key] = value, nbytes
+        while self.used > self.size:
+            _, (_, dropped) = self._entries.popitem(last=False)
+            self.used -= dropped
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.used = 0
+
+
 class DatabaseInput:
 
     def __init__(self, datamap_id, topic_map, dataset_id=None):
@@ -122,22 +199,34 @@ class DatabaseInput:
         self.topic_map = topic_map.copy()
 
         self.dataset_id = dataset_id
+        self.datamap_id = datamap_id
+
+        # The DataMap and sensors are loaded once for all of the topics.
+        mapdef = models.DataMap.objects.get(pk=datamap_id)
+        all_topics = sorted({topic for topics in self.topic_map.values()
+                             for topic in topics})
+        sensors = dict(zip(all_topics,
+                           get_sensors(datamap_id, all_topics, mapdef)))
+        self._data_types = dict(mapdef.sensors.filter(
+                name__in=all_topics).values_list('name', 'data_type'))
 
         self.data_map = {}
         self.sensor_meta_map = {}
         for input_name, topics in self.topic_map.items():
-            self.data_map[input_name] = tuple(get_sensors(datamap_id,x)[0] for x in topics)
+            self.data_map[input_name] = tuple(sensors[x] for x in topics)
 
         self.topic_meta = {}
 
-        self.map_defintion = models.DataMap.objects.get(pk=datamap_id).map
+        self.map_defintion = mapdef.map
 
         for input_name, topics in self.topic_map.items():
             self.topic_meta[input_name] = {}
             for topic in topics:
-                self.topic_meta[input_name][topic] = get_sensors(datamap_id,topic)[0][0]
+                self.topic_meta[input_name][topic] = dict(sensors[topic][0])
                 self.topic_meta[input_name][topic]['timezone'] = self.get_tz_for_sensor(topic)
 
+        self.cache = SeriesCache(proj_settings.DATABASE_INPUT_CACHE_SIZE)
+
     def get_topics(self):
         return self.topic_map.copy()
 
@@ -172,140 +261,172 @@ class DatabaseInput:
         '''Returns topics with their meta data'''
         return self.topic_meta.copy()
 
+    def get_statistics(self, group_name):
+        '''Return the SensorStatistics of the topics of an input.
+
+        Returns a list in the order of the topics, with None for topics
+        without statistics, as for datasets loaded before they were kept
+        or when no dataset was given.
+        '''
+        if self.dataset_id is None:
+            return [None] * len(self.topic_map[group_name])
+        def load():
+            return {stats.sensor.name: stats
+                    for stats in models.SensorStatistics.objects.filter(
+                        ingest_id=self.dataset_id,
+                        sensor__map_id=self.datamap_id,
+                        sensor__name__in=self.topic_map[group_name])
+                    .select_related('sensor')}
+        statistics = self.cache.get(('statistics', group_name), load)
+        return [statistics.get(topic)
+                for topic in self.topic_map[group_name]]
+
     def get_start_end_times(self):
         """Return a tuple of datetime objects representing the start and end times of the data."""
         pass
 
     @staticmethod
-    def merge(*args, drop_partial_lines=True, fill_in_data=None):
+    def merge(*args, drop_partial_lines=True, fill_in_data=None,
+              as_tuples=False):
         '''
             args  - one or more results returned from get_query_sets() method
             drop_partial_lines - whether to drop incomplete sets, missing values are represented by None
+            as_tuples - yield tuples of the time and each value rather than dictionaries
         '''
-        def merge_drop():
-            "Drop incomplete rows"
-            managed_query_sets = []
-
-            for arg in args:
-                for group, query_set_list in arg.items():
-                    for query_set in query_set_list:
-                        managed_query_sets.append((group,query_set.__iter__()))
-            current = [x[1].__next__() for x in managed_query_sets]
-            newest = max(current, key=lambda x:x[0] )[0]
-
-            while True:
-                if all(x[0] == newest for x in current):
-                    result = defaultdict(list)
-                    result['time']  = newest
-                    for value, query in zip(current, managed_query_sets):
-                        result[query[0]].append(value[1])
-
-                    yield result
-                    current = [x[1].__next__() for x in managed_query_sets]
-                    newest = max(current, key=lambda x:x[0] )[0]
-                else:
-                    new_current = []
-                    terminate = False
-                    for value, query in zip(current, managed_query_sets):
-                        if value[0] == newest:
-                            new_current.append(value)
-                        else:
-                            try:
-                                new_current.append(query[1].__next__())
-                            except StopIteration:
-                                terminate = True
-                                break
-                    if terminate:
-                        break
-                    current = new_current
-                    newest = max(current, key=lambda x:x[0] )[0]
-
-        def merge_no_drop():
-            "Incomplete rows provide a None for missing values."
-            managed_query_sets = []
-
-            for arg in args:
-                for group, query_set_list in arg.items():
-                    for query_set in query_set_list:
-                        managed_query_sets.append((group,query_set.__iter__()))
-            current = [x[1].__next__() for x in managed_query_sets]
-            oldest = min(current, key=lambda x:x[0] )[0]
-
-            while True:
-                result = defaultdict(list)
-                result['time']  = oldest
-
-                for value, query in zip(current, managed_query_sets):
-                    if value[0] == oldest:
-                        result[query[0]].append(value[1])
-                    else:
-                        result[query[0]].append(None)
-
-                yield result
-                new_current = []
-                for value, query in zip(current, managed_query_sets):
-                    if value[0] != oldest:
-                        new_current.append(value)
-                    else:
-                        try:
-                            new_current.append(query[1].__next__())
-                        except StopIteration:
-                            new_current.append((MAX_DATE,None))
-                current = new_current
-                oldest = min(current, key=lambda x:x[0] )[0]
-                if oldest == MAX_DATE:
-                    break
-
-
-        return merge_drop() if drop_partial_lines else merge_no_drop()
+        return merge_series(args, DROP if drop_partial_lines else NONE,
+                            as_tuples)
 
     @staticmethod
-    def merge_fill_in_data(*args, drop_partial_lines=True, fill_in_data=None):
+    def merge_fill_in_data(*args, drop_partial_lines=True, fill_in_data=None,
+                           as_tuples=False):
         "Incomplete rows provide last known reading for missing values or None if no good value"
-        #pass in a timedelta to advance time
-        managed_query_sets = []
-
-        latest_value = []
-
-        for arg in args:
-            for group, query_set_list in arg.items():
-                for query_set in query_set_list:
-                    managed_query_sets.append((group,query_set.__iter__()))
-                    latest_value.append(None)
-        current = [x[1].__next__() for x in managed_query_sets]
-        oldest = min(current, key=lambda x:x[0] )[0]
-
-        while True:
-            result = defaultdict(list)
-            result['time']  = oldest
-            index = 0
-            for value, query in zip(current, managed_query_sets):
-
-                if value[0] == oldest:
-                    result[query[0]].append(value[1])
-                    latest_value[index] = value[1]
-                else:
-                    result[query[0]].append(latest_value[index])
-
-                index += 1
-
-            yield result
-            new_current = []
-            for value, query in zip(current, managed_query_sets):
-                if value[0] != oldest:
-                    new_current.append(value)
-                else:
-                    try:
-                        new_current.append(query[1].__next__())
-                    except StopIteration:
-                        new_current.append((MAX_DATE,None))
-            current = new_current
-            oldest = min(current, key=lambda x:x[0] )[0]
-            if oldest == MAX_DATE:
-                break
-
-
-
+        return merge_series(args, FILL, as_tuples)
+
+    def merge_groups(self, *group_names, drop_partial_lines=True,
+                     as_tuples=False, in_database=True, batch_size=2000):
+        '''Merge the series of the named input groups by time.
+
+        Rows are as returned from merge() given the get_query_sets()
+        results of each group. If in_database is True, the series are
+        joined on their times by the database in a single query, which
+        is read batch_size rows at a time, using a server-side cursor on
+        PostgreSQL. A join would repeat the rows of times repeated in a
+        series, so series with repeated times, checked by one grouping
+        query per data table, are merged in Python, as are data maps
+        using chunk storage.
+        '''
+        sensors = self._merge_sensors(group_names) if in_database else None
+        if sensors is None:
+            return self.merge(*[self.get_query_sets(name, wrap_for_merge=True)
+                                for name in group_names],
+                              drop_partial_lines=drop_partial_lines,
+                              as_tuples=as_tuples)
+        layout, start = [], 0
+        for name in group_names:
+            count = len(self.topic_map[name])
+            layout.append((name, slice(start, start + count)))
+            start += count
+        sql, params, using = self._merge_sql(sensors, drop_partial_lines)
+        rows = ((_to_datetime(row[0]), list(row[1:])) for row in
+                _iter_query(sql, params, using, batch_size))
+        return format_rows(rows, layout, as_tuples)
+
+    def _merge_sensors(self, group_names):
+        '''Return the sensors of the groups or None if not joinable.'''
+        topics = [topic for name in group_names
+                  for topic in self.topic_map[name]]
+        sensors = {sensor.name: sensor for sensor in models.Sensor.objects
+                   .filter(map_id=self.datamap_id, name__in=topics)
+                   .select_related('map')}
+        if not topics or len(sensors) != len(set(topics)):
+            return None
+        storage = sensors[topics[0]].map.storage
+        if (storage == models.DataMap.CHUNKS or
+                (storage == models.DataMap.PARTITIONED and
+                 self.dataset_id is None)):
+            return None
+        sensors = [sensors[topic] for topic in topics]
+        if self._repeats_times(sensors):
+            return None
+        return sensors
+
+    def _repeats_times(self, sensors):
+        '''Return whether any of the series repeats a time.'''
+        using = router.db_for_read(models.Sensor, instance=sensors[0])
+        by_model = collections.defaultdict(list)
+        for sensor in sensors:
+            model = sensor.data_class
+            if sensor.map.storage == models.DataMap.PARTITIONED:
+                model = model.partition(self.dataset_id, using=using)
+            by_model[model].append(sensor.pk)
+        for model, sensor_ids in by_model.items():
+            queryset = model.objects.using(using).filter(
+                    sensor_id__in=sensor_ids)
+            if self.dataset_id is not None:
+                queryset = queryset.filter(ingest_id=self.dataset_id)
+            repeated = queryset.values('sensor', 'time').annotate(
+                    rows=dj_models.Count('pk')).filter(rows__gt=1)
+            if list(repeated.values_list('sensor')[:1]):
+                return True
+        return False
+
+    def _merge_sql(self, sensors, drop_partial_lines):
+        '''Return the SQL, parameters and database joining the sensors.'''
+        using = router.db_for_read(models.Sensor, instance=sensors[0])
+        qn = connections[using].ops.quote_name
+        tables, conditions = [], []
+        for i, sensor in enumerate(sensors):
+            model = sensor.data_class
+            if sensor.map.storage == models.DataMap.PARTITIONED:
+                model = model.partition(self.dataset_id, using=using)
+            opts = model._meta
+            column = lambda name: '{}.{}'.format(
+                    't{}'.format(i), qn(opts.get_field(name).column))
+            condition = ['{} = %s'.format(column('sensor'))]
+            params = [sensor.pk]
+            if self.dataset_id is not None:
+                condition.append('{} = %s'.format(column('ingest')))
+                params.append(self.dataset_id)
+            tables.append((qn(opts.db_table), column('time'), column('value')))
+            conditions.append((' AND '.join(condition), params))
+        values = ', '.join(value for _, _, value in tables)
+        params = []
+        if drop_partial_lines:
+            first_table, time, _ = tables[0]
+            joins = []
+            for i, (table, other, _) in enumerate(tables[1:], 1):
+                condition, condition_params = conditions[i]
+                joins.append('INNER JOIN {} t{} ON {} = {} AND {}'.format(
+                        table, i, other, time, condition))
+                params.extend(condition_params)
+            params.extend(conditions[0][1])
+            sql = 'SELECT {}, {} FROM {} t0 {} WHERE {} ORDER BY {}'.format(
+                    time, values, first_table, ' '.join(joins),
+                    conditions[0][0], time)
+        else:
+            selects, joins = [], []
+            for i, (table, time, _) in enumerate(tables):
+                condition, condition_params = conditions[i]
+                selects.append('SELECT {} AS merge_time FROM {} t{} '
+                               'WHERE {}'.format(time, table, i, condition))
+                params.extend(condition_params)
+            for i, (table, time, _) in enumerate(tables):
+                condition, condition_params = conditions[i]
+                joins.append('LEFT JOIN {} t{} ON {} = u.merge_time '
+                             'AND {}'.format(table, i, time, condition))
+                params.extend(condition_params)
+            # As in the Python merge, an empty series suppresses all rows.
+            exists = []
+            for i, (table, _, _) in enumerate(tables):
+                condition, condition_params = conditions[i]
+                exists.append('EXISTS (SELECT 1 FROM {} t{} WHERE {})'.format(
+                        table, i, condition))
+                params.extend(condition_params)
+            sql = ('SELECT u.merge_time, {} FROM ({}) u {} WHERE {} '
+                   'ORDER BY u.merge_time'.format(
+                       values, ' UNION '.join(selects), ' '.join(joins),
+                       ' AND '.join(exists)))
+        return sql, params, using
 
     def get_query_sets(self, group_name,
                        order_by='time',
@@ -333,7 +454,54 @@ class DatabaseInput:
 
         returns => {group:result list} if wrap_for_merge is True
         otherwise returns => result list
+
+        Ungrouped series are read TIMESERIES_BATCH_SIZE rows at a time
+        when iterated, so are read again if iterated again. Grouped
+        series are returned as lists and, with aggregated values, are
+        kept in the cache.
         """
+        qs = self._query_sets(group_name, filter_, exclude)
+        topics = self.topic_map[group_name]
+
+        if group_by is not None:
+            if group_by != 'all':
+                pass
+#                 qs = (x.group_by(group_by, group_by_aggregation) for x in qs)
+            else:
+                def aggregate(x):
+                    return x.aggregate(value=group_by_aggregation('value'))['value']
+                return [self._cached(('aggregate', topic, filter_, exclude,
+                                      group_by_aggregation),
+                                     lambda x=x: aggregate(x))
+                        for topic, x in zip(topics, qs)]
+            def series(x):
+                return list(x.order_by(order_by).timeseries(
+                        trunc_kind=group_by, aggregate=group_by_aggregation))
+            # Copies are returned so the cached lists are not modified.
+            result = [list(self._cached(('series', topic, order_by, filter_,
+                                         exclude, group_by,
+                                         group_by_aggregation),
+                                        lambda x=x: series(x)))
+                      for topic, x in zip(topics, qs)]
+            return {group_name:result} if wrap_for_merge else result
+
+        result = [x.order_by(order_by).timeseries(trunc_kind=group_by,
+                                        aggregate=group_by_aggregation,
+                                        batch_size=proj_settings.TIMESERIES_BATCH_SIZE)
+                  for x in qs]
+
+        return {group_name:result} if wrap_for_merge else result
+
+    def _cached(self, key, load):
+        '''Return the value cached for key, or load() if not hashable.'''
+        try:
+            key = _freeze(key)
+        except TypeError:
+            return load()
+        return self.cache.get(key, load)
+
+    def _query_sets(self, group_name, filter_=None, exclude=None):
+        '''Return the filtered data of each topic of a group.'''
         qs = (x() for _,x in self.data_map[group_name])
 
         if self.dataset_id is not None:
@@ -345,17 +513,53 @@ class DatabaseInput:
         if exclude is not None:
             qs = (x.exclude(**exclude) for x in qs)
 
-        if group_by is not None:
-            if group_by != 'all':
-                pass
-#                 qs = (x.group_by(group_by, group_by_aggregation) for x in qs)
-            else:
-                return [x.aggregate(value=group_by_aggregation('value'))['value'] for x in qs]
-
-        result = [x.order_by(order_by).timeseries(trunc_kind=group_by,
-                                        aggregate=group_by_aggregation) for x in qs]
-
-        return {group_name:result} if wrap_for_merge else result
+        return qs
+
+    def get_arrays(self, group_name, filter_=None, exclude=None,
+                   batch_size=10000):
+        '''Return the series of each topic of a group as NumPy arrays.
+
+        Returns a list of SeriesArrays of datetime64[ns] UTC times,
+        float64 values, NaN where null, and a mask of the null values,
+        in the order of the topics. filter_ and exclude are as for
+        get_query_sets(). The times, as microseconds, and values are
+        selected by the database and read batch_size rows at a time
+        into the arrays, which are allocated from the statistics of the
+        dataset when unfiltered. Boolean values are read as 0 and 1;
+        string sensors are not supported. The arrays are kept in the
+        cache, so are shared and read-only.
+        '''
+        topics = self.topic_map[group_name]
+        sizes = [0] * len(topics)
+        if filter_ is None and exclude is None:
+            sizes = [stats.count + stats.null_count if stats else 0
+                     for stats in self.get_statistics(group_name)]
+        if any(self._data_types.get(topic) == models.Sensor.STRING
+               for topic in topics):
+            raise ValueError('string sensors cannot be read as arrays')
+        return [self._cached(('arrays', topic, filter_, exclude),
+                             lambda qs=qs, size=size: _read_arrays(
+                                 qs, size, batch_size))
+                for topic, qs, size in zip(
+                    topics, self._query_sets(group_name, filter_, exclude),
+                    sizes)]
+
+    def get_frame(self, *group_names, drop_partial_lines=True, filter_=None,
+                  exclude=None, batch_size=10000):
+        '''Return the series of several groups aligned on their times.
+
+        Returns a FrameArrays of the times, as for merge(), and 2-D
+        values and nulls with a column for each topic of the groups, in
+        order, named by the (group, topic) pairs in columns. Values
+        missing at a time are NaN and null.
+        '''
+        series, columns = [], []
+        for name in group_names:
+            series.extend(self.get_arrays(name, filter_=filter_,
+                                          exclude=exclude,
+                                          batch_size=batch_size))
+            columns.extend((name, topic) for topic in self.topic_map[name])
+        return arrays.align(series, columns, drop_partial_lines)
 
 #     def timeseries(self, *, trunc_kind=None, aggregate=None):
 #         '''Return timeseries pairs from the table.
@@ -366,6 +570,111 @@ class DatabaseInput:
 #         aggregation method and grouped by the time.
 #         '''
 
+def _to_datetime(value):
+    '''Convert a time read by a raw query, a string on SQLite.'''
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+
+def _read_arrays(qs, size, batch_size):
+    '''Read the series of a queryset of sensor data into arrays.'''
+    builder = arrays.ArrayBuilder(size)
+    query = _array_query(qs.order_by('time'))
+    if query is None:
+        rows = iter(qs.order_by('time').timeseries(batch_size=batch_size))
+        blocks = iter(lambda: list(itertools.islice(rows, batch_size)), [])
+        extend = builder.extend_pairs
+    else:
+        blocks = _iter_blocks(*query, batch_size=batch_size)
+        extend = builder.extend
+    for block in blocks:
+        extend(block)
+    series = builder.finish()
+    for array in series:
+        array.flags.writeable = False
+    return series
+
+
+# Expressions selecting the microseconds since the epoch of a UTC time,
+# stored as text with six digit microseconds on SQLite. The '%s' format
+# of strftime would be taken for a query parameter, so seconds are those
+# of the Julian day of midnight, exact, plus those of the time of day.
+_EPOCH_MICROSECONDS = {
+    'sqlite': ("(CAST((julianday({0}, 'start of day') - 2440587.5) * 86400 "
+               "AS INTEGER) + CAST(strftime('%%H', {0}) AS INTEGER) * 3600 + "
+               "CAST(strftime('%%M', {0}) AS INTEGER) * 60 + "
+               "CAST(strftime('%%S', {0}) AS INTEGER)) * 1000000 + "
+               "CAST(substr({0}, 21, 6) AS INTEGER)"),
+    'postgresql': 'CAST(EXTRACT(EPOCH FROM {0}) * 1000000 AS BIGINT)',
+}
+
+
+def _array_query(queryset):
+    '''Return the SQL, parameters and database reading a queryset of
+    sensor data as (microseconds, null, value) rows.
+
+    Returns None for querysets not read through SQL, such as those of
+    chunk storage, or databases without an epoch expression.
+    '''
+    if not isinstance(queryset, models.SensorDataQuerySet):
+        return None
+    connection = connections[queryset.db]
+    epoch = _EPOCH_MICROSECONDS.get(connection.vendor)
+    if epoch is None:
+        return None
+    qn = connection.ops.quote_name
+    opts = queryset.model._meta
+    column = lambda name: '{}.{}'.format(
+            qn(opts.db_table), qn(opts.get_field(name).column))
+    value = column('value')
+    if isinstance(opts.get_field('value'), dj_models.BooleanField):
+        number = 'CASE WHEN {} THEN 1.0 ELSE 0.0 END'.format(value)
+    else:
+        number = 'COALESCE({}, 0)'.format(value)
+    select = collections.OrderedDict([
+        ('array_time', epoch.format(column('time'))),
+        ('array_null', 'CASE WHEN {} IS NULL THEN 1 ELSE 0 END'.format(value)),
+        ('array_value', number),
+    ])
+    queryset = queryset.extra(select=select).values_list(*select)
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    return sql, params, queryset.db
+
+
+def _iter_query(sql, params, using, batch_size):
+    '''Yield the rows of a query, reading batch_size rows at a time.'''
+    for rows in _iter_blocks(sql, params, using, batch_size):
+        yield from rows
+
+
+def _iter_blocks(sql, params, using, batch_size):
+    '''Yield the rows of a query in lists of up to batch_size rows.'''
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        # Named cursors are held server-side. Declared WITH HOLD, they
+        # outlive the transaction declaring them, so no transaction is
+        # held open while the rows are read and the caller writes.
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(
+                name='openeis_merge_{}'.format(next(_cursor_ids)),
+                withhold=True)
+        try:
+            cursor.execute(sql, params)
+            yield from iter(lambda: cursor.fetchmany(batch_size), [])
+        finally:
+            cursor.close()
+        return
+    cursor = connection.cursor()
+    try:
+        cursor.execute(sql, params)
+        yield from iter(lambda: cursor.fetchmany(batch_size), [])
+    finally:
+        cursor.close()
+
+
 if __name__ == '__main__':
 
     args = []
@@ -65,7 +65,7 @@ from django.core.management.color import no_style
 from django.db import connections, models, transaction
 
 
-__all__ = ['table_exists', 'create_table', 'create_model']
+__all__ = ['table_exists', 'create_table', 'drop_table', 'create_model']
 
 
 def table_exists(model, db='default'):
@@ -123,6 +123,14 @@ def create_table(model, db='default'):
                 cursor.execute(sql)
 
 
+def drop_table(table, db='default'):
+    '''Drop the named table from the database.'''
+    connection = connections[db]
+    with transaction.commit_on_success_unless_managed(using=db):
+        connection.cursor().execute(
+                'DROP TABLE ' + connection.ops.quote_name(table))
+
+
 # Field type name to Django model type mapping.
 _fields = {
     'boolean': lambda **kwargs: models.NullBooleanField(**kwargs),
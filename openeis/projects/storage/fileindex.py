@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Persistent index of a data file's layout and contents.
+
+Previewing an uploaded file needs its dialect, header, first rows and
+timestamp format, and each preview previously sniffed and re-read the
+file to find them. build_index() reads a file once, typically in a
+background job after upload, and saves what it learns in a JSON sidecar
+file next to it. read_index() returns the saved index, or None if it is
+missing or the file has changed since it was built.
+
+The index is a dictionary with the following keys:
+
+  size, mtime - Size and modification time of the indexed file.
+  dialect - CSV dialect attributes, suitable for csv.reader().
+  has_header, header - Whether a header was detected, and its columns.
+  head - The first head_rows rows, including the header, if any.
+  head_end - Byte offset following the last row in head.
+  rows - Number of data rows, excluding the header.
+  sample_interval, row_offsets - Byte offset of the start of every
+      sample_interval-th data row, starting with the first.
+  timestamp - Format, first and last value of the first column, if it
+      holds timestamps, or None.
+  column_types - Guessed data type of each column.
+'''
+
+import csv
+import json
+import os
+
+from .csvfile import CSVFile
+from .ingest import (BooleanColumn, DateTimeColumn, FloatColumn,
+                     IngestError, IntegerColumn)
+
+
+__all__ = ['INDEX_SUFFIX', 'build_index', 'write_index', 'read_index',
+           'index_path', 'csv_options']
+
+INDEX_SUFFIX = '.index'
+_VERSION = 1
+_DIALECT_ATTRS = ('delimiter', 'doublequote', 'escapechar', 'lineterminator',
+                  'quotechar', 'quoting', 'skipinitialspace')
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def _guess_type(values):
+    '''Return the most specific data type parsing all non-empty values.'''
+    values = [value for value in values if value.strip()]
+    if not values:
+        return None
+    for data_type, parser in [('integer', IntegerColumn(0)),
+                              ('float', FloatColumn(0)),
+                              ('boolean', BooleanColumn(0))]:
+        if not any(isinstance(parser.parse(value), IngestError)
+                   for value in values):
+            return data_type
+    column = DateTimeColumn(0)
+    column.prepare([[value] for value in values])
+    if not any(isinstance(column([value]), IngestError) for value in values):
+        return 'datetime'
+    return 'string'
+
+
+def _timestamp_format(column):
+    parse = column._parse
+    if parse is None:
+        return None
+    try:
+        return parse.format
+    except AttributeError:
+        # The ISO 8601 and UNIX epoch parsers.
+        return parse.__name__.strip('_').replace('_parser', '')
+
+
+def build_index(path, *, head_rows=31, sample_interval=1000,
+                type_sample_size=1000):
+    '''Read the file at path and return its index.
+
+    head_rows should be at least one more than the FILE_HEAD_ROWS_MAX
+    setting so that the head view can be answered with a header.
+    '''
+    stat = os.stat(path)
+    with open(path, 'rb') as file:
+        csv_file = CSVFile(file)
+        dialect = {attr: getattr(csv_file.dialect, attr)
+                   for attr in _DIALECT_ATTRS}
+        header = next(csv_file, []) if csv_file.has_header else []
+        head = [header] if csv_file.has_header else []
+        head_end = position = csv_file.position
+        sample, offsets = [], []
+        rows, first, last = 0, None, None
+        for row in csv_file:
+            if len(head) < head_rows:
+                head.append(row)
+                head_end = csv_file.position
+            if row:
+                if not rows % sample_interval:
+                    offsets.append(position)
+                if rows < type_sample_size:
+                    sample.append(row)
+                if first is None:
+                    first = row[0]
+                last = row[0]
+                rows += 1
+            position = csv_file.position
+    width = max([len(row) for row in sample] or [0])
+    column_types = [_guess_type([row[i] for row in sample if i < len(row)])
+                    for i in range(width)]
+    timestamp = None
+    if column_types and column_types[0] == 'datetime':
+        column = DateTimeColumn(0)
+        column.prepare(sample[:100])
+        timestamp = {'format': _timestamp_format(column),
+                     'first': first, 'last': last}
+    return {
+        'version': _VERSION,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'dialect': dialect,
+        'has_header': csv_file.has_header,
+        'header': header,
+        'head': head,
+        'head_end': head_end,
+        'rows': rows,
+        'sample_interval': sample_interval,
+        'row_offsets': offsets,
+        'timestamp': timestamp,
+        'column_types': column_types,
+    }
+
+
+def write_index(path, index):
+    '''Save index in the sidecar file of the file at path.'''
+    sidecar = index_path(path)
+    with open(sidecar + '.tmp', 'w') as file:
+        json.dump(index, file, separators=(',', ':'))
+    os.replace(sidecar + '.tmp', sidecar)
+
+
+def read_index(path):
+    '''Return the saved index of the file at path or None.
+
+    None is returned if there is no index or if the file has changed
+    since it was indexed.
+    '''
+    try:
+        with open(index_path(path)) as file:
+            index = json.load(file)
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    if (index.get('version') != _VERSION or index.get('size') !=
+            stat.st_size or index.get('mtime') != stat.st_mtime):
+        return None
+    return index
+
+
+
+def csv_options(index):
+    '''Return CSVFile keyword arguments to skip sniffing the file.'''
+    dialect = type('IndexedDialect', (csv.Dialect,), dict(index['dialect']))
+    return {'dialect': dialect, 'has_header': index['has_header']}
@@ -56,13 +56,20 @@
 '''Ingest CSV files and parse them according to a sensor defintion.'''
 
 from collections import namedtuple
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import itertools
 import json
 import os
+import re
 import sys
 import pytz
 import dateutil.parser
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from .csvfile import CSVFile
 
 
@@ -75,13 +82,14 @@ class IngestError(ValueError):
         if exc is not None:
             self.__cause__ = exc
 
+    def __reduce__(self):
+        # Allow errors to be passed between ingest worker processes.
+        return (self.__class__, (self.value, self.column))
+
     @property
     def column_num(self):
         '''Get the one-based index of the column source(s).'''
-        column = self.column.column
-        if not isinstance(column, int):
-            return [i + 1 for i in column]
-        return column + 1
+        return self.column.column_num
 
     @property
     def data_type(self):
@@ -116,6 +124,40 @@ class BaseColumn:
         self.column = column
         self.default = default
 
+    @property
+    def column_num(self):
+        '''Get the one-based index of the column source(s).'''
+        column = self.column
+        if not isinstance(column, int):
+            return [i + 1 for i in column]
+        return column + 1
+
+    def __call__(self, row):
+        return self.parse(row[self.column])
+
+    def convert(self, columns):
+        '''Convert the values of this column in a block of rows.
+
+        columns is a sequence of the transposed columns of the block.
+        Returns a 3-tuple of (values, nulls, errors) where values is a
+        sequence of the converted values, nulls is a boolean mask of the
+        values which are None, and errors is a sparse list of (index,
+        message) 2-tuples for the values which could not be converted.
+        Subclasses may override this to convert blocks more efficiently.
+        '''
+        return self._convert_values(columns[self.column])
+
+    def _convert_values(self, raw_values):
+        parse = self.parse
+        values, errors = [], []
+        for i, raw_value in enumerate(raw_values):
+            value = parse(raw_value)
+            if isinstance(value, IngestError):
+                errors.append((i, str(value)))
+                value = None
+            values.append(value)
+        return values, [value is None for value in values], errors
+
     def __repr__(self, *args, **kwargs):
         options = ['']
         if self.default:
@@ -130,6 +172,96 @@ class BaseColumn:
                                            for opt in options))
 
 
+_ISO_RE = re.compile(
+    r'(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6}))?)?)?'
+    r'\s*(Z|[+-]\d{2}(?::?\d{2})?)?$')
+_EPOCH_RE = re.compile(r'\d{9,10}(?:\.\d*)?$')
+
+# Regular expressions and datetime() argument positions for the strptime()
+# directives which may be compiled into a fast parser.
+_DIRECTIVES = {
+    'Y': (r'(\d{4})', 0), 'm': (r'(\d{1,2})', 1), 'd': (r'(\d{1,2})', 2),
+    'H': (r'(\d{1,2})', 3), 'M': (r'(\d{1,2})', 4), 'S': (r'(\d{1,2})', 5),
+    'f': (r'(\d{1,6})', 6), 'y': (r'(\d{2})', 0),
+}
+
+# Formats tried, in order, when inferring the format of timestamps
+_COMMON_FORMATS = [
+    '%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S', '%m/%d/%y %H:%M',
+    '%m/%d/%y %H:%M:%S', '%Y/%m/%d %H:%M', '%Y/%m/%d %H:%M:%S',
+    '%m-%d-%Y %H:%M', '%m-%d-%Y %H:%M:%S', '%m/%d/%Y', '%Y/%m/%d',
+]
+
+
+def _iso_parser(value):
+    match = _ISO_RE.match(value)
+    if match is None:
+        raise ValueError('not an ISO 8601 timestamp: {!r}'.format(value))
+    year, month, day, hour, minute, second, fraction, tz = match.groups()
+    dt = datetime(int(year), int(month), int(day), int(hour or 0),
+                  int(minute or 0), int(second or 0),
+                  int(fraction.ljust(6, '0')) if fraction else 0)
+    if tz:
+        if tz == 'Z':
+            return dt.replace(tzinfo=pytz.utc)
+        offset = tz[1:].replace(':', '')
+        offset = timedelta(hours=int(offset[:2]), minutes=int(offset[2:] or 0))
+        dt = dt.replace(tzinfo=timezone(-offset if tz[0] == '-' else offset))
+    return dt
+
+
+def _epoch_parser(value):
+    if _EPOCH_RE.match(value) is None:
+        raise ValueError('not an epoch timestamp: {!r}'.format(value))
+    return datetime.utcfromtimestamp(float(value)).replace(tzinfo=pytz.utc)
+
+
+def compile_format(fmt):
+    '''Compile a strptime() format into a faster parsing function.
+
+    Only formats made up of the numeric directives %Y, %y, %m, %d, %H,
+    %M, %S, and %f and literal characters can be compiled; None is
+    returned for all others. The returned function raises ValueError
+    for values which do not match, just like strptime().
+    '''
+    pattern, positions = [], []
+    tokens = re.findall(r'%.|\s+|[^%\s]+', fmt)
+    for token in tokens:
+        if token == '%%':
+            pattern.append('%')
+        elif token[0] == '%':
+            try:
+                regex, index = _DIRECTIVES[token[1]]
+            except KeyError:
+                return None
+            pattern.append(regex)
+            positions.append((index, token[1]))
+        elif token.isspace():
+            pattern.append(r'\s+')
+        else:
+            pattern.append(re.escape(token))
+    if not {'Y', 'y'} & {name for _, name in positions}:
+        return None
+    match = re.compile(''.join(pattern) + '$').match
+    def parse(value):
+        result = match(value)
+        if result is None:
+            raise ValueError('time data {!r} does not match format '
+                             '{!r}'.format(value, fmt))
+        args = [1900, 1, 1, 0, 0, 0, 0]
+        for (index, name), text in zip(positions, result.groups()):
+            if name == 'f':
+                args[index] = int(text.ljust(6, '0'))
+            elif name == 'y':
+                year = int(text)
+                args[index] = year + (2000 if year < 69 else 1900)
+            else:
+                args[index] = int(text)
+        return datetime(*args)
+    parse.format = fmt
+    return parse
+
+
 class DateTimeColumn(BaseColumn):
     '''Parse columns of date/time data.
 
@@ -138,6 +270,14 @@ class DateTimeColumn(BaseColumn):
     (separated by sep -- a space by default) before being parsed.
     Multiple formatting strings may be attempted by passing them via the
     formats argument. Final parsing is attempted by dateutil.
+
+    Because trying each format in turn is slow, a specialized parser is
+    chosen by prepare(), using the first rows of the file, or from the
+    first value parsed. The given formats are compiled if possible and
+    otherwise ISO 8601, common formats, and epoch seconds are tried. The
+    usual parsing is used for any value the fast parser rejects. UTC
+    offsets are cached for each hour of local time to avoid localizing
+    every value.
     '''
 
     data_type = 'datetime'
@@ -149,27 +289,121 @@ class DateTimeColumn(BaseColumn):
         self.sep = sep
         self.tzinfo = tzinfo
         self.time_offset = time_offset
+        self._columns = [column] if isinstance(column, int) else column
+        self._offset = (timedelta(seconds=float(time_offset))
+                        if time_offset else None)
+        self._parse = None
+        self._prepared = False
+        self._utcoffsets = {}
+
+    def _localize(self, dt):
+        '''Convert a naive local time to UTC using cached offsets.'''
+        if self.tzinfo is pytz.utc:
+            return dt.replace(tzinfo=pytz.utc)
+        key = dt.replace(minute=0, second=0, microsecond=0)
+        try:
+            utcoffset = self._utcoffsets[key]
+        except KeyError:
+            if len(self._utcoffsets) >= 10000:
+                self._utcoffsets.clear()
+            utcoffset = self._utcoffsets[key] = (
+                    self.tzinfo.localize(key).utcoffset())
+        return (dt - utcoffset).replace(tzinfo=pytz.utc)
 
     def _ensure_tz(self, dt):
-        if not dt.tzinfo and self.tzinfo:
-            dt = self.tzinfo.localize(dt)
-        if self.time_offset:
-            dt += timedelta(seconds=self.time_offset)
-        return dt.astimezone(pytz.utc)
+        if dt.tzinfo:
+            dt = dt.astimezone(pytz.utc)
+        elif self.tzinfo:
+            dt = self._localize(dt)
+        else:
+            dt = dt.replace(tzinfo=pytz.utc)
+        if self._offset:
+            dt += self._offset
+        return dt
+
+    def _raw_value(self, row):
+        if len(self._columns) == 1:
+            return row[self._columns[0]].strip()
+        return self.sep.join([row[i].strip() for i in self._columns])
+
+    def _parse_slow(self, raw_value):
+        for fmt in self.formats:
+            try:
+                return datetime.strptime(raw_value, fmt)
+            except ValueError:
+                pass
+        return dateutil.parser.parse(raw_value)
+
+    def _infer(self, values):
+        '''Return the fastest parser which handles all the values.'''
+        def check(parse, expect):
+            try:
+                return all(parse(v) == e for v, e in zip(values, expect))
+            except (ValueError, TypeError, OverflowError):
+                return False
+        if not values:
+            return None
+        expected = []
+        for value in values:
+            try:
+                expected.append(self._parse_slow(value))
+            except (ValueError, TypeError, OverflowError):
+                expected.append(None)
+        if all(dt is None for dt in expected):
+            if all(_EPOCH_RE.match(value) for value in values):
+                return _epoch_parser
+            return None
+        values = [v for v, dt in zip(values, expected) if dt is not None]
+        expected = [dt for dt in expected if dt is not None]
+        candidates = [compile_format(fmt) for fmt in self.formats]
+        if not self.formats:
+            candidates.append(_iso_parser)
+            candidates.extend(compile_format(fmt) for fmt in _COMMON_FORMATS)
+        for parse in candidates:
+            if parse is not None and check(parse, expected):
+                return parse
+        return None
+
+    def prepare(self, rows):
+        '''Choose a fast parser using a sample of rows.'''
+        values = []
+        for row in rows:
+            try:
+                value = self._raw_value(row)
+            except IndexError:
+                continue
+            if value:
+                values.append(value)
+        self._parse = self._infer(values)
+        self._prepared = bool(values)
 
     def __call__(self, row):
-        columns = [self.column] if isinstance(self.column, int) else self.column
-        raw_value = self.sep.join([row[i].strip() for i in columns])
-        if not raw_value.strip():
+        return self.parse(self._raw_value(row))
+
+    def convert(self, columns):
+        if len(self._columns) == 1:
+            raw_values = [value.strip() for value in columns[self._columns[0]]]
+        else:
+            raw_values = [self.sep.join([value.strip() for value in values])
+                          for values in zip(*[columns[i]
+                                              for i in self._columns])]
+        return self._convert_values(raw_values)
+
+    def parse(self, raw_value):
+        if not raw_value:
             return self.default
-        for fmt in self.formats:
+        if not self._prepared:
+            self._parse = self._infer([raw_value])
+            self._prepared = True
+        parse = self._parse
+        if parse is not None:
             try:
-                return self._ensure_tz(datetime.strptime(raw_value, fmt))
-            except ValueError:
+                return self._ensure_tz(parse(raw_value))
+            except (ValueError, TypeError, OverflowError):
                 pass
         try:
-            return self._ensure_tz(dateutil.parser.parse(raw_value))
-        except (ValueError, TypeError):
+            return self._ensure_tz(self._parse_slow(raw_value))
+        except (ValueError, TypeError, OverflowError):
             pass
         return ParseError(raw_value, self)
 
@@ -183,8 +417,8 @@ class StringColumn(BaseColumn):
 
     data_type = 'string'
 
-    def __call__(self, row):
-        return row[self.column] or self.default
+    def parse(self, raw_value):
+        return raw_value or self.default
 
 
 class IntegerColumn(BaseColumn):
@@ -202,8 +436,7 @@ class IntegerColumn(BaseColumn):
         self.minimum = minimum
         self.maximum = maximum
 
-    def __call__(self, row):
-        raw_value = row[self.column]
+    def parse(self, raw_value):
         if not raw_value:
             return self.default
         base = 10
@@ -224,6 +457,16 @@ class IntegerColumn(BaseColumn):
             return OutOfRangeError(value, self)
         return value
 
+    def convert(self, columns):
+        if numpy is None:
+            return super().convert(columns)
+        raw_values = columns[self.column]
+        # Let parse() handle numbers with a base prefix or leading zeros,
+        # which are the only strings sorting between '0' and '1'.
+        if any('0' < value < '1' for value in raw_values):
+            return super().convert(columns)
+        return _convert_numeric(self, raw_values, int, numpy.int64)
+
     def __repr__(self):
         return super().__repr__('minimum', 'maximum')
 
@@ -238,8 +481,7 @@ class FloatColumn(BaseColumn):
         self.minimum = minimum
         self.maximum = maximum
 
-    def __call__(self, row):
-        raw_value = row[self.column]
+    def parse(self, raw_value):
         if not raw_value:
             return self.default
         try:
@@ -251,6 +493,12 @@ class FloatColumn(BaseColumn):
             return OutOfRangeError(value, self)
         return value
 
+    def convert(self, columns):
+        if numpy is None:
+            return super().convert(columns)
+        return _convert_numeric(
+                self, columns[self.column], float, numpy.float64)
+
     def __repr__(self):
         return super().__repr__('minimum', 'maximum')
 
@@ -271,8 +519,7 @@ class BooleanColumn(BaseColumn):
         'f': False
     }
 
-    def __call__(self, row):
-        raw_value = row[self.column]
+    def parse(self, raw_value):
         if not raw_value:
             return self.default
         try:
@@ -284,11 +531,91 @@ class BooleanColumn(BaseColumn):
         except KeyError:
             return ParseError(raw_value, self)
 
+    def convert(self, columns):
+        # Boolean columns have very few distinct values, so parse each
+        # distinct value once and map the results back to the rows.
+        if numpy is None:
+            return super().convert(columns)
+        raw_values = columns[self.column]
+        count = len(raw_values)
+        parsed = {value: self.parse(value) for value in set(raw_values)}
+        values = numpy.fromiter(
+                (value is True for value in map(parsed.get, raw_values)),
+                bool, count)
+        nulls = numpy.fromiter(
+                (not isinstance(value, bool)
+                 for value in map(parsed.get, raw_values)), bool, count)
+        errors = []
+        if any(isinstance(value, IngestError) for value in parsed.values()):
+            errors = [(i, str(parsed[value]))
+                      for i, value in enumerate(raw_values)
+                      if isinstance(parsed[value], IngestError)]
+        return values, nulls, errors
+
+
+def _convert_numeric(column, raw_values, convert, dtype):
+    '''Convert a sequence of strings to a NumPy array of numbers.
+
+    Falls back to per-value parsing if any value cannot be converted.
+    Values outside the column minimum and maximum are reported as errors.
+    '''
+    count = len(raw_values)
+    if '' in raw_values:
+        nulls = numpy.fromiter((not value for value in raw_values),
+                               bool, count)
+        raw_iter = (value or '0' for value in raw_values)
+    else:
+        nulls = numpy.zeros(count, dtype=bool)
+        raw_iter = raw_values
+    try:
+        values = numpy.fromiter(map(convert, raw_iter), dtype, count)
+    except (ValueError, OverflowError):
+        return column._convert_values(raw_values)
+    bad = numpy.zeros(count, dtype=bool)
+    if column.minimum:
+        bad |= values < column.minimum
+    if column.maximum:
+        bad |= values > column.maximum
+    bad &= ~nulls
+    errors = [(i, str(OutOfRangeError(values[i].item(), column)))
+              for i in numpy.flatnonzero(bad).tolist()]
+    if column.default is not None:
+        values[nulls] = column.default
+        nulls[:] = False
+    nulls |= bad
+    return values, nulls, errors
+
 
 Row = namedtuple('Row', 'line_num position columns')
 
 
-def ingest_file(file, columns):
+def _read_rows(file, columns, sample_size, position=0, line_num=0,
+               csv_options=None):
+    '''Return an iterator of (line_num, position, row) 3-tuples.
+
+    Reading starts at the given byte position, which must be the start
+    of a row, and line_num is the number of lines preceding it. The
+    first sample_size rows are read ahead and passed to the prepare()
+    method of those column parsers which have one. csv_options are
+    passed as keyword arguments to CSVFile.
+    '''
+    csv_file = CSVFile(file, **(csv_options or {}))
+    if position:
+        file.seek(position)
+    elif csv_file.has_header:
+        next(csv_file)
+    reader = csv_file.reader
+    rows = ((reader.line_num + line_num, csv_file.position, row)
+            for row in csv_file if row)
+    sample = list(itertools.islice(rows, sample_size))
+    for col in columns:
+        if hasattr(col, 'prepare'):
+            col.prepare([row for _, _, row in sample])
+    return itertools.chain(sample, rows)
+
+
+def ingest_file(file, columns, sample_size=100, position=0, line_num=0,
+                csv_options=None):
     '''Return a generator to parse a file according to a column map.
 
     The file should be seekable and opened for reading. columns should
@@ -298,12 +625,105 @@ def ingest_file(file, columns):
     attribute of a Row instances. Errors are indicated by the column
     value being an instance of IngestError. This function will not close
     the file object.
+
+    The first sample_size rows are read ahead and passed to the
+    prepare() method of those column parsers which have one.
+
+    To resume parsing a partially ingested file, pass the position and
+    line_num of the last row processed, as found in the Row instance.
+    csv_options may give the CSVFile dialect and has_header arguments
+    to avoid sniffing the file.
     '''
-    csv_file = CSVFile(file)
-    if csv_file.has_header:
-        next(csv_file)
-    return (Row(csv_file.reader.line_num, file.tell(),
-                [col(row) for col in columns]) for row in csv_file if row)
+    return (Row(line_num, position, [col(row) for col in columns])
+            for line_num, position, row in
+            _read_rows(file, columns, sample_size, position, line_num,
+                       csv_options))
+
+
+BlockError = namedtuple('BlockError', 'row column column_num message')
+
+
+class Block(namedtuple('Block',
+                       'line_nums positions columns nulls invalid errors')):
+    '''A block of rows parsed a column at a time.
+
+    line_nums and positions are lists with the line number and file
+    position of each row. columns, nulls, and invalid have an entry for
+    each column parser: the converted values, a boolean mask of null
+    values, and a boolean mask of values which failed to parse. errors
+    is a list of BlockError instances describing the invalid values.
+    Errors in value columns are not reported for rows with an invalid
+    timestamp, matching the row-at-a-time behavior of ingestion.
+    '''
+
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.line_nums)
+
+    def series(self, index):
+        '''Return lists of times and values for the column at index.
+
+        Rows with a missing or invalid timestamp or an invalid value are
+        dropped and null values are returned as None.
+        '''
+        keep = ~(self.nulls[0] | self.invalid[0] | self.invalid[index])
+        times = self.columns[0]
+        values, nulls = self.columns[index], self.nulls[index]
+        if isinstance(values, numpy.ndarray):
+            values = values.tolist()
+        if nulls.any():
+            values = [None if null else value
+                      for value, null in zip(values, nulls.tolist())]
+        if keep.all():
+            return list(times), values
+        indexes = numpy.flatnonzero(keep).tolist()
+        return [times[i] for i in indexes], [values[i] for i in indexes]
+
+
+def _parse_block(columns, rows):
+    line_nums, positions, raw_rows = zip(*rows)
+    width = max(len(row) for row in raw_rows)
+    raw_columns = list(zip(*[row if len(row) == width else
+                             row + [''] * (width - len(row))
+                             for row in raw_rows]))
+    values, nulls, invalid, errors = [], [], [], []
+    for index, col in enumerate(columns):
+        try:
+            converted, null, bad = col.convert(raw_columns)
+        except IndexError:
+            # Mapped column is beyond the end of every row in the block.
+            converted, null, bad = col._convert_values([''] * len(rows))
+        mask = numpy.zeros(len(rows), dtype=bool)
+        if bad:
+            mask[[i for i, _ in bad]] = True
+        values.append(converted)
+        nulls.append(numpy.asarray(null, dtype=bool))
+        invalid.append(mask)
+        errors.extend(BlockError(i, index, col.column_num, message)
+                      for i, message in bad
+                      if not index or not invalid[0][i])
+    errors.sort(key=lambda error: error.row)
+    return Block(list(line_nums), list(positions),
+                 values, nulls, invalid, errors)
+
+
+def ingest_file_blocks(file, columns, block_size=10000, sample_size=100,
+                       position=0, line_num=0, csv_options=None):
+    '''Return a generator to parse a file a block of rows at a time.
+
+    This works like ingest_file() but yields Block instances of up to
+    block_size rows, converting each column of the block at once using
+    the convert() method of the column parsers. Numeric and boolean
+    columns are converted using NumPy, which must be available.
+    '''
+    rows = _read_rows(file, columns, sample_size, position, line_num,
+                      csv_options)
+    while True:
+        block = list(itertools.islice(rows, block_size))
+        if not block:
+            break
+        yield _parse_block(columns, block)
 
 
 def get_sensor_parsers(datamap, files):
@@ -360,10 +780,13 @@ def get_sensor_parsers(datamap, files):
 IngestFile = namedtuple('IngestFile', 'name size sensors types rows time_zone time_offset')
 
 
-def ingest_files(datamap, files):
+def ingest_files(datamap, files, block_size=None):
     '''Iterate over each file_dict in files to return a file parser iterator.
 
     file_dict is a dictionary with file, time_offset, and time_zone as keys.
+    Optional position and line_num keys give the point in the file to
+    resume parsing from and csv_options the arguments used to read it
+    (see ingest_file()).
 
     Creates a generator to iterate over each file in files and yield
     IngestFile objects with the following attributes:
@@ -378,8 +801,13 @@ def ingest_files(datamap, files):
     row.columns representing columns of sensors.  The first item in
     sensors, types, and rows.columns is the timestamp and is represented
     by a sensor name of None.
+
+    If block_size is given and NumPy is available, rows is instead an
+    iterator of Block instances holding up to block_size rows each.
     '''
     columnmap = get_sensor_parsers(datamap, files)
+    if numpy is None:
+        block_size = None
     if hasattr(files, 'items'):
         files = sorted(files.items())
     for file_id, file_dict in files:
@@ -391,10 +819,38 @@ def ingest_files(datamap, files):
         except AttributeError:
             size = os.stat(file.fileno()).st_size
         names, types, columns = zip(*columnmap[file_id])
-        rows = ingest_file(file, columns)
+        start = {'position': file_dict.get('position', 0),
+                 'line_num': file_dict.get('line_num', 0),
+                 'csv_options': file_dict.get('csv_options')}
+        if block_size:
+            rows = ingest_file_blocks(file, columns, block_size, **start)
+        else:
+            rows = ingest_file(file, columns, **start)
         yield IngestFile(file_id, size, names, types, rows, time_zone, time_offset)
 
 
+def iter_batches(files, batch_size=1000):
+    '''Iterate over IngestFile objects yielding (file, rows) 2-tuples.
+
+    rows is a list of up to batch_size Row instances from file.rows.
+    This matches the output of ingest_files_parallel() in the parallel
+    module so that serial and parallel ingestion are handled alike.
+    Block instances from block parsing are yielded in place of rows.
+    '''
+    for file in files:
+        rows = []
+        for row in file.rows:
+            if isinstance(row, Block):
+                yield file, row
+                continue
+            rows.append(row)
+            if len(rows) >= batch_size:
+                yield file, rows
+                rows = []
+        if rows:
+            yield file, rows
+
+
 def iter_rows(file):
     for row in file.rows:
         columns = []
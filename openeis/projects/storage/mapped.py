@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Memory-mapped, read-only access to stored data files.
+
+Previewing and ingesting an uploaded file previously reopened it through
+Django's File wrappers and read it from the start each time. A
+MappedFile maps the file into memory once and hands out independent
+file-like views of the whole file or of a byte range without copying it.
+It also keeps a sampled index of line offsets, built on demand, used to
+find lines by number and to split a file into line-aligned byte ranges
+which may be parsed in parallel.
+
+Mapped files are shared between requests using mapped_file(), which
+caches the most recently used files.
+'''
+
+import bisect
+import collections
+import mmap
+import os
+import threading
+
+
+__all__ = ['MappedFile', 'mapped_file']
+
+
+class _RangeFile:
+    '''Binary file-like view of a byte range of a mapped file.
+
+    Reading starts at the beginning of the range and end of file occurs
+    at the end of the range. Positions are offsets within the whole file.
+    '''
+
+    def __init__(self, data, start, end):
+        self._data = data
+        self._start = start
+        self._end = end
+        self._pos = start
+        self.size = end
+
+    def read(self, size=-1):
+        pos = self._pos
+        end = self._end if size is None or size < 0 else min(
+                pos + size, self._end)
+        self._pos = max(end, pos)
+        return self._data[pos:end]
+
+    def readline(self, size=-1):
+        pos = self._pos
+        end = self._end if size is None or size < 0 else min(
+                pos + size, self._end)
+        newline = self._data.find(b'\n', pos, end)
+        if newline >= 0:
+            end = newline + 1
+        self._pos = max(end, pos)
+        return self._data[pos:end]
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._end
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class MappedFile:
+    '''Read-only memory map of a file with a sampled line index.
+
+    Line offsets are sampled every sample_interval lines and the index
+    is extended lazily, counting newlines a chunk at a time, so that only
+    the portion of the file needed by a request is scanned.
+    '''
+
+    def __init__(self, path, *, sample_interval=1024, chunk_size=1 << 22):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.size = os.fstat(file.fileno()).st_size
+            # Empty files cannot be mapped.
+            self._data = (mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                          if self.size else b'')
+        self.sample_interval = sample_interval
+        self.chunk_size = chunk_size
+        # _samples[i] is the offset of line i * sample_interval.
+        self._samples = [0]
+        # Offset up to which newlines have been counted and their number.
+        self._scanned, self._lines = 0, 0
+        self._complete = not self.size
+        self._lock = threading.Lock()
+
+    def open(self, start=0, end=None):
+        '''Return a file-like view of the bytes from start to end.'''
+        end = self.size if end is None else min(end, self.size)
+        return _RangeFile(self._data, start, end)
+
+    def find(self, sub, start=0, end=None):
+        '''Return the lowest offset of bytes sub, or -1 if not found.'''
+        return self._data.find(sub, start, self.size if end is None else end)
+
+    def _scan(self, lines=None, offset=None):
+        '''Extend the index past the given line number or byte offset.'''
+        data, interval = self._data, self.sample_interval
+        with self._lock:
+            while not self._complete and not (
+                    lines is not None and self._lines > lines or
+                    offset is not None and self._scanned > offset):
+                start = self._scanned
+                end = min(start + self.chunk_size, self.size)
+                count = data[start:end].count(b'\n')
+                next_sample = len(self._samples) * interval
+                pos = start
+                # Locate only the newlines ending a sampled line.
+                while self._lines + count >= next_sample:
+                    for _ in range(next_sample - self._lines):
+                        pos = data.find(b'\n', pos, end) + 1
+                    count -= next_sample - self._lines
+                    self._lines = next_sample
+                    if pos < self.size:
+                        self._samples.append(pos)
+                    next_sample += interval
+                self._lines += count
+                self._scanned = end
+                self._complete = end >= self.size
+
+    def line_count(self):
+        '''Return the number of lines in the file.'''
+        self._scan()
+        data = self._data
+        trailing = self.size and data[self.size - 1:self.size] != b'\n'
+        return self._lines + bool(trailing)
+
+    def line_offset(self, line):
+        '''Return the offset of the start of the zero-based line number.
+
+        Returns the file size if the file has fewer lines.
+        '''
+        self._scan(lines=line)
+        sample = line // self.sample_interval
+        if sample >= len(self._samples):
+            return self.size
+        pos = self._samples[sample]
+        data = self._data
+        for _ in range(line - sample * self.sample_interval):
+            pos = data.find(b'\n', pos) + 1
+            if not pos:
+                return self.size
+        return pos
+
+    def line_number(self, offset):
+        '''Return the number of newlines preceding offset.'''
+        self._scan(offset=offset)
+        index = bisect.bisect_right(self._samples, offset) - 1
+        start = self._samples[index]
+        return (index * self.sample_interval +
+                self._data[start:offset].count(b'\n'))
+
+    def split(self, count):
+        '''Split the file into up to count line-aligned byte ranges.
+
+        Returns a list of (start, end, line_num) 3-tuples where line_num
+        is the number of lines preceding start.
+        '''
+        bounds = [0]
+        for i in range(1, count):
+            pos = self._data.find(b'\n', self.size * i // count)
+            pos = self.size if pos < 0 else pos + 1
+            if bounds[-1] < pos < self.size:
+                bounds.append(pos)
+        bounds.append(self.size)
+        return [(start, end, self.line_number(start))
+                for start, end in zip(bounds, bounds[1:])]
+
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def mapped_file(path, cache_size=8):
+    '''Return a shared MappedFile for path.
+
+    The cache is keyed by the path, size and modification time of the
+    file so that replaced files are mapped again.
+    '''
+    stat = os.stat(path)
+    key = path, stat.st_size, stat.st_mtime
+    with _cache_lock:
+        try:
+            mapped = _cache.pop(key)
+        except KeyError:
+            mapped = MappedFile(path)
+        _cache[key] = mapped
+        while len(_cache) > cache_size:
+            # Mappings still in use are closed once no longer referenced.
+            _cache.popitem(last=False)
+    return mapped
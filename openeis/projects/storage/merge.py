@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''K-way merge of sensor time series on their times.
+
+Applications read their inputs as one time-ordered series of (time,
+value) pairs per sensor and merge them into rows. The series are merged
+here using a heap of the distinct times at the heads of the series, so
+each row costs work in proportion to the series having a value at that
+time rather than to the number of series, and values are written into a
+row buffer allocated once for the whole merge.
+
+Three modes are supported: DROP yields only times present in every
+series, NONE yields every time, with None for series without a value,
+and FILL yields every time, repeating the last value of series without
+one. As in the original merge, no rows are produced if any series is
+empty.
+'''
+
+from collections import defaultdict
+import heapq
+
+
+__all__ = ['DROP', 'NONE', 'FILL', 'merge_rows', 'format_rows', 'merge']
+
+
+DROP = 'drop'
+NONE = 'none'
+FILL = 'fill'
+
+
+class _Heads:
+    '''The next value of each series, bucketed by time.
+
+    A heap holds the distinct times at the heads of the series and a
+    dictionary the series at each time, so aligned series, which share
+    their times, cost a single heap operation per row.
+    '''
+
+    __slots__ = ('iterators', 'values', 'buckets', 'times')
+
+    def __init__(self, iterators):
+        self.iterators = iterators
+        self.values = [None] * len(iterators)
+        self.buckets = {}
+        self.times = []
+
+    def advance(self, i):
+        '''Read the next value of series i; return False at its end.'''
+        try:
+            time, self.values[i] = next(self.iterators[i])
+        except StopIteration:
+            return False
+        try:
+            self.buckets[time].append(i)
+        except KeyError:
+            self.buckets[time] = [i]
+            heapq.heappush(self.times, time)
+        return True
+
+    def pop(self):
+        '''Remove and return the oldest time and the series at it.'''
+        time = heapq.heappop(self.times)
+        return time, self.buckets.pop(time)
+
+
+def _merge_drop(iterators):
+    '''Yield (time, row) for the times found in every series.'''
+    heads = _Heads(iterators)
+    count = len(iterators)
+    if not all(heads.advance(i) for i in range(count)):
+        return
+    row = heads.values
+    while True:
+        time, ready = heads.pop()
+        if len(ready) == count:
+            yield time, row
+        elif not heads.times:
+            return
+        # Advance the series at the oldest time; the rest wait for them.
+        for i in ready:
+            if not heads.advance(i):
+                return
+
+
+def _merge_all(iterators, fill):
+    '''Yield (time, row) for every time in any of the series.'''
+    heads = _Heads(iterators)
+    if not all(heads.advance(i) for i in range(len(iterators))):
+        return
+    row = [None] * len(iterators)
+    ready = ()
+    values = heads.values
+    while heads.times:
+        if not fill:
+            for i in ready:
+                row[i] = None
+        time, ready = heads.pop()
+        for i in ready:
+            row[i] = values[i]
+        yield time, row
+        for i in ready:
+            heads.advance(i)
+
+
+def merge_rows(series, mode=DROP):
+    '''Merge time-ordered iterables of (time, value) pairs.
+
+    Yields (time, row) tuples, where row is a list of the value of each
+    series at time, according to mode. The same row list is updated for
+    every row, so it must be copied if kept past the next iteration.
+    '''
+    iterators = [iter(values) for values in series]
+    if not iterators:
+        return iter(())
+    if mode == DROP:
+        return _merge_drop(iterators)
+    if mode in (NONE, FILL):
+        return _merge_all(iterators, mode == FILL)
+    raise ValueError('invalid merge mode: {!r}'.format(mode))
+
+
+def _layout(args):
+    '''Return the series of get_query_sets() results and their groups.
+
+    The groups are returned as (group, index) pairs, where index is a
+    slice of the row if the series of the group are adjacent, or a list
+    of their positions otherwise.
+    '''
+    series = []
+    positions = {}
+    for arg in args:
+        for group, query_sets in arg.items():
+            for query_set in query_sets:
+                positions.setdefault(group, []).append(len(series))
+                series.append(query_set)
+    layout = []
+    for group, indexes in positions.items():
+        if indexes == list(range(indexes[0], indexes[-1] + 1)):
+            layout.append((group, slice(indexes[0], indexes[-1] + 1)))
+        else:
+            layout.append((group, indexes))
+    return series, layout
+
+
+def _dict_rows(rows, layout):
+    for time, row in rows:
+        result = defaultdict(list)
+        result['time'] = time
+        for group, index in layout:
+            if isinstance(index, slice):
+                result[group] = row[index]
+            else:
+                result[group] = [row[i] for i in index]
+        yield result
+
+
+def format_rows(rows, layout, as_tuples=False):
+    '''Format (time, row) pairs as dictionaries or tuples for merge().
+
+    layout is a list of (group, index) pairs, where index is a slice of
+    the row or a list of positions in it.
+    '''
+    if as_tuples:
+        return ((time,) + tuple(row) for time, row in rows)
+    return _dict_rows(rows, layout)
+
+
+def merge(args, mode=DROP, as_tuples=False):
+    '''Merge results returned from DatabaseInput.get_query_sets().
+
+    Rows are dictionaries with the time under 'time' and a list of the
+    values of the series of each group under the group name. If
+    as_tuples is True, rows are instead tuples of the time followed by
+    the values of each series, in the order they were given.
+    '''
+    series, layout = _layout(args)
+    return format_rows(merge_rows(series, mode), layout, as_tuples)
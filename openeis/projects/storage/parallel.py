@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Parse ingest files concurrently using a process pool.
+
+Each file, or line-aligned byte range of a large file, is parsed by
+ingest_file() in one of a set of worker processes and parsed rows are
+streamed back to the calling process in batches through a bounded queue,
+allowing a single writer to save the results while the remaining files
+are still being parsed. Only the parsers from the ingest module are used
+in the workers so that no database access occurs outside of the calling
+process.
+'''
+
+import collections
+import multiprocessing
+import os
+import queue
+import traceback
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .ingest import (IngestFile, get_sensor_parsers, ingest_file,
+                     ingest_file_blocks)
+from .mapped import MappedFile
+
+
+__all__ = ['ingest_files_parallel']
+
+
+_queue = None
+_semaphores = None
+
+def _worker(tasks, queue, semaphores):
+    '''Parse the ranges taken from the tasks queue until None is taken.'''
+    global _queue, _semaphores
+    _queue = queue
+    _semaphores = semaphores
+    for args in iter(tasks.get, None):
+        _parse_range(*args)
+
+
+def _parse_range(task_id, path, columns, batch_size, block_size,
+                 start, end, line_num):
+    '''Parse a byte range of a file, putting batches of rows on the queue.
+
+    Messages are 3-tuples of (task_id, rows, error). A rows value of None
+    signals that the range is complete and error will be set to the
+    formatted traceback if parsing failed. If block_size is set, rows
+    is a Block instance rather than a list of rows. Rows are parsed from
+    the start offset, preceded by line_num lines, to the end offset. The
+    task's semaphore limits the batches waiting to be consumed.
+    '''
+    def put(rows):
+        _semaphores[task_id].acquire()
+        _queue.put((task_id, rows, None))
+    try:
+        with MappedFile(path).open(end=end) as file:
+            if block_size:
+                for block in ingest_file_blocks(file, columns, block_size,
+                        position=start, line_num=line_num):
+                    put(block)
+            else:
+                rows = []
+                for row in ingest_file(file, columns, position=start,
+                                       line_num=line_num):
+                    rows.append(row)
+                    if len(rows) >= batch_size:
+                        put(rows)
+                        rows = []
+                if rows:
+                    put(rows)
+    except Exception:
+        _queue.put((task_id, None, traceback.format_exc()))
+    else:
+        _queue.put((task_id, None, None))
+
+
+def _split(path, start, line_num, count, range_size):
+    '''Return (start, end, line_num) ranges of a file to parse.
+
+    Files are only split if they contain no quote characters, which
+    could enclose newlines and make line boundaries differ from rows.
+    '''
+    mapped = MappedFile(path)
+    count = min(count, (mapped.size - start) // range_size)
+    if count < 2 or mapped.find(b'"') >= 0:
+        return [(start, mapped.size, line_num)]
+    ranges = [(max(begin, start), end,
+               line_num if begin <= start else begin_line)
+              for begin, end, begin_line in mapped.split(count)
+              if end > start]
+    return ranges
+
+
+def ingest_files_parallel(datamap, files, processes=None, batch_size=1000,
+                          poll_interval=1.0, block_size=None,
+                          range_size=1 << 24, prefetch=8):
+    '''Parse files in a pool of processes, yielding (file, rows) batches.
+
+    files is like that passed to ingest_files() except each file_dict
+    must have a path key holding the filesystem path of the file. The
+    file objects are not used. The yielded file is an IngestFile with
+    a rows attribute of None and rows is a list of Row instances. Rows
+    for an individual file are yielded in order, but batches from
+    different files are interleaved as they become available. Up to
+    processes files or ranges (defaulting to the CPU count) are parsed
+    at once. Files larger than range_size bytes are split into ranges
+    parsed concurrently; up to prefetch batches of later ranges are held
+    until the preceding ranges have been yielded.  If block_size is given
+    and NumPy is available, Block instances are yielded in place of lists
+    of rows, as with ingest_files().
+    '''
+    columnmap = get_sensor_parsers(datamap, files)
+    if numpy is None:
+        block_size = None
+    if hasattr(files, 'items'):
+        files = sorted(files.items())
+    processes = processes or multiprocessing.cpu_count()
+    ingested, tasks, order = {}, [], collections.OrderedDict()
+    for file_id, file_dict in files:
+        path = file_dict['path']
+        names, types, columns = zip(*columnmap[file_id])
+        ingested[file_id] = IngestFile(
+                file_id, os.path.getsize(path), names, types, None,
+                file_dict['time_zone'], file_dict['time_offset'])
+        order[file_id] = collections.deque()
+        for start, end, line_num in _split(
+                path, file_dict.get('position', 0),
+                file_dict.get('line_num', 0), processes, range_size):
+            order[file_id].append(len(tasks))
+            tasks.append((file_id, (len(tasks), path, columns, batch_size,
+                                    block_size, start, end, line_num)))
+    processes = min(processes, len(tasks)) or 1
+    results = multiprocessing.Queue(maxsize=processes * 4)
+    semaphores = [multiprocessing.Semaphore(prefetch) for _ in tasks]
+    task_queue = multiprocessing.Queue()
+    for _, args in tasks:
+        task_queue.put(args)
+    for _ in range(processes):
+        task_queue.put(None)
+    workers = [multiprocessing.Process(target=_worker,
+                                       args=(task_queue, results, semaphores),
+                                       daemon=True)
+               for _ in range(processes)]
+    pending = [collections.deque() for _ in tasks]
+    done = set()
+    try:
+        for worker in workers:
+            worker.start()
+        while any(order.values()):
+            try:
+                task_id, rows, error = results.get(timeout=poll_interval)
+            except queue.Empty:
+                # Ranges being parsed by a worker that died are never
+                # finished, so waiting ends once any worker failed or
+                # all have exited leaving nothing to read.
+                exitcodes = [worker.exitcode for worker in workers]
+                if any(exitcodes) or (None not in exitcodes and
+                                      results.empty()):
+                    raise RuntimeError('a parsing process exited '
+                                       'unexpectedly')
+                continue
+            if error:
+                raise RuntimeError('failed to parse file {!r}:\n{}'.format(
+                                   tasks[task_id][0], error))
+            if rows is None:
+                done.add(task_id)
+            else:
+                pending[task_id].append(rows)
+            # Yield the batches of the first unfinished range of each file.
+            for file_id, task_ids in order.items():
+                while task_ids:
+                    head = task_ids[0]
+                    while pending[head]:
+                        yield ingested[file_id], pending[head].popleft()
+                        semaphores[head].release()
+                    if head not in done:
+                        break
+                    task_ids.popleft()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            if worker.pid is not None:
+                worker.join()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Delete datasets and projects without loading their sensor data.
+
+Deleting a SensorIngest through the ORM has Django's collector walk
+every table referring to it, in one transaction, which for datasets of
+tens of millions of values takes a long time and holds the database
+locked throughout. The functions here first remove the sensor data,
+chunks, rollups and statistics of each dataset using set-based DELETE
+statements of at most a batch of rows, each committed on its own, and
+drop the tables of partitioned datasets, leaving only small tables for
+the final delete() of the dataset or project.
+'''
+
+from django.db import connections, router, transaction
+
+from .. import models
+from ..conf import settings as proj_settings
+
+
+__all__ = ['purge_dataset', 'purge_project']
+
+
+def _data_models(ingest):
+    '''Return the models of the per-ingest tables of a dataset.'''
+    result = [models.SensorDataChunk, models.SensorRollup,
+              models.SensorStatistics]
+    if ingest.map.storage != models.DataMap.PARTITIONED:
+        result.extend(models._sensor_data_classes())
+    return result
+
+
+def _delete_batches(model, ingest_id, batch_size, using):
+    '''Delete the rows of an ingest in batches, yielding the row counts.'''
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    opts = model._meta
+    table = qn(opts.db_table)
+    pk = qn(opts.pk.column)
+    ingest = qn(opts.get_field('ingest').column)
+    if connection.vendor == 'mysql':
+        # MySQL does not support LIMIT in IN subqueries.
+        sql = 'DELETE FROM {} WHERE {} = %s LIMIT %s'.format(table, ingest)
+    else:
+        sql = ('DELETE FROM {0} WHERE {1} IN (SELECT {1} FROM {0} '
+               'WHERE {2} = %s LIMIT %s)'.format(table, pk, ingest))
+    while True:
+        with transaction.atomic(using=using):
+            cursor = connection.cursor()
+            cursor.execute(sql, [ingest_id, batch_size])
+            deleted = cursor.rowcount
+        yield deleted
+        if deleted < batch_size:
+            break
+
+
+class _Progress:
+    '''Count deleted rows and report them to a callback.'''
+
+    def __init__(self, callback, total):
+        self.callback = callback
+        self.total = total
+        self.done = 0
+
+    def add(self, count):
+        self.done += count
+        if self.callback is not None:
+            self.callback(self.done, self.total)
+
+
+def _count(ingest, using):
+    return sum(model.objects.using(using).filter(ingest=ingest).count()
+               for model in _data_models(ingest))
+
+
+def _purge_data(ingest, progress, batch_size, using):
+    if ingest.map.storage == models.DataMap.PARTITIONED:
+        for data_class in models._sensor_data_classes():
+            data_class.drop_partition(ingest.pk, using=using)
+    for model in _data_models(ingest):
+        for deleted in _delete_batches(model, ingest.pk, batch_size, using):
+            progress.add(deleted)
+
+
+def purge_dataset(ingest, progress=None, batch_size=None):
+    '''Delete a dataset, removing its data in batches first.
+
+    progress, if given, is called with the number of rows deleted so
+    far and the total after each batch. batch_size defaults to the
+    DELETE_BATCH_SIZE setting.
+    '''
+    batch_size = batch_size or proj_settings.DELETE_BATCH_SIZE
+    using = router.db_for_write(models.SensorIngest, instance=ingest)
+    counter = _Progress(progress, _count(ingest, using))
+    _purge_data(ingest, counter, batch_size, using)
+    ingest.delete(using=using)
+
+
+def purge_project(project, progress=None, batch_size=None):
+    '''Delete a project, removing the data of its datasets in batches.
+
+    progress and batch_size are as for purge_dataset().
+    '''
+    batch_size = batch_size or proj_settings.DELETE_BATCH_SIZE
+    using = router.db_for_write(models.Project, instance=project)
+    ingests = list(models.SensorIngest.objects.using(using).filter(
+            project=project).select_related('map'))
+    counter = _Progress(progress, sum(_count(ingest, using)
+                                      for ingest in ingests))
+    for ingest in ingests:
+        _purge_data(ingest, counter, batch_size, using)
+    project.delete(using=using)
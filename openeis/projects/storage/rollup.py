@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*- {{{
+# vim: set fenc=utf-8 ft=python sw=4 ts=4 sts=4 et:
+#
+# Copyright (c) 2014, Battelle Memorial Institute
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this
+#    list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are those
+# of the authors and should not be interpreted as representing official policies,
+# either expressed or implied, of the FreeBSD Project.
+#
+#
+# This material was prepared as an account of work sponsored by an
+# agency of the United States Government.  Neither the United States
+# Government nor the United States Department of Energy, nor Battelle,
+# nor any of their employees, nor any jurisdiction or organization
+# that has cooperated in the development of these materials, makes
+# any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness or
+# any information, apparatus, product, software, or process disclosed,
+# or represents that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or
+# service by trade name, trademark, manufacturer, or otherwise does
+# not necessarily constitute or imply its endorsement, recommendation,
+# or favoring by the United States Government or any agency thereof,
+# or Battelle Memorial Institute. The views and opinions of authors
+# expressed herein do not necessarily state or reflect those of the
+# United States Government or any agency thereof.
+#
+# PACIFIC NORTHWEST NATIONAL LABORATORY
+# operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
+# under Contract DE-AC05-76RL01830
+#
+#}}}
+
+'''Hourly and daily summaries of sensor values.
+
+Applications mostly read sensor data averaged or summed by hour or
+coarser periods, which requires truncating the time of every stored
+value on each run. Summaries of the values of each sensor and ingest in
+each UTC hour and day are instead kept in the SensorRollup table as the
+values are loaded, from which the aggregates of any hour, day, month or
+year may be computed.
+'''
+
+import math
+
+from django.utils.timezone import utc
+
+
+__all__ = ['PERIODS', 'AGGREGATES', 'Summary', 'summarize', 'truncate', 'aggregate_value']
+
+
+# Periods summarized, mapped to the truncation kinds computed from them.
+PERIODS = {
+    'hour': ('hour',),
+    'day': ('day', 'month', 'year'),
+}
+
+_TRUNCATE = {
+    'hour': dict(minute=0, second=0, microsecond=0),
+    'day': dict(hour=0, minute=0, second=0, microsecond=0),
+    'month': dict(day=1, hour=0, minute=0, second=0, microsecond=0),
+    'year': dict(month=1, day=1, hour=0, minute=0, second=0, microsecond=0),
+}
+
+AGGREGATES = {'Avg', 'Count', 'Max', 'Min', 'StdDev', 'Sum', 'Variance'}
+
+
+def truncate(time, kind):
+    '''Truncate an aware time to the start of its UTC hour, day, etc.'''
+    return time.astimezone(utc).replace(**_TRUNCATE[kind])
+
+
+class Summary:
+    '''Number, sum, sum of squares, minimum and maximum of values.
+
+    rows counts all values, including nulls, which are otherwise
+    ignored as they are by database aggregates.
+    '''
+
+    __slots__ = ('rows', 'count', 'sum', 'sumsq', 'min', 'max')
+
+    def __init__(self, rows=0, count=0, sum=0.0, sumsq=0.0, min=None, max=None):
+        self.rows = rows
+        self.count = count
+        self.sum = sum
+        self.sumsq = sumsq
+        self.min = min
+        self.max = max
+
+    def add(self, value):
+        self.rows += 1
+        if value is None:
+            return
+        self.count += 1
+        self.sum += value
+        self.sumsq += value * value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        self.rows += other.rows
+        self.count += other.count
+        self.sum += other.sum
+        self.sumsq += other.sumsq
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+
+def summarize(sensors, times, values):
+    '''Summarize parallel sequences of sensor IDs, times and values.
+
+    Returns a dictionary mapping (sensor ID, period, start time) keys to
+    Summary objects for each period in PERIODS.
+    '''
+    summaries = {}
+    last = hour = day = None
+    for sensor_id, time, value in zip(sensors, times, values):
+        if time != last:
+            last, start = time, truncate(time, 'hour')
+            if start != hour:
+                hour, day = start, start.replace(hour=0)
+        for key in [(sensor_id, 'hour', hour), (sensor_id, 'day', day)]:
+            try:
+                summary = summaries[key]
+            except KeyError:
+                summary = summaries[key] = Summary()
+            summary.add(value)
+    return summaries
+
+
+def aggregate_value(name, summary, sample=False):
+    '''Return the value of a named database aggregate from a summary.'''
+    if name == 'Count':
+        return summary.count
+    if not summary.count:
+        return None
+    if name == 'Sum':
+        return summary.sum
+    if name == 'Min':
+        return summary.min
+    if name == 'Max':
+        return summary.max
+    mean = summary.sum / summary.count
+    if name == 'Avg':
+        return mean
+    count = summary.count - 1 if sample else summary.count
+    if not count:
+        return None
+    variance = max(summary.sumsq - summary.sum * mean, 0.0) / count
+    if name == 'Variance':
+        return variance
+    if name == 'StdDev':
+        return math.sqrt(variance)
+    raise ValueError('unsupported aggregate: {}'.format(name))
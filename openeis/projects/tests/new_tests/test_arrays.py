@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from django.utils.timezone import utc
+import numpy
+import pytest
+
+from openeis.projects.storage import arrays
+from openeis.projects.storage.db_input import DatabaseInput
+
+
+pytestmark = pytest.mark.django_db
+
+
+def _series(pairs):
+    builder = arrays.ArrayBuilder()
+    builder.extend_pairs(pairs)
+    return builder.finish()
+
+
+def test_align():
+    first = _series([(datetime(2000, 1, 1, hour, tzinfo=utc), value)
+                     for hour, value in [(8, 1.0), (9, None), (10, 3.0)]])
+    second = _series([(datetime(2000, 1, 1, hour, tzinfo=utc), value)
+                      for hour, value in [(9, 4.0), (11, 5.0)]])
+    assert first.times[0] == numpy.datetime64('2000-01-01T08:00:00')
+    assert list(first.nulls) == [False, True, False]
+    assert numpy.isnan(first.values[1])
+    frame = arrays.align([first, second], ['a', 'b'])
+    assert list(frame.times) == [numpy.datetime64('2000-01-01T09:00:00')]
+    assert frame.nulls.tolist() == [[True, False]]
+    frame = arrays.align([first, second], drop_partial_lines=False)
+    assert len(frame.times) == 4
+    assert frame.nulls[:, 1].tolist() == [True, False, True, False]
+    assert frame.values[3, 1] == 5.0
+
+
+def test_get_arrays(dataset):
+    topics = sorted(name for name, meta in dataset.map.map['sensors'].items()
+                    if 'type' in meta)
+    inp = DatabaseInput(dataset.map.id, {'all': topics}, dataset.id)
+    for series, qs in zip(inp.get_arrays('all', batch_size=100),
+                          inp.get_query_sets('all')):
+        expected = list(qs)
+        assert len(series.times) == len(expected)
+        assert series.times.dtype == numpy.dtype('datetime64[ns]')
+        assert series.times[-1] == numpy.datetime64(
+                expected[-1][0].replace(tzinfo=None))
+        assert series.nulls.tolist() == [value is None
+                                         for _, value in expected]
+        assert series.values[~series.nulls].tolist() == pytest.approx(
+                [value for _, value in expected if value is not None])
+    frame = inp.get_frame('all', drop_partial_lines=False)
+    assert frame.values.shape == (len(frame.times), len(topics))
+    assert frame.columns == [('all', topic) for topic in topics]
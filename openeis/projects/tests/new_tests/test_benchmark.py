@@ -0,0 +1,25 @@
+import io
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+import pytest
+
+from openeis.projects import benchmarks
+
+
+def _results(target):
+    def benchmark(rows, columns):
+        return benchmarks.Result('test', rows, 1.0, 'values', target)
+    return lambda: {'test': benchmark}
+
+
+def test_benchmark_target(monkeypatch):
+    from openeis.projects.management.commands import benchmark
+    monkeypatch.setattr(benchmark, 'get_benchmarks', _results(10))
+    out = io.StringIO()
+    call_command('benchmark', rows=100, stdout=out, skip_validation=True)
+    assert out.getvalue().rstrip().endswith('PASS')
+    monkeypatch.setattr(benchmark, 'get_benchmarks', _results(1000))
+    with pytest.raises(CommandError):
+        call_command('benchmark', rows=100, stdout=io.StringIO(),
+                     skip_validation=True)
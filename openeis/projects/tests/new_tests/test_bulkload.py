@@ -0,0 +1,48 @@
+import datetime
+
+from django.utils.timezone import utc
+import pytest
+
+from openeis.projects import models
+from openeis.projects.storage.bulkload import (BulkLoader, ColumnBuffer,
+                                               CopyReader)
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_column_buffer_extend():
+    buf = ColumnBuffer(models.FloatSensorData)
+    buf.append(1, 'a', 1.0)
+    buf.extend(2, ['b', 'c'], [2.0, 3.0])
+    assert len(buf) == 3
+    assert buf.sensors == [1, 2, 2]
+    assert buf.times == ['a', 'b', 'c']
+    assert buf.values == [1.0, 2.0, 3.0]
+    buf.clear()
+    assert len(buf) == 0
+
+
+def test_copy_reader():
+    rows = [(1, 2, None, 'a "b"'), (1, 2, 1.5, ''), (3, 4, True, None)]
+    expected = '1,2,,"a ""b"""\n1,2,1.5,""\n3,4,True,\n'
+    assert CopyReader(iter(rows)).read() == expected
+    reader = CopyReader(iter(rows))
+    parts = iter(lambda: reader.read(4), '')
+    assert ''.join(parts) == expected
+
+
+def test_bulk_loader_flush(dataset):
+    sensor = dataset.map.sensors.order_by('name')[0]
+    count = sensor.data.filter(ingest=dataset).count()
+    start = datetime.datetime(2020, 1, 1, tzinfo=utc)
+    times = [start + datetime.timedelta(hours=i) for i in range(10)]
+    loader = BulkLoader(dataset)
+    loader.extend(sensor, times, list(range(10)))
+    assert len(loader) == 10
+    assert loader.flush() == 10
+    assert len(loader) == 0
+    data = sensor.data.filter(ingest=dataset, time__gte=start)
+    assert data.count() == 10
+    assert sensor.data.filter(ingest=dataset).count() == count + 10
+    assert [d.time for d in data] == times
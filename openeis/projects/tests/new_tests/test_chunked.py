@@ -0,0 +1,147 @@
+import datetime
+import zlib
+
+from django.db.models import Avg, Max
+from django.utils.timezone import utc
+import pytest
+
+from openeis.filters.apply_filter import apply_filter_config
+from openeis.projects import models
+from openeis.projects.storage.bulkload import BulkLoader
+from openeis.projects.storage.chunked import (decode_chunk, merge_chunk,
+                                              split_days)
+from .conftest import create_dataset
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_chunk_round_trip():
+    start = datetime.datetime(2014, 3, 1, 23, tzinfo=utc)
+    times = [start + datetime.timedelta(minutes=15 * i) for i in range(8)]
+    series = {
+        'f': [1.5, None, 2.25, -3.0, 0.0, 1e300, None, 4.0],
+        'i': [1, 2, None, -4, 0, 2**40, 7, None],
+        'b': [True, False, None, True, True, False, None, False],
+        's': ['a', None, '', 'b,c', '"', 'é', 'x', None],
+    }
+    for data_type, values in series.items():
+        days = list(split_days(reversed(times), reversed(values)))
+        assert [day for day, _, _ in days] == [16130, 16131]
+        decoded_values = []
+        for _, micros, day_values in days:
+            start, end, count, time_data, value_data = merge_chunk(
+                    data_type, micros, day_values)
+            assert count == len(micros)
+            day_micros, day_values = decode_chunk(
+                    data_type, time_data, value_data)
+            assert day_micros == micros
+            decoded_values.extend(day_values)
+        assert decoded_values == values
+
+
+def test_merge_chunk():
+    _, micros, values = next(split_days(
+            [datetime.datetime(2014, 3, 1, hour, tzinfo=utc)
+             for hour in (0, 2, 4)], [0.0, 2.0, 4.0]))
+    fields = merge_chunk('f', micros, values)
+    _, micros, values = next(split_days(
+            [datetime.datetime(2014, 3, 1, hour, tzinfo=utc)
+             for hour in (3, 1)], [3.0, 1.0]))
+    start, end, count, time_data, value_data = merge_chunk(
+            'f', micros, values, *fields[3:])
+    assert start == datetime.datetime(2014, 3, 1, 0, tzinfo=utc)
+    assert end == datetime.datetime(2014, 3, 1, 4, tzinfo=utc)
+    assert count == 5
+    assert decode_chunk('f', time_data, value_data)[1] == [
+            0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_run_length_chunk():
+    start = datetime.datetime(2014, 3, 1, tzinfo=utc)
+    times = [start + datetime.timedelta(minutes=i) for i in range(1440)]
+    series = {
+        'b': [i % 720 < 480 for i in range(1440)],
+        'i': [None if i < 60 else i // 360 for i in range(1440)],
+    }
+    for data_type, values in series.items():
+        _, micros, day_values = next(split_days(times, values))
+        _, _, _, time_data, value_data = merge_chunk(
+                data_type, micros, day_values)
+        assert zlib.decompress(value_data)[:1] == b'r'
+        assert decode_chunk(data_type, time_data, value_data)[1] == values
+
+
+def test_chunked_dataset(project, datamap, datafile_1month):
+    rows = create_dataset('Rows', project, datamap, {'0': datafile_1month})
+    chunked_map = models.DataMap.objects.create(
+            project=project, name='Chunked Data Map', map=datamap.map,
+            storage=models.DataMap.CHUNKS)
+    chunked = create_dataset('Chunks', project, chunked_map,
+                             {'0': datafile_1month})
+    start = datetime.datetime(2012, 2, 10, 12, tzinfo=utc)
+    end = datetime.datetime(2012, 2, 20, tzinfo=utc)
+    for sensor in datamap.sensors.all():
+        other = chunked_map.sensors.get(name=sensor.name)
+        row_data = sensor.data.filter(ingest=rows)
+        chunk_data = other.data.filter(ingest=chunked)
+        assert chunk_data.count() == row_data.count()
+        assert (list(chunk_data.timeseries()) ==
+                list(row_data.order_by('time').timeseries()))
+        assert (list(chunk_data.filter(time__gte=start, time__lt=end)
+                               .exclude(value=None).timeseries()) ==
+                list(row_data.filter(time__gte=start, time__lt=end)
+                             .exclude(value=None).order_by('time')
+                             .timeseries()))
+        assert (chunk_data.aggregate(value=Max('value')) ==
+                row_data.aggregate(value=Max('value')))
+        assert (chunk_data.aggregate(value=Avg('value'))['value'] ==
+                pytest.approx(row_data.aggregate(value=Avg('value'))['value']))
+        assert chunk_data.earliest().time == row_data.earliest().time
+        days = len({time.date() for time, _ in row_data.timeseries()})
+        assert other.chunks.filter(ingest=chunked).count() <= days
+        intervals = list(chunk_data.intervals())
+        assert intervals[0][0] == chunk_data.earliest().time
+        assert intervals[-1][1] == chunk_data.latest().time
+        assert all(a[1] == b[0] and a[2] != b[2]
+                   for a, b in zip(intervals, intervals[1:]))
+
+
+def test_chunk_per_day(project, datamap):
+    chunked_map = models.DataMap.objects.create(
+            project=project, name='Chunked Data Map', map=datamap.map,
+            storage=models.DataMap.CHUNKS)
+    sensor = models.Sensor.objects.create(map=chunked_map, name='Test/Value',
+                                          data_type=models.Sensor.FLOAT)
+    ingest = models.SensorIngest.objects.create(
+            project=project, name='Chunks', map=chunked_map)
+    loader = BulkLoader(ingest)
+    # A flush of values before those of the chunk stored for the day
+    for hour in [12, 6]:
+        loader.append(sensor, datetime.datetime(2012, 2, 1, hour,
+                                                tzinfo=utc), float(hour))
+        loader.flush()
+    chunk, = sensor.chunks.filter(ingest=ingest)
+    assert chunk.count == 2
+    assert [value for _, value in sensor.data.filter(ingest=ingest)] == [
+            6.0, 12.0]
+
+
+def test_chunked_apply_filter(project, datamap, datafile_1month):
+    chunked_map = models.DataMap.objects.create(
+            project=project, name='Chunked Data Map', map=datamap.map,
+            storage=models.DataMap.CHUNKS)
+    chunked = create_dataset('Chunks', project, chunked_map,
+                             {'0': datafile_1month})
+    topic = 'Test/OutdoorAirTemperature'
+    filtered_map = models.DataMap.objects.get(pk=apply_filter_config(
+            chunked.pk, [[topic, 'RoundOff', {'places': 0}]]))
+    filtered = filtered_map.datasets.get()
+    sensor = chunked_map.sensors.get(name=topic)
+    expected = [(time, round(value)) for time, value in
+                sensor.data.filter(ingest=chunked).timeseries()
+                if value is not None]
+    assert expected
+    result = filtered_map.sensors.get(name=topic).data.filter(
+            ingest=filtered).timeseries()
+    assert [(time, round(value)) for time, value in result] == expected
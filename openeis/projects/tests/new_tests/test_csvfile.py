@@ -0,0 +1,35 @@
+import csv
+import io
+
+import pytest
+
+from openeis.projects.storage.csvfile import CSVFile
+
+
+DATA = ('time,name,value\r\n'
+        '1,abc,1.5\r\n'
+        '2,héllo,2.5\r\n'
+        '3,"two\nlines",3.5\r\n'
+        '4,日本,4.5').encode('utf-8')
+
+
+def _read(**kwargs):
+    csv_file = CSVFile(io.BytesIO(DATA), **kwargs)
+    return [(csv_file.reader.line_num, csv_file.position, row)
+            for row in csv_file]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 1 << 20])
+def test_chunked_matches_readline(chunk_size):
+    expected = _read(chunk_size=0)
+    assert _read(chunk_size=chunk_size) == expected
+    assert expected[-1][1] == len(DATA)
+    line_num, position, row = expected[2]
+    assert row == ['2', 'héllo', '2.5']
+    assert DATA[position:].startswith(b'3,"two')
+
+
+@pytest.mark.parametrize('chunk_size', [0, 1 << 20])
+def test_line_too_long(chunk_size):
+    with pytest.raises(csv.Error):
+        _read(max_line_size=8, chunk_size=chunk_size)
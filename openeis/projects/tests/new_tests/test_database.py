@@ -0,0 +1,30 @@
+from django.db import connection
+import pytest
+from rest_framework.test import APIClient
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_database_endpoint(admin_user, active_user):
+    client = APIClient()
+    client.force_authenticate(user=active_user)
+    assert client.get('/api/database').status_code == 403
+    client.force_authenticate(user=admin_user)
+    response = client.get('/api/database')
+    assert response.status_code == 200
+    default = response.data['default']
+    assert default['vendor'] == connection.vendor
+    if connection.vendor == 'sqlite':
+        # synchronous=NORMAL and temp_store=MEMORY
+        assert default['pragmas']['synchronous'] == 1
+        assert default['pragmas']['temp_store'] == 2
+
+
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='SQLite pragmas')
+def test_read_pragmas_without_value(monkeypatch):
+    pragmas = dict(connection.get_pragmas(), optimize=0)
+    monkeypatch.setattr(connection, 'get_pragmas', lambda: pragmas)
+    values = connection.read_pragmas()
+    assert values['optimize'] is None
+    assert values['temp_store'] == 2
@@ -2,6 +2,8 @@
 import datetime
 from collections import namedtuple
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import utc
 import pytest
 from rest_framework.test import force_authenticate, APIRequestFactory, APIClient
@@ -117,6 +119,35 @@ def test_dataset_merge(mixed_dataset):
     assert summary.last_row == rows[-1]
 
 
+def test_dataset_merge_streamed(monkeypatch, mixed_dataset):
+    '''Test merging series read a few rows at a time.'''
+    expected = list(mixed_dataset.merge())
+    monkeypatch.setattr(conf.settings, 'TIMESERIES_BATCH_SIZE', 7)
+    assert list(mixed_dataset.merge()) == expected
+
+
+def test_timeseries_stream(dataset):
+    for sensor in dataset.map.sensors.all():
+        data = sensor.data.filter(ingest=dataset)
+        expected = list(data.order_by('time').timeseries())
+        assert expected
+        with CaptureQueriesContext(connection) as queries:
+            assert (list(data.order_by('time').timeseries(batch_size=5)) ==
+                    expected)
+        # A count for the length hint of list() and a query per batch
+        assert len(queries) == 1 + len(expected) // 5 + 1
+        assert (list(data.order_by('-time').timeseries(batch_size=5)) ==
+                expected[::-1])
+        assert ([(obj.time, obj.value) for obj in data.stream(5)] ==
+                expected)
+        assert data.stream(5).earliest('time').time == expected[0][0]
+        series = data.order_by('time').timeseries(batch_size=5)
+        assert series.latest('time') == expected[-1]
+        # Other orderings are read at once.
+        assert (sorted(data.order_by('value').timeseries(batch_size=5),
+                       key=lambda pair: pair[0]) == expected)
+
+
 def test_dataset_download_url(active_user, mixed_dataset):
     '''Tests download_url transformation.'''
 
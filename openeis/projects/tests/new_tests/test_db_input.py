@@ -0,0 +1,57 @@
+from django.db.models import Avg
+import pytest
+
+from openeis.projects.storage.db_input import DatabaseInput, SeriesCache
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_series_cache():
+    cache = SeriesCache(10000)
+    loads = []
+    def load(name):
+        def func():
+            loads.append(name)
+            return [float(i) for i in range(100)]
+        return func
+    for name in ['a', 'b', 'a', 'c', 'd']:
+        cache.get(name, load(name))
+    assert loads == ['a', 'b', 'c', 'd']
+    assert cache.used <= cache.size
+    # The least recently used value was dropped.
+    cache.get('b', load('b'))
+    assert loads[-1] == 'b'
+    cache.get('d', load('d'))
+    assert loads[-1] == 'b'
+    # Values larger than the cache are not kept.
+    assert len(cache) == 3
+    cache.get('big', lambda: list(range(10000)))
+    assert len(cache) == 3
+
+
+def test_database_input_cache(dataset):
+    topics = sorted(name for name, meta in dataset.map.map['sensors'].items()
+                    if 'type' in meta)
+    inp = DatabaseInput(dataset.map.id, {'all': topics}, dataset.id)
+    assert inp.get_topics_meta()['all'][topics[0]]['timezone']
+    assert 'timezone' not in inp.get_sensormap()['sensors'][topics[0]]
+    means = inp.get_query_sets('all', group_by='all',
+                               group_by_aggregation=Avg,
+                               filter_={'time__hour': 3})
+    hourly = inp.get_query_sets('all', group_by='hour',
+                                group_by_aggregation=Avg)
+    series = inp.get_arrays('all')
+    misses = inp.cache.misses
+    assert inp.get_query_sets('all', group_by='all',
+                              group_by_aggregation=Avg,
+                              filter_={'time__hour': 3}) == means
+    assert inp.get_query_sets('all', group_by='hour',
+                              group_by_aggregation=Avg) == hourly
+    assert [item.times is cached.times for item, cached in
+            zip(inp.get_arrays('all'), series)] == [True] * len(topics)
+    assert inp.cache.misses == misses
+    assert not series[0].values.flags.writeable
+    hourly[0].clear()
+    assert inp.get_query_sets('all', group_by='hour',
+                              group_by_aggregation=Avg)[0]
@@ -0,0 +1,46 @@
+import os
+import shutil
+
+from openeis.projects import models
+from openeis.projects.storage.csvfile import CSVFile
+from openeis.projects.storage.fileindex import (build_index, csv_options,
+                                                read_index, write_index)
+
+
+def _copy_fixture(tmpdir):
+    path = str(tmpdir.join('data'))
+    shutil.copy(os.path.join(os.path.dirname(models.__file__),
+                             'fixtures', '1Month_hourly.csv'), path)
+    return path
+
+
+def test_build_index(tmpdir):
+    path = _copy_fixture(tmpdir)
+    index = build_index(path, head_rows=3, sample_interval=100)
+    assert index['has_header']
+    assert index['header'] == ['Date', 'Hillside OAT [F]', 'Main Meter [kW]',
+                               'Boiler Gas [kBtu/hr]']
+    assert index['head'][1] == ['2/1/2012 0:00', '45.67', '108.52', '477.31']
+    assert index['rows'] == 696
+    assert len(index['row_offsets']) == 7
+    assert index['column_types'] == ['datetime', 'float', 'float', 'float']
+    assert index['timestamp'] == {'format': '%m/%d/%Y %H:%M',
+                                  'first': '2/1/2012 0:00',
+                                  'last': '2/29/2012 23:00'}
+    with open(path, 'rb') as file:
+        file.seek(index['row_offsets'][1])
+        assert file.readline().startswith(b'2/5/2012 4:00,')
+
+
+def test_read_index(tmpdir):
+    path = _copy_fixture(tmpdir)
+    assert read_index(path) is None
+    index = build_index(path)
+    write_index(path, index)
+    assert read_index(path) == index
+    with open(path, 'rb') as file:
+        expected = list(CSVFile(file))
+        assert list(CSVFile(file, **csv_options(index))) == expected
+    with open(path, 'ab') as file:
+        file.write(b'3/1/2012 0:00,1,2,3\r\n')
+    assert read_index(path) is None
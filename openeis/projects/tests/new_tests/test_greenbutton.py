@@ -170,3 +170,27 @@ def test_row_count():
     assert(row_count == node_count)
 
 
+
+
+def test_convert_file_object():
+    '''Test that a file object is streamed with the currency found outside the ReadingType.'''
+    input_file = os.path.join(os.path.dirname(views.__file__),'fixtures/greenbutton','Premise1_2011_GreenButtonData_Texas.xml')
+
+    tree = parse(input_file)
+    root = tree.getroot()
+
+    ns = {
+        'espi': "http://naesb.org/espi"
+    }
+
+    node_count = len(root.findall('.//espi:IntervalReading', namespaces=ns))
+
+    output = io.StringIO()
+    with open(input_file, 'rb') as file:
+        row_count = Convert(file, output)
+
+    rows = output.getvalue().splitlines()
+    assert(row_count == node_count)
+    assert(len(rows) == node_count + 1)
+    assert(rows[0] == '"Start Timestamp","Duration (Seconds)","End Timestamp",'
+                      '"Cost - US Dollar","Value - Real energy (Watt-hours)","Reading Quality"')
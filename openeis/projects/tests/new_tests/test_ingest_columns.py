@@ -0,0 +1,126 @@
+import datetime
+import io
+
+import dateutil.parser
+import pytest
+import pytz
+
+from openeis.projects.storage.ingest import (
+        BooleanColumn, DateTimeColumn, FloatColumn, IngestError,
+        IntegerColumn, ParseError, StringColumn, compile_format, ingest_file,
+        ingest_file_blocks)
+
+
+utc = pytz.utc
+pacific = pytz.timezone('America/Los_Angeles')
+
+
+def test_compile_format():
+    parse = compile_format('%m/%d/%Y %H:%M')
+    assert parse('9/29/2009 15:00') == datetime.datetime(2009, 9, 29, 15, 0)
+    assert parse('09/29/2009  15:00') == datetime.datetime(2009, 9, 29, 15, 0)
+    parse = compile_format('%Y%m%d %H%M%S.%f')
+    assert parse('20140102 030405.5') == datetime.datetime(
+            2014, 1, 2, 3, 4, 5, 500000)
+    assert compile_format('%d-%b-%Y') is None
+    assert compile_format('%H:%M') is None
+
+
+def test_datetime_column_inference():
+    values = ['9/29/2009 15:00', '9/29/2009 16:00', '10/1/2009 0:00']
+    column = DateTimeColumn(0, tzinfo=pacific)
+    column.prepare([[value] for value in values])
+    assert column._parse.format == '%m/%d/%Y %H:%M'
+    for value in values:
+        expected = pacific.localize(dateutil.parser.parse(value))
+        assert column([value]) == expected.astimezone(utc)
+
+    column = DateTimeColumn(0)
+    column.prepare([['2014-06-01T04:00:00Z'], ['2014-06-01T05:00:00-07:00']])
+    assert column(['2014-06-01T05:00:00-07:00']) == datetime.datetime(
+            2014, 6, 1, 12, tzinfo=utc)
+    assert column(['2014-06-01T04:00:00']) == datetime.datetime(
+            2014, 6, 1, 4, tzinfo=utc)
+
+
+def test_datetime_column_fallback():
+    column = DateTimeColumn(0, formats=['%Y-%m-%d %H:%M'], tzinfo=utc)
+    column.prepare([['2014-01-01 00:00']])
+    assert column(['Jan 2 2014 3:00']) == datetime.datetime(
+            2014, 1, 2, 3, tzinfo=utc)
+    assert isinstance(column(['garbage']), ParseError)
+    assert column(['  ']) is None
+
+
+def test_datetime_column_epoch():
+    column = DateTimeColumn(0, time_offset=60)
+    column.prepare([['1401595200'], ['1401596100']])
+    assert column(['1401595200']) == datetime.datetime(
+            2014, 6, 1, 4, 1, tzinfo=utc)
+
+
+def test_datetime_column_dst():
+    column = DateTimeColumn(0, tzinfo=pacific)
+    column.prepare([['2014-11-02 00:00']])
+    for hour in range(6):
+        for minute in [0, 30]:
+            value = '2014-11-02 {}:{:02}'.format(hour, minute)
+            naive = datetime.datetime(2014, 11, 2, hour, minute)
+            expected = pacific.localize(naive).astimezone(utc)
+            assert column([value]) == expected
+
+
+BLOCK_CSV = """time,float,bool,int,str
+2014-01-01 00:00,1.5,1,12,a
+2014-01-01 00:15,,off,0x1F,
+garbage,x,maybe,abc,b
+2014-01-01 00:45,250,true,,c
+2014-01-01 01:00,-7,f,2,d
+"""
+
+
+def _block_columns():
+    return [DateTimeColumn(0, tzinfo=utc), FloatColumn(1, maximum=100),
+            BooleanColumn(2), IntegerColumn(3, minimum=3), StringColumn(4)]
+
+
+def test_blocks_match_rows():
+    pytest.importorskip('numpy')
+    rows = list(ingest_file(io.StringIO(BLOCK_CSV), _block_columns()))
+    blocks = list(ingest_file_blocks(io.StringIO(BLOCK_CSV),
+                                     _block_columns(), block_size=3))
+    assert len(blocks) == 2
+    assert [line for block in blocks for line in block.line_nums] == [
+            row.line_num for row in rows]
+    expected_errors, got_errors = [], []
+    for row in rows:
+        time = row.columns[0]
+        errors = [col for col in row.columns if isinstance(col, IngestError)]
+        if isinstance(time, IngestError):
+            errors = [time]
+        expected_errors.extend(
+                (row.line_num, col.column_num, str(col)) for col in errors)
+    for block in blocks:
+        got_errors.extend((block.line_nums[error.row], error.column_num,
+                           error.message) for error in block.errors)
+    assert got_errors == expected_errors
+    for index in range(1, 5):
+        expected = [(row.columns[0], row.columns[index]) for row in rows
+                    if not isinstance(row.columns[0], IngestError) and
+                    not isinstance(row.columns[index], IngestError)]
+        got = []
+        for block in blocks:
+            got.extend(zip(*block.series(index)))
+        assert got == expected
+
+
+def test_resume_from_position():
+    rows = list(ingest_file(io.StringIO(BLOCK_CSV), _block_columns()))
+    last = rows[2]
+    resumed = list(ingest_file(io.StringIO(BLOCK_CSV), _block_columns(),
+                               position=last.position,
+                               line_num=last.line_num))
+    assert [(row.line_num, row.position, [str(col) for col in row.columns])
+            for row in resumed] == [
+           (row.line_num, row.position, [str(col) for col in row.columns])
+           for row in rows[3:]]
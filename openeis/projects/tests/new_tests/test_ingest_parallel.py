@@ -0,0 +1,111 @@
+import os
+import os.path
+
+import pytest
+
+from openeis.projects import models
+from openeis.projects.storage import parallel
+from openeis.projects.storage.ingest import ingest_files, iter_batches
+from openeis.projects.storage.parallel import ingest_files_parallel
+
+
+HEADERS = ['Date', 'Hillside OAT [F]', 'Main Meter [kW]', 'Boiler Gas [kBtu/hr]']
+
+DATAMAP = {
+    'version': 1,
+    'files': {
+        name: {
+            'signature': {'headers': HEADERS},
+            'timestamp': {'columns': [0]},
+        } for name in ['0', '1']
+    },
+    'sensors': {
+        'Test{}/WholeBuildingPower'.format(name): {
+            'column': 'Main Meter [kW]',
+            'unit': 'kilowatt',
+            'type': 'WholeBuildingPower',
+            'file': name,
+        } for name in ['0', '1']
+    },
+}
+
+
+def _files():
+    path = os.path.join(os.path.dirname(models.__file__),
+                        'fixtures', '1Month_hourly.csv')
+    return {name: {'file': open(path, 'rb'), 'path': path,
+                   'time_zone': 'UTC', 'time_offset': offset}
+            for name, offset in [('0', 0), ('1', 1800)]}
+
+
+def _collect(batches):
+    result = {}
+    for file, rows in batches:
+        result.setdefault(file.name, []).extend(
+            (row.line_num, row.position, [str(col) for col in row.columns])
+            for row in rows)
+    return result
+
+
+def test_parallel_matches_serial():
+    files = _files()
+    try:
+        serial = _collect(iter_batches(ingest_files(DATAMAP, files), 100))
+        parallel = _collect(ingest_files_parallel(DATAMAP, files, 2, 100))
+    finally:
+        for file in files.values():
+            file['file'].close()
+    assert sorted(parallel) == ['0', '1']
+    assert parallel == serial
+
+
+def test_parallel_ranges_match_serial():
+    files = _files()
+    try:
+        serial = _collect(iter_batches(ingest_files(DATAMAP, files), 100))
+        parallel = _collect(ingest_files_parallel(
+                DATAMAP, files, 3, 50, range_size=1000, prefetch=2))
+    finally:
+        for file in files.values():
+            file['file'].close()
+    assert parallel == serial
+
+
+def _exit_worker(*args):
+    os._exit(1)
+
+
+def test_parallel_worker_exit(monkeypatch):
+    monkeypatch.setattr(parallel, '_parse_range', _exit_worker)
+    files = _files()
+    try:
+        with pytest.raises(RuntimeError):
+            list(ingest_files_parallel(DATAMAP, files, 2, 100,
+                                       poll_interval=0.1))
+    finally:
+        for file in files.values():
+            file['file'].close()
+
+
+@pytest.mark.django_db
+def test_parallel_single_file_ingest(monkeypatch, project, datamap,
+                                     datafile_1month, dataset):
+    from openeis.projects import views
+    from openeis.projects.storage.bulkload import BulkLoader
+    calls = []
+    def ingest_ranges(*args, **kwargs):
+        calls.append(args)
+        return ingest_files_parallel(*args, range_size=4096, **kwargs)
+    monkeypatch.setattr(views, 'ingest_files_parallel', ingest_ranges)
+    ingest = models.SensorIngest.objects.create(
+            project=project, name='Parallel', map=datamap)
+    models.SensorIngestFile.objects.create(ingest=ingest, name='0',
+                                           file=datafile_1month)
+    loader = BulkLoader(ingest)
+    for _ in views.iter_ingest(ingest, loader, processes=2):
+        pass
+    loader.flush()
+    assert len(calls) == 1
+    for sensor in datamap.sensors.all():
+        assert (list(sensor.data.filter(ingest=ingest).timeseries()) ==
+                list(sensor.data.filter(ingest=dataset).timeseries()))
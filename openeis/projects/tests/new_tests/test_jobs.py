@@ -0,0 +1,86 @@
+import datetime
+
+from django.utils.timezone import utc
+import pytest
+
+from openeis.projects import jobs, models
+from openeis.projects.conf import settings as proj_settings
+
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def job_settings(monkeypatch):
+    monkeypatch.setattr(proj_settings, 'JOB_LOCAL_THREADS', 0)
+    monkeypatch.setattr(proj_settings, 'JOB_USER_LIMIT', 1)
+    monkeypatch.setitem(jobs._handlers, 'test',
+                        jobs.Handler(lambda job: None, True))
+
+
+def _job(owner, priority=0):
+    return models.Job.objects.create(kind='test', object_id=0,
+                                     owner=owner, priority=priority)
+
+
+def test_claim_order_and_user_limit(active_user, staff_user):
+    low = _job(active_user)
+    high = _job(active_user, priority=5)
+    other = _job(staff_user)
+    assert jobs.claim('w1').pk == high.pk
+    # active_user is at the limit, so only the other user's job remains.
+    assert jobs.claim('w2').pk == other.pk
+    assert jobs.claim('w3') is None
+    jobs.run(models.Job.objects.get(pk=high.pk))
+    assert models.Job.objects.get(pk=high.pk).status == models.Job.COMPLETE
+    assert jobs.claim('w3').pk == low.pk
+
+
+def test_concurrent_claims_honor_user_limit(active_user, monkeypatch):
+    first, second = _job(active_user), _job(active_user)
+    busy_owners = jobs._busy_owners
+    claims = []
+    def interleave(limit):
+        # Another worker claims a job after this one counted running jobs.
+        busy = busy_owners(limit)
+        if not claims:
+            claims.append(None)
+            claims[0] = jobs.claim('w2')
+        return busy
+    monkeypatch.setattr(jobs, '_busy_owners', interleave)
+    assert jobs.claim('w1') is None
+    assert claims[0].pk == first.pk
+    assert models.Job.objects.get(pk=second.pk).status == models.Job.QUEUED
+
+
+def test_failed_and_abandoned_jobs(active_user, monkeypatch):
+    def fail(job):
+        raise ValueError('bad job')
+    monkeypatch.setitem(jobs._handlers, 'fail', jobs.Handler(fail, False))
+    job = models.Job.objects.create(kind='fail', object_id=0,
+                                    owner=active_user)
+    jobs.run(jobs.claim('w1'))
+    job = models.Job.objects.get(pk=job.pk)
+    assert job.status == models.Job.FAILED
+    assert 'bad job' in job.progress['error']
+
+    job = _job(active_user)
+    jobs.claim('w1')
+    stale = datetime.datetime(2000, 1, 1, tzinfo=utc)
+    models.Job.objects.filter(pk=job.pk).update(heartbeat=stale)
+    assert jobs.requeue_abandoned() == 1
+    assert models.Job.objects.get(pk=job.pk).status == models.Job.QUEUED
+
+
+def test_active_job_recovers_abandoned(active_user):
+    job = _job(active_user)
+    jobs.claim('w1')
+    assert jobs.active_job('test', 0).status == models.Job.RUNNING
+    # The worker died, as when the server is restarted.
+    stale = datetime.datetime(2000, 1, 1, tzinfo=utc)
+    models.Job.objects.filter(pk=job.pk).update(heartbeat=stale)
+    assert jobs.active_job('test', 0).status == models.Job.QUEUED
+    models.Job.objects.filter(pk=job.pk).update(
+            status=models.Job.RUNNING, heartbeat=stale, kind='other')
+    assert jobs.active_job('other', 0) is None
+    assert models.Job.objects.get(pk=job.pk).status == models.Job.FAILED
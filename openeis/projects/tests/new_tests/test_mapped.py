@@ -0,0 +1,39 @@
+import pytest
+
+from openeis.projects.storage.mapped import MappedFile, mapped_file
+
+
+DATA = ''.join('line {}\n'.format(i) for i in range(100)).encode() + b'tail'
+
+
+@pytest.fixture
+def path(tmpdir):
+    path = tmpdir.join('data.csv')
+    path.write_binary(DATA)
+    return str(path)
+
+
+def test_line_index(path):
+    mapped = MappedFile(path, sample_interval=8, chunk_size=64)
+    assert mapped.line_count() == 101
+    assert mapped.line_offset(0) == 0
+    assert mapped.line_offset(42) == DATA.index(b'line 42\n')
+    assert mapped.line_offset(100) == DATA.index(b'tail')
+    assert mapped.line_offset(200) == len(DATA)
+    assert mapped.line_number(DATA.index(b'line 42\n')) == 42
+
+
+def test_open_and_split(path):
+    mapped = mapped_file(path)
+    assert mapped_file(path) is mapped
+    ranges = mapped.split(3)
+    assert len(ranges) == 3
+    assert b''.join(mapped.open(start, end).read()
+                    for start, end, _ in ranges) == DATA
+    for start, end, line_num in ranges:
+        assert DATA[:start].count(b'\n') == line_num
+        assert start == 0 or DATA[start - 1:start] == b'\n'
+    file = mapped.open(end=DATA.index(b'line 2\n'))
+    assert file.readline() == b'line 0\n'
+    assert file.read() == b'line 1\n'
+    assert file.read() == b''
@@ -0,0 +1,119 @@
+from datetime import datetime
+
+import pytest
+
+from openeis.projects.storage.db_input import DatabaseInput
+from openeis.projects.storage.merge import merge_rows, DROP, NONE, FILL
+
+
+def _hours(*pairs):
+    return [(datetime(2000, 1, 1, hour), value) for hour, value in pairs]
+
+
+OAT = {'OAT': [_hours((8, 50.0), (9, 51.0), (10, 52.0)),
+               _hours((8, 50.0), (9, 50.0), (10, 52.0))]}
+
+
+def _merge(*args, **kwargs):
+    return [(row['time'].hour, row['OAT'], row['Energy'])
+            for row in DatabaseInput.merge(*args, **kwargs)]
+
+
+def test_merge_complete():
+    energy = {'Energy': [_hours((8, 100), (9, 100), (10, 100))]}
+    expected = [(8, [50.0, 50.0], [100]), (9, [51.0, 50.0], [100]),
+                (10, [52.0, 52.0], [100])]
+    assert _merge(OAT, energy) == expected
+    assert _merge(OAT, energy, drop_partial_lines=False) == expected
+
+
+def test_merge_missing_middle():
+    energy = {'Energy': [_hours((8, 100), (10, 100))]}
+    assert _merge(OAT, energy) == [(8, [50.0, 50.0], [100]),
+                                   (10, [52.0, 52.0], [100])]
+    assert _merge(OAT, energy, drop_partial_lines=False) == [
+            (8, [50.0, 50.0], [100]), (9, [51.0, 50.0], [None]),
+            (10, [52.0, 52.0], [100])]
+
+
+def test_merge_missing_first_and_last():
+    energy = {'Energy': [_hours((9, 100), (10, 100))]}
+    assert _merge(OAT, energy) == [(9, [51.0, 50.0], [100]),
+                                   (10, [52.0, 52.0], [100])]
+    assert _merge(OAT, energy, drop_partial_lines=False)[0] == (
+            8, [50.0, 50.0], [None])
+    energy = {'Energy': [_hours((8, 100), (9, 100))]}
+    assert _merge(OAT, energy) == [(8, [50.0, 50.0], [100]),
+                                   (9, [51.0, 50.0], [100])]
+    assert _merge(OAT, energy, drop_partial_lines=False)[-1] == (
+            10, [52.0, 52.0], [None])
+
+
+def test_merge_fill_in_data():
+    energy = {'Energy': [_hours((9, 100), (10, 200))]}
+    rows = [(row['time'].hour, row['Energy'])
+            for row in DatabaseInput.merge_fill_in_data(OAT, energy)]
+    assert rows == [(8, [None]), (9, [100]), (10, [200])]
+
+
+def test_merge_as_tuples():
+    energy = {'Energy': [_hours((9, 100), (10, 200))]}
+    rows = list(DatabaseInput.merge(OAT, energy, as_tuples=True))
+    assert rows == [(datetime(2000, 1, 1, 9), 51.0, 50.0, 100),
+                    (datetime(2000, 1, 1, 10), 52.0, 52.0, 200)]
+
+
+def test_merge_rows_modes():
+    series = [[(1, 'a'), (2, 'b'), (4, 'c')], [(2, 'x'), (3, 'y'), (4, 'z')]]
+    rows = lambda mode: [(time, list(row))
+                         for time, row in merge_rows(series, mode)]
+    assert rows(DROP) == [(2, ['b', 'x']), (4, ['c', 'z'])]
+    assert rows(NONE) == [(1, ['a', None]), (2, ['b', 'x']),
+                          (3, [None, 'y']), (4, ['c', 'z'])]
+    assert rows(FILL) == [(1, ['a', None]), (2, ['b', 'x']),
+                          (3, ['b', 'y']), (4, ['c', 'z'])]
+    assert list(merge_rows([[(1, 'a')], []], NONE)) == []
+
+
+@pytest.mark.django_db
+def test_merge_groups_in_database(dataset):
+    topics = sorted(name for name, meta in dataset.map.map['sensors'].items()
+                    if 'type' in meta)
+    topic_map = {'first': topics[:1], 'rest': topics[1:]}
+    inp = DatabaseInput(dataset.map.id, topic_map, dataset.id)
+    for drop in (True, False):
+        expected = list(inp.merge_groups('first', 'rest',
+                                         drop_partial_lines=drop,
+                                         in_database=False))
+        assert expected
+        assert list(inp.merge_groups('first', 'rest',
+                                     drop_partial_lines=drop,
+                                     in_database=True)) == expected
+    assert (list(inp.merge_groups('first', 'rest', as_tuples=True)) ==
+            list(inp.merge_groups('first', 'rest', as_tuples=True,
+                                  in_database=False)))
+
+
+@pytest.mark.django_db
+def test_merge_groups_repeated_and_empty(dataset):
+    sensors = list(dataset.map.sensors.order_by('name'))
+    topic_map = {'first': [sensors[0].name],
+                 'rest': [sensor.name for sensor in sensors[1:]]}
+    inp = DatabaseInput(dataset.map.id, topic_map, dataset.id)
+    assert inp._merge_sensors(['first', 'rest']) is not None
+    # A repeated time is merged in Python rather than joined.
+    data = sensors[0].data.filter(ingest=dataset)
+    repeated = data.order_by('time')[3]
+    sensors[0].data_class.objects.create(
+            sensor=sensors[0], ingest=dataset, time=repeated.time, value=None)
+    assert inp._merge_sensors(['first', 'rest']) is None
+    for drop in (True, False):
+        assert (list(inp.merge_groups('first', 'rest',
+                                      drop_partial_lines=drop)) ==
+                list(inp.merge_groups('first', 'rest',
+                                      drop_partial_lines=drop,
+                                      in_database=False)))
+    # An empty series suppresses all rows.
+    data.delete()
+    assert list(inp.merge_groups('first', 'rest',
+                                 drop_partial_lines=False)) == []
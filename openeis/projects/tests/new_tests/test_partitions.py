@@ -0,0 +1,31 @@
+from django.db import connection
+import pytest
+
+from openeis.projects import models
+from .conftest import create_dataset
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_partitioned_dataset(project, datamap, dataset, datafile_1month):
+    partitioned_map = models.DataMap.objects.create(
+            project=project, name='Partitioned Data Map', map=datamap.map,
+            storage=models.DataMap.PARTITIONED)
+    partitioned = create_dataset('Partitioned', project, partitioned_map,
+                                 {'0': datafile_1month})
+    table = '{}_{}'.format(models.FloatSensorData._meta.db_table,
+                           partitioned.pk)
+    assert table in connection.introspection.table_names()
+    assert not models.FloatSensorData.objects.filter(
+            ingest=partitioned).exists()
+    for sensor in datamap.sensors.all():
+        other = partitioned_map.sensors.get(name=sensor.name)
+        assert (list(other.data.filter(ingest=partitioned).timeseries()) ==
+                list(sensor.data.filter(ingest=dataset).timeseries()))
+        # The only dataset of the map is used without an ingest filter.
+        assert (other.data.count() ==
+                sensor.data.filter(ingest=dataset).count())
+    assert list(partitioned.merge()) == list(dataset.merge())
+    partitioned.delete()
+    assert table not in connection.introspection.table_names()
@@ -0,0 +1,45 @@
+import pytest
+from rest_framework.test import APIClient
+
+from openeis.projects import jobs, models
+from openeis.projects.conf import settings as proj_settings
+from openeis.projects.storage.purge import purge_dataset, purge_project
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_purge_dataset(dataset):
+    pk = dataset.pk
+    total = sum(data_class.objects.filter(ingest_id=pk).count()
+                for data_class in models._sensor_data_classes())
+    assert total
+    reports = []
+    purge_dataset(dataset, lambda done, total: reports.append((done, total)),
+                  batch_size=100)
+    assert not models.SensorIngest.objects.filter(pk=pk).exists()
+    for data_class in models._sensor_data_classes():
+        assert not data_class.objects.filter(ingest_id=pk).exists()
+    assert not models.SensorRollup.objects.filter(ingest_id=pk).exists()
+    assert reports[-1][0] == reports[-1][1]
+    assert len(reports) > total // 100
+
+
+def test_purge_project(project, dataset):
+    purge_project(project)
+    assert not models.Project.objects.filter(pk=project.pk).exists()
+    assert not models.FloatSensorData.objects.filter(
+            ingest_id=dataset.pk).exists()
+
+
+def test_delete_dataset_api(monkeypatch, active_user, dataset):
+    monkeypatch.setattr(proj_settings, 'JOB_LOCAL_THREADS', 0)
+    client = APIClient()
+    client.force_authenticate(user=active_user)
+    url = '/api/datasets/{}'.format(dataset.pk)
+    response = client.delete(url)
+    assert response.status_code == 202
+    assert client.get(url).status_code == 404
+    assert client.get(url + '/status').data['status'] == 'queued'
+    jobs.run_pending('test')
+    assert not models.SensorIngest.objects.filter(pk=dataset.pk).exists()
@@ -0,0 +1,83 @@
+import datetime
+import itertools
+
+from django.db.models import Avg, Max, Sum
+from django.utils.timezone import utc
+import pytest
+
+from openeis.projects import models
+from openeis.projects.storage import rollup
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_aggregate_value():
+    summary = rollup.Summary()
+    for value in [1.0, None, 2.0, 6.0]:
+        summary.add(value)
+    assert (summary.rows, summary.count) == (4, 3)
+    assert rollup.aggregate_value('Avg', summary) == 3.0
+    assert rollup.aggregate_value('Min', summary) == 1.0
+    assert rollup.aggregate_value('Variance', summary) == pytest.approx(14 / 3)
+    assert rollup.aggregate_value('Variance', summary, True) == 7.0
+    assert rollup.aggregate_value('Sum', rollup.Summary()) is None
+    assert rollup.aggregate_value('Count', rollup.Summary()) == 0
+
+
+def test_rollup_timeseries(dataset):
+    assert models.SensorRollup.objects.filter(ingest=dataset).exists()
+    start = datetime.datetime(2012, 2, 2, tzinfo=utc)
+    end = datetime.datetime(2012, 2, 9, tzinfo=utc)
+    for sensor in dataset.map.sensors.filter(
+            data_type__in=[models.Sensor.FLOAT, models.Sensor.INTEGER]):
+        data = sensor.data.filter(ingest=dataset).exclude(value=None)
+        values = list(data.filter(time__gte=start, time__lt=end)
+                          .order_by('time').values_list('time', 'value'))
+        assert values
+        for kind, aggregate, func in [('hour', Avg, None), ('day', Max, max),
+                                      ('month', Sum, sum)]:
+            expected = []
+            for time, group in itertools.groupby(
+                    values, lambda pair: rollup.truncate(pair[0], kind)):
+                group = [value for _, value in group]
+                value = (func(group) if func else sum(group) / len(group))
+                expected.append((time, pytest.approx(value)))
+            series = data.filter(time__gte=start, time__lt=end).order_by(
+                    'time').timeseries(trunc_kind=kind, aggregate=aggregate)
+            assert isinstance(series, list)
+            assert series == expected
+        # Unaligned ranges are read from the sensor data.
+        series = data.filter(time__gte=start + datetime.timedelta(minutes=1))
+        assert not isinstance(
+                series.timeseries(trunc_kind='hour', aggregate=Avg), list)
+
+
+def test_trunc_date(dataset):
+    models.SensorRollup.objects.filter(ingest=dataset).delete()
+    sensor = dataset.map.sensors.filter(data_type=models.Sensor.FLOAT)[0]
+    data = sensor.data.filter(ingest=dataset).exclude(value=None)
+    values = list(data.order_by('time').values_list('time', 'value'))
+    for kind in ['hour', 'day', 'month', 'year']:
+        expected = [(time, pytest.approx(max(value for _, value in group)))
+                    for time, group in itertools.groupby(
+                        values, lambda pair: rollup.truncate(pair[0], kind))]
+        assert list(data.order_by('time').timeseries(
+                trunc_kind=kind, aggregate=Max)) == expected
+
+
+def test_trunc_date_minute_second(dataset):
+    sensor = dataset.map.sensors.filter(data_type=models.Sensor.FLOAT)[0]
+    start = datetime.datetime(2012, 3, 1, 12, 34, tzinfo=utc)
+    for offset, value in [(56.789, 1.0), (59.999, 2.0), (60, 3.0)]:
+        sensor.data_class.objects.create(
+                sensor=sensor, ingest=dataset, value=value,
+                time=start + datetime.timedelta(seconds=offset))
+    data = sensor.data.filter(ingest=dataset, time__gte=start).order_by('time')
+    minute = datetime.timedelta(minutes=1)
+    assert list(data.timeseries(trunc_kind='minute', aggregate=Max)) == [
+            (start, 2.0), (start + minute, 3.0)]
+    assert [time for time, _ in data.timeseries(
+            trunc_kind='second', aggregate=Max)] == [
+            start + datetime.timedelta(seconds=seconds)
+            for seconds in [56, 59, 60]]
@@ -0,0 +1,29 @@
+import io
+
+from django.core.management import call_command
+from django.db import connection
+import pytest
+
+
+pytestmark = pytest.mark.django_db
+
+# Model validation is skipped as other tests replace models in the cache.
+OPTIONS = {'skip_validation': True}
+
+
+def test_updatedb_is_idempotent():
+    call_command('updatedb', stdout=io.StringIO(), **OPTIONS)
+    out = io.StringIO()
+    call_command('updatedb', stdout=out, **OPTIONS)
+    assert out.getvalue() == ''
+
+
+def test_explainqueries_uses_index(dataset):
+    if connection.vendor != 'sqlite':
+        pytest.skip('plan summary checked on SQLite only')
+    out = io.StringIO()
+    call_command('explainqueries', str(dataset.pk), stdout=out, **OPTIONS)
+    lines = out.getvalue().splitlines()[1:]
+    assert len(lines) == 2 * dataset.map.sensors.count()
+    for line in lines:
+        assert line.endswith(': index, no sort')
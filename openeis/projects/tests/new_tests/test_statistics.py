@@ -0,0 +1,57 @@
+from django.db.models import Avg, Max, Min
+import pytest
+from rest_framework.test import APIClient
+
+from openeis.projects import models
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_dataset_statistics(active_user, dataset):
+    sensors = dataset.map.sensors.all()
+    assert dataset.statistics.count() == len(sensors)
+    for sensor in sensors:
+        stats = dataset.statistics.get(sensor=sensor)
+        data = sensor.data.filter(ingest=dataset)
+        assert stats.count + stats.null_count == data.count()
+        assert stats.count == data.exclude(value=None).count()
+        if stats.count:
+            values = data.exclude(value=None)
+            assert stats.first == values.earliest().time
+            assert stats.last == values.latest().time
+        if sensor.data_type == models.Sensor.FLOAT and stats.count:
+            assert stats.max == data.aggregate(value=Max('value'))['value']
+            assert stats.min == data.aggregate(value=Min('value'))['value']
+            assert stats.mean == pytest.approx(
+                    data.aggregate(value=Avg('value'))['value'])
+            assert stats.interval == 3600
+
+    client = APIClient()
+    client.force_authenticate(user=active_user)
+    response = client.get('/api/datasets/{}/statistics'.format(dataset.pk))
+    assert response.status_code == 200
+    assert ({item['sensor'] for item in response.data} ==
+            {sensor.name for sensor in sensors})
+
+
+def test_statistics_without_rollups(dataset):
+    expected = {stats.sensor_id: (stats.count, stats.null_count, stats.max)
+                for stats in dataset.statistics.all()}
+    dataset.rollups.all().delete()
+    dataset.update_statistics()
+    assert {stats.sensor_id: (stats.count, stats.null_count, stats.max)
+            for stats in dataset.statistics.all()} == expected
+
+
+def test_statistics_bounds_exclude_nulls(dataset):
+    sensor = dataset.map.sensors.filter(data_type=models.Sensor.FLOAT)[0]
+    data = sensor.data.filter(ingest=dataset)
+    first, last = data.earliest(), data.latest()
+    data.filter(pk__in=[first.pk, last.pk]).update(value=None)
+    dataset.rollups.all().delete()
+    dataset.update_statistics()
+    stats = dataset.statistics.get(sensor=sensor)
+    values = data.exclude(value=None)
+    assert stats.first == values.earliest().time > first.time
+    assert stats.last == values.latest().time < last.time
@@ -123,6 +123,10 @@ api_urls.append(url(r'version',
                     views.VersionViewSet.as_view({'get': 'list'}),
                     name='version'))
 
+api_urls.append(url(r'^database$',
+                    views.DatabaseViewSet.as_view({'get': 'list'}),
+                    name='database'))
+
 urlpatterns = patterns('openeis.projects.views',
     url(r'^api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     url(r'^api-docs/', include('rest_framework_swagger.urls')),
@@ -59,8 +59,8 @@ import datetime
 import itertools
 import json
 import logging
+import os
 import posixpath
-import threading
 import traceback
 
 import dateutil
@@ -69,7 +69,7 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.db import transaction
+from django.db import connections, transaction
 from django.db.models import Q
 from django.http import HttpResponseRedirect, HttpResponse, Http404
 from django.shortcuts import get_object_or_404
@@ -82,15 +82,20 @@ from rest_framework.reverse import reverse
 from rest_framework import exceptions as rest_exceptions
 from rest_framework.settings import api_settings
 
-from . import models, renderers, serializers, version
+from . import jobs, models, renderers, serializers, version
 from .models import INFO, WARNING, ERROR, CRITICAL
 from .protectedmedia import protected_media, ProtectedMediaResponse
 from .conf import settings as proj_settings
+from .storage.bulkload import BulkLoader
 from .storage.clone import CloneProject
-from .storage.ingest import ingest_files, iter_rows, IngestError
+from .storage.ingest import (ingest_files, iter_batches, iter_rows,
+                             IngestError, Block)
+from .storage.parallel import ingest_files_parallel
+from .storage.purge import purge_dataset, purge_project
 from .storage.sensormap import Schema as Schema
 from .storage.db_input import DatabaseInput
 from .storage.db_output import DatabaseOutput, DatabaseOutputZip
+from .storage.fileindex import csv_options
 from openeis.applications import get_algorithm_class
 from openeis.applications import _applicationDict as apps
 from openeis.filters.apply_filter import apply_filter_config
@@ -137,7 +142,23 @@ class ProjectViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         '''Only allow user to see projects they own.'''
         user = self.request.user
-        return user.projects.all()
+        if self.action == 'status':
+            return user.projects.all()
+        return user.projects.filter(removed=False)
+
+    def destroy(self, request, *args, **kwargs):
+        '''Hide the project and queue a job to delete it.'''
+        project = self.get_object()
+        project.removed = True
+        project.save(update_fields=['removed'])
+        jobs.submit(models.Job.DELETE_PROJECT, project, request.user)
+        return Response(status=status.HTTP_202_ACCEPTED)
+
+    @link()
+    def status(self, request, *args, **kwargs):
+        '''Report the progress of deleting the project.'''
+        project = self.get_object()
+        return Response(_deletion_status(models.Job.DELETE_PROJECT, project))
 
     @action(methods=['POST'],
             serializer_class=serializers.CreateFileSerializer,
@@ -150,6 +171,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
         try:
             if serializer.is_valid():
                 obj = serializer.save(force_insert=True)
+                jobs.submit(models.Job.INDEX, obj, request.user, priority=10)
                 serializer = serializers.FileSerializer(
                         instance=obj, context={'request': request})
                 return Response(serializer.data,
@@ -494,57 +516,108 @@ class DataMapViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-_ingest_processes = {}
+def iter_ingest(ingest, loader, files=None, processes=None):
+    '''Ingest into the common schema tables from the DataFiles.
+
+    Parsed values are added to loader, a BulkLoader instance, and a
+    progress tuple of (file_name, position, file_size, processed_bytes,
+    total_bytes, line_num) is yielded after each row. The caller is
+    responsible for flushing the loader. files may be given to override
+    the ingest's DataFiles using the format expected by ingest_files().
+    Otherwise, each file is parsed from the checkpoint recorded on its
+    SensorIngestFile, resuming an interrupted ingest.
 
-def iter_ingest(ingest):
-    '''Ingest into the common schema tables from the DataFiles.'''
+    If processes is not 1 and the files have paths, the files are parsed
+    concurrently by a pool of processes (see INGEST_PROCESSES setting).
+    Files are parsed in blocks of INGEST_BLOCK_SIZE rows, converting a
+    column at a time, when the setting is non-zero and NumPy is present.
+    In that case, progress is yielded once per block.
+    '''
     datamap = ingest.map.map
-    files = {f.name: {'file': f.file.file.file,
-                      'time_offset':f.file.time_offset,
-                      'time_zone': f.file.time_zone}
-             for f in ingest.files.all()}
+    if files is None:
+        files = {f.name: {'file': f.file.mapped().open(),
+                          'path': f.file.file.path,
+                          'time_offset':f.file.time_offset,
+                          'time_zone': f.file.time_zone,
+                          'position': f.position,
+                          'line_num': f.line_num}
+                 for f in ingest.files.all()}
+    files = dict(files)
+    if processes is None:
+        processes = proj_settings.INGEST_PROCESSES
+    block_size = proj_settings.INGEST_BLOCK_SIZE
     ingest_file = None
+    add_object = loader.add_object
     try:
-        ingested = list(ingest_files(datamap, files))
-        total_bytes = sum(file.size for file in ingested)
-        processed_bytes = 0.0
-        for file in ingested:
-            sensors = []
-            for i, name in enumerate(file.sensors):
-                if name is None:
-                    continue
-                sensor, created = models.Sensor.objects.get_or_create(
-                        map=ingest.map, name=name)
-                if created:
-                    sensor.data_type = file.types[i][0]
-                    sensor.save()
-                sensors.append((sensor, sensor.data_class))
-            ingest_file = ingest.files.get(name=file.name)
-            for row in file.rows:
+        if processes != 1 and all('path' in f for f in files.values()):
+            total_bytes = sum(os.path.getsize(f['path'])
+                              for f in files.values())
+            batches = ingest_files_parallel(datamap, files, processes,
+                                            block_size=block_size)
+        else:
+            ingested = list(ingest_files(datamap, files, block_size))
+            total_bytes = sum(file.size for file in ingested)
+            batches = iter_batches(ingested)
+        file_sensors = {}
+        positions = {name: f.get('position', 0) for name, f in files.items()}
+        for file, rows in batches:
+            try:
+                sensors, ingest_file = file_sensors[file.name]
+            except KeyError:
+                sensors = []
+                for i, name in enumerate(file.sensors):
+                    if name is None:
+                        continue
+                    sensor, created = models.Sensor.objects.get_or_create(
+                            map=ingest.map, name=name)
+                    if created:
+                        sensor.data_type = file.types[i][0]
+                        sensor.save()
+                    buf = loader.buffer(sensor)
+                    sensors.append((sensor.pk, buf.append, buf.extend))
+                ingest_file = ingest.files.filter(name=file.name).first()
+                file_sensors[file.name] = sensors, ingest_file
+            processed_bytes = sum(pos for name, pos in positions.items()
+                                  if name != file.name)
+            if isinstance(rows, Block):
+                for error in rows.errors:
+                    add_object(models.SensorIngestLog(
+                            dataset=ingest, file=ingest_file,
+                            row=rows.line_nums[error.row],
+                            column=error.column_num, level=models.ERROR,
+                            message=error.message))
+                for index, (sensor_id, _, extend) in enumerate(sensors, 1):
+                    extend(sensor_id, *rows.series(index))
+                position = rows.positions[-1]
+                positions[file.name] = position
+                yield (file.name, position, file.size,
+                       processed_bytes + position, total_bytes,
+                       rows.line_nums[-1])
+                continue
+            for row in rows:
                 time = row.columns[0]
-                objects = []
                 if isinstance(time, IngestError):
-                    obj = models.SensorIngestLog(
+                    add_object(models.SensorIngestLog(
                             dataset=ingest, file=ingest_file,
                             row=row.line_num, column=time.column_num,
                             level=models.ERROR,
-                            message=str(time))
-                    objects.append(obj)
+                            message=str(time)))
                 else:
-                    for (sensor, cls), column in zip(sensors, row.columns[1:]):
+                    for (sensor_id, append, _), column in zip(
+                            sensors, row.columns[1:]):
                         if isinstance(column, IngestError):
-                            obj = models.SensorIngestLog(
+                            add_object(models.SensorIngestLog(
                                     dataset=ingest, file=ingest_file,
-                                    row=row.line_num, column=column.column_num,
+                                    row=row.line_num,
+                                    column=column.column_num,
                                     level=models.ERROR,
-                                    message=str(column))
+                                    message=str(column)))
                         else:
-                            obj = cls(ingest=ingest, sensor=sensor, time=time,
-                                      value=column)
-                        objects.append(obj)
-                yield (objects, file.name, row.position, file.size,
-                       processed_bytes + row.position, total_bytes)
-            processed_bytes += file.size
+                            append(sensor_id, time, column)
+                yield (file.name, row.position, file.size,
+                       processed_bytes + row.position, total_bytes,
+                       row.line_num)
+            positions[file.name] = rows[-1].position
     except Exception:
         models.SensorIngestLog.objects.create(dataset=ingest, file=ingest_file,
                                       row=0, column=0,
@@ -554,49 +627,60 @@ def iter_ingest(ingest):
         raise
 
 
-def _update_ingest_progress(ingest_id, file_id, pos, size, processed, total):
-    _ingest_processes[ingest_id] = {
-        'id': ingest_id,
-        'status': 'processing',
+def _update_ingest_progress(job, file_id, pos, size, processed, total):
+    jobs.update_progress(job, {
         'percent': processed * 100.0 / total if total else 0.0,
         'current_file_percent': pos * 100.0 / size if size else 0.0,
         'current_file': file_id,
-    }
+    })
 
 
-def perform_ingestion(ingest, batch_size=999, report_interval=1000):
-    '''Iterate over ingested objects, saving in batches.
+def _commit_batch(ingest, loader, checkpoints):
+    '''Flush loader and save the file checkpoints in one transaction.
 
-    Once batch_size objects are cached, they are sorted according to
-    class type and inserted using bulk_create. Progress information
-    is updated every report_interval objects.
+    checkpoints maps file names to (position, line_num) 2-tuples for the
+    last row added to loader and is cleared once saved.
+    '''
+    with transaction.atomic():
+        loader.flush()
+        for name, (position, line_num) in checkpoints.items():
+            ingest.files.filter(name=name).update(
+                    position=position, line_num=line_num)
+    checkpoints.clear()
+
+
+def perform_ingestion(ingest, job=None, batch_size=50000,
+                      report_interval=1000):
+    '''Iterate over ingested rows, saving values in batches.
+
+    Parsed values are buffered by a BulkLoader and written directly to
+    the sensor data tables once batch_size values are waiting. Each
+    batch is committed together with the position reached in each file
+    so that an interrupted ingest may be resumed by calling this again.
+    If job is given, its progress is updated every report_interval bytes.
     '''
     beforeIteration = True
     try:
         last_file_id, next_pos = None, 0
-        keyfunc = lambda obj: obj.__class__.__name__
-        it = iter_ingest(ingest)
+        loader = BulkLoader(ingest)
+        checkpoints = {}
+        it = iter_ingest(ingest, loader)
         beforeIteration = False
-        while True:
-            batch = []
-            for objects, *args in it:
-                batch.extend(objects)
-                file_id, pos, *_ = args
-                if file_id != last_file_id:
-                    _update_ingest_progress(ingest.id, *args)
-                    last_file_id, next_pos = file_id, report_interval
-                elif pos >= next_pos:
-                    _update_ingest_progress(ingest.id, *args)
-                    next_pos = pos + report_interval
-                if len(batch) >= batch_size:
-                    break
-            if not batch:
-                break
-            batch.sort(key=keyfunc)
-            for class_name, group in itertools.groupby(batch, keyfunc):
-                objects = list(group)
-                cls = objects[0].__class__
-                cls.objects.bulk_create(objects)
+        for args in it:
+            file_id, pos, size, processed, total, line_num = args
+            if job is None:
+                pass
+            elif file_id != last_file_id:
+                _update_ingest_progress(job, *args[:5])
+                last_file_id, next_pos = file_id, pos + report_interval
+            elif pos >= next_pos:
+                _update_ingest_progress(job, *args[:5])
+                next_pos = pos + report_interval
+            checkpoints[file_id] = pos, line_num
+            if len(loader) >= batch_size:
+                _commit_batch(ingest, loader, checkpoints)
+        _commit_batch(ingest, loader, checkpoints)
+        ingest.update_statistics()
     except Exception as e:
         if beforeIteration:
             models.SensorIngestLog(level=CRITICAL, dataset=ingest, message='an unhandled exception occurred during sensor '
@@ -608,7 +692,11 @@ def perform_ingestion(ingest, batch_size=999, report_interval=1000):
     finally:
         ingest.end = datetime.datetime.utcnow().replace(tzinfo=utc)
         ingest.save()
-        _ingest_processes.pop(ingest.id, None)
+
+
+@jobs.register(models.Job.INGEST, resumable=True)
+def _run_ingest_job(job):
+    perform_ingestion(models.SensorIngest.objects.get(pk=job.object_id), job)
 
 
 class DataSetViewSet(viewsets.ModelViewSet):
@@ -620,9 +708,19 @@ class DataSetViewSet(viewsets.ModelViewSet):
     @link(permission_classes = (permissions.IsAuthenticated,))
     def status(self, request, *args, **kwargs):
         ingest = self.get_object()
-        try:
-            process = _ingest_processes[ingest.id]
-        except KeyError:
+        if ingest.removed:
+            return Response(_deletion_status(models.Job.DELETE_DATASET, ingest))
+        job = jobs.active_job(models.Job.INGEST, ingest.id)
+        if job:
+            process = {
+                'id': ingest.id,
+                'status': 'processing' if job.started else 'queued',
+                'percent': 0.0,
+                'current_file_percent': 0.0,
+                'current_file': None
+            }
+            process.update(job.progress or {})
+        else:
             process = {
                 'id': ingest.id,
                 'status': 'complete' if ingest.end else 'incomplete',
@@ -637,16 +735,46 @@ class DataSetViewSet(viewsets.ModelViewSet):
         '''Retrieves all errors that occured during an ingestion.'''
         ingest = self.get_object()
         errors = ingest.logs.all()
-        if not ingest.end and ingest.id not in _ingest_processes:
+        if (not ingest.end and
+                not jobs.active_job(models.Job.INGEST, ingest.id)):
             error = models.SensorIngestLog(dataset=ingest, level=models.CRITICAL,
                message='Processing ended prematurely. Not all files and/or '
-                       'records were read. Please delete this dataset and '
-                       'retry. If you continue to have problems, please '
-                       'contact technical support.')
+                       'records were read. Please resume the ingestion to '
+                       'continue from the last saved record. If you continue '
+                       'to have problems, please contact technical support.')
             errors = itertools.chain((error,), errors)
         serializer = serializers.SensorIngestLogSerializer(errors, many=True)
         return Response(serializer.data)
 
+    @link()
+    def statistics(self, request, *args, **kwargs):
+        '''Retrieve the summary statistics of each sensor.'''
+        ingest = self.get_object()
+        serializer = serializers.SensorStatisticsSerializer(
+                ingest.statistics.select_related('sensor'), many=True)
+        return Response(serializer.data)
+
+    @action(methods=['POST'])
+    def resume(self, request, *args, **kwargs):
+        '''Resume an interrupted ingestion from its last checkpoint.'''
+        ingest = self.get_object()
+        if ingest.end or jobs.active_job(models.Job.INGEST, ingest.id):
+            return Response({'detail': 'Ingestion is not interrupted.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        jobs.submit(models.Job.INGEST, ingest, request.user)
+        return self.status(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        '''Hide the dataset and queue a job to delete it.'''
+        ingest = self.get_object()
+        if jobs.active_job(models.Job.INGEST, ingest.id):
+            return Response({'detail': 'Dataset is being ingested.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        ingest.removed = True
+        ingest.save(update_fields=['removed'])
+        jobs.submit(models.Job.DELETE_DATASET, ingest, request.user)
+        return Response(status=status.HTTP_202_ACCEPTED)
+
     def pre_save(self, obj):
         '''Check the project owner against the current user.'''
         if obj.map.project.owner != self.request.user:
@@ -656,18 +784,18 @@ class DataSetViewSet(viewsets.ModelViewSet):
         obj.project = obj.map.project
 
     def post_save(self, obj, created):
-        '''After the SensorIngest object has been saved start a threaded
-        data ingestion process.
+        '''After the SensorIngest object has been saved queue a job to
+        ingest the data.
         '''
         if created:
-            _update_ingest_progress(obj.id, None, 0, 0, 0, 0)
-            threading.Thread(
-                    target=perform_ingestion, args=(obj,), daemon=True).start()
+            jobs.submit(models.Job.INGEST, obj, self.request.user)
 
     def get_queryset(self):
         '''Only allow users to see ingests they own.'''
         user = self.request.user
         queryset = models.SensorIngest.objects.filter(map__project__owner=user)
+        if self.action != 'status':
+            queryset = queryset.filter(removed=False)
         try:
             project = int(self.request.QUERY_PARAMS['project'])
         except KeyError:
@@ -731,15 +859,19 @@ class DataSetViewSet(viewsets.ModelViewSet):
         rows = dataset.merge(as_local_time= True)
         result = {'cols': [], 'rows': [], 'extra_rows': []}
         result['cols'] = rows.__next__()
+        # Columns which the statistics show to be empty are not searched.
+        counts = dict(dataset.statistics.values_list('sensor__name', 'count'))
         d = {}
         for col_index, col_value in enumerate(result['cols']):
-            d[col_index] = False
+            d[col_index] = col_index > 0 and counts.get(col_value) == 0
         for row in rows:
             if len(result['rows']) < count:
                    result['rows'].append(row)
                    for col_index,col_value in  enumerate(row):
                        if d[col_index] == False and col_value is not None:
                            d[col_index] = True
+            elif all(d.values()):
+                break
             else:
                 for col_index in d.keys():
                     if d[col_index] == False and row[col_index] is not None:
@@ -833,10 +965,13 @@ def preview_ingestion(datamap, input_files, count=15):
             for line in [i.send(time) for i in iterators]:
                 row.extend(line)
             yield row
-    inputs = {f.name: {'file': f.file.file.file,
-                       'time_zone': f.file.time_zone,
-                       'time_offset': f.file.time_offset}
-              for f in input_files}
+    inputs = {}
+    for f in input_files:
+        index = f.file.index()
+        inputs[f.name] = {'file': f.file.mapped().open(),
+                          'time_zone': f.file.time_zone,
+                          'time_offset': f.file.time_offset,
+                          'csv_options': index and csv_options(index)}
     headers, iterators, rows, extras = ['time'], [], [], []
     for file in ingest_files(datamap, inputs):
         headers.extend(file.sensors[1:])
@@ -955,7 +1090,68 @@ class VersionViewSet(viewsets.ViewSet):
         return Response(version.get_version_info())
 
 
-_analysis_processes = set()
+class DatabaseViewSet(viewsets.ViewSet):
+    permission_classes = (permissions.IsAdminUser,)
+
+    def list(self, request, *args, **kwargs):
+        '''Return the vendor and connection settings of each database.'''
+        result = {}
+        for alias in connections:
+            connection = connections[alias]
+            read_pragmas = getattr(connection, 'read_pragmas', None)
+            result[alias] = {
+                'vendor': connection.vendor,
+                'pragmas': read_pragmas() if read_pragmas else None,
+            }
+        return Response(result)
+
+
+def _deletion_status(kind, obj):
+    '''Return the progress of deleting obj in the form of ingest status.'''
+    job = jobs.active_job(kind, obj.id)
+    process = {
+        'id': obj.id,
+        'status': 'incomplete',
+        'percent': 0.0,
+    }
+    if job:
+        process['status'] = 'deleting' if job.started else 'queued'
+        process.update(job.progress or {})
+    return process
+
+
+def _deletion_progress(job):
+    '''Return a progress callback for purge_dataset() and purge_project().'''
+    def progress(done, total):
+        jobs.update_progress(job, {
+            'status': 'deleting',
+            'percent': done * 100.0 / total if total else 100.0,
+            'deleted': done,
+            'total': total,
+        })
+    return progress
+
+
+@jobs.register(models.Job.DELETE_DATASET, resumable=True)
+def _run_delete_dataset_job(job):
+    ingest = models.SensorIngest.objects.filter(pk=job.object_id).first()
+    if ingest:
+        purge_dataset(ingest, _deletion_progress(job))
+
+
+@jobs.register(models.Job.DELETE_PROJECT, resumable=True)
+def _run_delete_project_job(job):
+    project = models.Project.objects.filter(pk=job.object_id).first()
+    if project:
+        purge_project(project, _deletion_progress(job))
+
+
+@jobs.register(models.Job.INDEX, resumable=True)
+def _run_index_job(job):
+    datafile = models.DataFile.objects.filter(pk=job.object_id).first()
+    if datafile:
+        datafile.build_index(head_rows=proj_settings.FILE_HEAD_ROWS_MAX + 1)
+
 
 def _perform_analysis(analysis):
     '''Create thread for individual runs of an applicaton.'''
@@ -986,8 +1182,11 @@ def _perform_analysis(analysis):
     except Exception:
         # TODO: log errors
         print(traceback.format_exc())
-    finally:
-        _analysis_processes.discard(analysis.id)
+
+
+@jobs.register(models.Job.ANALYSIS)
+def _run_analysis_job(job):
+    _perform_analysis(models.Analysis.objects.get(pk=job.object_id))
 
 
 def _get_output_data(request, analysis):
@@ -1036,7 +1235,10 @@ class AnalysisViewSet(viewsets.ModelViewSet):
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
-        context['is_alive'] = lambda obj_id: obj_id in _analysis_processes
+        running = set(models.Job.objects.filter(
+                kind=models.Job.ANALYSIS, status=models.Job.RUNNING
+                ).values_list('object_id', flat=True))
+        context['is_alive'] = lambda obj_id: obj_id in running
         return context
 
     def pre_save(self, obj):
@@ -1055,9 +1257,7 @@ class AnalysisViewSet(viewsets.ModelViewSet):
     def post_save(self, obj, created):
         '''Start application run after Analysis object has been saved.'''
         if created:
-            _analysis_processes.add(obj.id)
-            threading.Thread(
-                    target=_perform_analysis, args=(obj,), daemon=True).start()
+            jobs.submit(models.Job.ANALYSIS, obj, self.request.user)
 
     def get_queryset(self):
         '''Only show user analyses associated with projects they own,
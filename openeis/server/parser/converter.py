@@ -55,12 +55,13 @@
 
 # Convert GreenButton xml to csv
 import csv
+import logging
 import os
 import sys
+import time
 from datetime import date
 from datetime import datetime
-from time import strftime
-from xml.etree.ElementTree import parse
+from xml.etree.ElementTree import Element
 from xml.etree.ElementTree import iterparse
 #
 # The difference is this:
@@ -69,66 +70,55 @@ from xml.etree.ElementTree import iterparse
 # import xml.etree.ElementTree as ET
 # note that there is also a C implementation, which is more efficient:
 # import xml.etree.cElementTree as ET
-    
+
+_log = logging.getLogger(__name__)
+
+# Set up a namespace for the various xml namespaces in the document.
+# The namespace is used in calls to find and findall, in order to avoid
+# prepending every search for a given node with that node's full xml namespace. 
+NAMESPACES = {
+    'Atom': "http://www.w3.org/2005/Atom", 
+    'espi': "http://naesb.org/espi", 
+    'xsi:schemaLocation': "http://naesb.org/espi espiDerived.xsd",
+    'xmlns:xsi': "http://www.w3.org/2001/XMLSchema-instance"
+}
+
+PREFIXES = {
+    '0': None,        #x10^0  ('0': 'None',)
+    '1': 'deca',    #=x10^1',
+    '2': 'hecto',   #=x100',
+    '-3': 'mili',   #=x10-3',
+    '3': 'kilo',    #=x1000',
+    '6': 'Mega',    #=x106',
+    '-6': 'micro',  #=x10-6',
+    '9': 'Giga'     #=x109'
+}
+
+
 def Convert(input_file, output_file, debug=False):
     """
-    input_file: a file object from which the xml data is parsed
+    input_file: a file name or seekable file object from which the xml data is parsed
     outpt_file: a file object to which the parsed rows will be written
     debug: boolean to switch print messages on/off
     returns: integer count of the number of data rows written (not including the header row)
+
+    The document is streamed with iterparse() rather than loaded whole,
+    so memory use does not grow with the size of the export. It is read
+    twice: once to find the ReadingType used in the header row and once
+    to write the IntervalReading rows as they are parsed.
     """
     
     # Note: 'lineterminator' defaults to '\r\n', which injects extra newlines into excel
     csv.register_dialect('csvdialect', delimiter=',', lineterminator='\n', quoting=csv.QUOTE_NONNUMERIC)
-    # writer = csv.writer(output_type, 'csvdialect')
-    
-    # Set up a namespace for the various xml namespaces in the document.
-    # The namespace is used in calls to find and findall, in order to avoid
-    # prepending every search for a given node with that node's full xml namespace. 
-    ns = {
-        'Atom': "http://www.w3.org/2005/Atom", 
-        'espi': "http://naesb.org/espi", 
-        'xsi:schemaLocation': "http://naesb.org/espi espiDerived.xsd",
-        'xmlns:xsi': "http://www.w3.org/2001/XMLSchema-instance"
-    }
-    
-    headerDict = {
-        'start' : 'Start Timestamp',
-        'duration' : 'Duration (Seconds)',
-        'end': 'End Timestamp',
-        'cost': "Cost",
-        'value' : 'Value',
-        'ReadingQuality': 'Reading Quality'
-    }
-    
-    prefixes = {
-        '0': None,        #x10^0  ('0': 'None',)
-        '1': 'deca',    #=x10^1',
-        '2': 'hecto',   #=x100',
-        '-3': 'mili',   #=x10-3',
-        '3': 'kilo',    #=x1000',
-        '6': 'Mega',    #=x106',
-        '-6': 'micro',  #=x10-6',
-        '9': 'Giga'     #=x109'
-    }
-    
-    # Parse the xml tree and get the timezone offset node.
-    # This timezone offset was necessary because I discovered that the converted time was
-    # different from the time in a comment field of each node. 
-    # I later found that the inherent offset plus the timezone offset was exactly 8 hours, 
-    # which meant the time is UTC - a much simpler conversion.
-    tree = parse(input_file)
-    root = tree.getroot()
-    tzOffset = get_child_node_text(root, ns, 'tzOffset')
-    powerOfTenMultiplier = get_child_node_text(root, ns, "powerOfTenMultiplier")
+
+    if isinstance(input_file, str):
+        with open(input_file, 'rb') as file:
+            return Convert(file, output_file, debug)
     
-    currencyType = get_currency_type(root, ns)
-    prefix = None
-    if powerOfTenMultiplier in prefixes:
-        prefix = prefixes[powerOfTenMultiplier]
-    uomType = get_uom_type(root, ns, prefix)
+    ns = NAMESPACES
+    started = time.time()
+    currencyType, uomType = read_reading_type(input_file, ns)
     
-    count = 0
     startDateHeader = 'Start Timestamp'
     durationHeader = 'Duration (Seconds)'
     endDateHeader = 'End Timestamp'
@@ -136,64 +126,90 @@ def Convert(input_file, output_file, debug=False):
     valueHeader = 'Value - {0}'.format(uomType)
     readingQualityHeader = 'Reading Quality'
     
-    headerDict['cost'] = '{0} - {1}'.format(headerDict['cost'], currencyType)
-    headerDict['value'] = '{0} - {1}'.format(headerDict['value'], uomType)
-    
-    headers_found = build_header_list(root, ns, debug)
-    headers_used = []
-    for header in headers_found:
-        if header in headerDict:
-            if debug: 
-                print("\'{0}\', \'{1}\'".format(header, headerDict[header]))
-            headers_used.append(headerDict[header])
-        else:
-            if debug: 
-                print(header)
-            headers_used.append(header)
-    
-    headers_used.append(endDateHeader)
-    
     header_row = [startDateHeader, durationHeader, endDateHeader, costHeader, valueHeader, readingQualityHeader]
     writer = csv.writer(output_file, 'csvdialect')
     writer.writerow(header_row)
-    # writer.writerow(headers_used)
     
+    count = 0
     rowswritten = 0   # Counts data rows written to csv (not including header)
-    # loop through every node in the input file
-    # for (event, node) in iterparse(input_file, events=['end']):
-    for node in root.iter():
-        node_tag = node.tag.split('}', 1)[1]
-        node_attributes = node.attrib
-        node_text = node.text
-        if node_tag == 'entry':
+    entries = 0       # Depth of entry nodes enclosing the current node
+    # Open nodes, so finished entries and readings can be detached from
+    # their parents and freed as soon as they have been processed.
+    parents = []
+    for (event, node) in iterparse(input_file, events=('start', 'end')):
+        node_tag = split_namespace(node.tag)
+        if event == 'start':
+            parents.append(node)
+            if node_tag == 'entry':
+                entries += 1
                 if debug: 
-                    print(node_tag, ', ', node_attributes, ', ', node_text)
-                
-                for child in node.iter(): 
-                    child_tag = split_namespace(child.tag)
-                    
-                    # Get the retail customer
-                    if child_tag == 'link' and 'rel' in child.attrib and child.attrib['rel'] == 'self':
-                        link_string = child.attrib['href']
-                        retailCustomer = link_string.split('/', 6)[1]  #This won't work if RetailCustomer isn't the first part of the string-need to improve the split
-                        # print("retailCustomer: \"{0}\"".format(retailCustomer))
-                        
-                    # Error, but do not break out of the loop or change retail customer
-                    elif child_tag == 'link' and 'rel' not in child.attrib:
-                        if debug: 
-                            print(child_tag, child.attrib, child.text)
-                    
-                    # Process row data for IntervalReading nodes
-                    elif child_tag == 'IntervalReading':
-                        process_row(child, writer, ns, debug)
-                        rowswritten += 1
-                        
-                count += 1
-                if debug: 
-                    print('\n\ncount: ',count)
+                    print(node_tag, ', ', node.attrib, ', ', node.text)
+            continue
+        parents.pop()
+        
+        # Process row data for IntervalReading nodes
+        if node_tag == 'IntervalReading' and entries:
+            process_row(node, writer, ns, debug)
+            rowswritten += 1
+            parents[-1].remove(node)
+        
+        elif node_tag == 'entry':
+            entries -= 1
+            count += 1
+            if parents:
+                parents[-1].remove(node)
+            if debug: 
+                print('\n\ncount: ',count)
     
-    print(strftime("%Y-%m-%d %H:%M:%S"))  #use this in the filename later
+    elapsed = time.time() - started
+    _log.info('converted %d GreenButton readings in %.2f seconds (%.0f rows/sec)',
+              rowswritten, elapsed, rowswritten / elapsed if elapsed else 0)
     return rowswritten
+
+
+def read_reading_type(input_file, ns):
+    """
+    Scan the document for the nodes describing the currency and unit of measure
+    The scan stops at the first currency, powerOfTenMultiplier and ReadingType nodes,
+    and the file is rewound afterwards so it can be parsed again
+    parameters: a seekable file object, list of namespaces
+    returns: a tuple of strings (currency type, uom type)
+    """
+    position = input_file.tell()
+    
+    # The lookup helpers search the descendants of the node they are given,
+    # so the nodes found are hung off of a placeholder root in document order.
+    root = Element('root')
+    wanted = set('{{{0}}}{1}'.format(ns['espi'], tag)
+                 for tag in ['currency', 'powerOfTenMultiplier', 'ReadingType'])
+    readingTypes = 0   # Depth of ReadingType nodes enclosing the current node
+    parents = []
+    for (event, node) in iterparse(input_file, events=('start', 'end')):
+        node_tag = split_namespace(node.tag)
+        if event == 'start':
+            parents.append(node)
+            if node_tag == 'ReadingType':
+                readingTypes += 1
+            continue
+        parents.pop()
+        if node_tag == 'ReadingType':
+            readingTypes -= 1
+        if node.tag in wanted:
+            wanted.remove(node.tag)
+            root.append(node)
+            if not wanted:
+                break
+        # Free processed nodes which are not part of a ReadingType
+        if parents and not readingTypes:
+            parents[-1].remove(node)
+    
+    input_file.seek(position)
+    
+    powerOfTenMultiplier = get_child_node_text(root, ns, "powerOfTenMultiplier")
+    prefix = None
+    if powerOfTenMultiplier in PREFIXES:
+        prefix = PREFIXES[powerOfTenMultiplier]
+    return get_currency_type(root, ns), get_uom_type(root, ns, prefix)
     
 
 def process_row(node, writer, ns, debug=False):